@@ -1,11 +1,21 @@
-from llm.llm_gateway import get_llm
+from llm.llm_gateway import get_llm, complete_json
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from metadata.schema_loader import load_schema
+from metadata.schema_model import get_schema_model
+from prompts import token_budget
 
 class ColumnPruneAgent:
+    # Shape of the JSON answer; see utils.sql_utils.validate_json
+    OUTPUT_SCHEMA = {
+        "type": "object",
+        "required": ["columns"],
+        "properties": {
+            "columns": {"type": "object", "additionalProperties": {"type": "array", "items": {"type": "string"}}},
+            "justification": {"type": "string"}
+        }
+    }
+
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm(chain="columns")
         self.prompt = ChatPromptTemplate.from_template(
             """You are an agent tasked with selecting the most relevant columns for a SQL query based on the user's intent.
             
@@ -33,22 +43,25 @@ class ColumnPruneAgent:
                 "justification": "Explanation of why these columns were selected"
             }}"""
         )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
     
-    def prune_columns(self, intent_data, tables_data):
+    def prune_columns(self, intent_data, tables_data, usage=None):
         """
         Select the most relevant columns from the identified tables based on the user's intent
         
         Args:
             intent_data (dict): The user's query intent as analyzed by the IntentAgent
             tables_data (dict): The relevant tables as identified by the TableAgent
+            usage (dict, optional): Receives the estimated prompt tokens under "columns"
             
         Returns:
-            dict: Selected columns for each table and justification
+            str: The LLM's answer, ending with its JSON column selection per table and justification
         """
         # Load schema for each relevant table
         relevant_tables = tables_data.get("relevant_tables", [])
-        table_schemas = "\n\n".join([f"{table}:\n{load_schema(table)}" for table in relevant_tables])
+        if token_budget.PROMPT_SCHEMA_STYLE == "compact":
+            table_schemas = get_schema_model().compact_schema(relevant_tables)
+        else:
+            table_schemas = get_schema_model().schema_text(relevant_tables, labeled=True)
         
         # Extract relevant data from intent
         intent_summary = intent_data.get("intent_summary", "")
@@ -57,12 +70,12 @@ class ColumnPruneAgent:
         aggregations = ", ".join(intent_data.get("aggregations", ["None specifically mentioned"]))
         
         # Get column recommendations from LLM
-        response = self.chain.invoke({
+        inputs = {
             "table_schemas": table_schemas,
             "intent_summary": intent_summary,
             "operation_type": operation_type,
             "conditions": conditions,
             "aggregations": aggregations
-        })
-        
-        return response
\ No newline at end of file
+        }
+        token_budget.record_usage(usage, "columns", self.prompt, inputs)
+        return complete_json(self.llm, self.prompt, inputs)
\ No newline at end of file
@@ -0,0 +1,82 @@
+from llm.llm_gateway import get_llm, complete_json
+from langchain.prompts import ChatPromptTemplate
+from metadata.schema_model import get_schema_model
+from prompts import token_budget
+
+class FusedSelectionAgent:
+    """
+    Does the work of IntentAgent, TableAgent and ColumnPruneAgent in a single
+    LLM call, for the "fast" pipeline mode.
+    """
+    # Shape of the JSON answer; see utils.sql_utils.validate_json
+    OUTPUT_SCHEMA = {
+        "type": "object",
+        "required": ["relevant_tables", "columns"],
+        "properties": {
+            "operation_type": {"type": "string"},
+            "intent_summary": {"type": "string"},
+            "conditions": {"type": "array", "items": {"type": "string"}},
+            "aggregations": {"type": "array", "items": {"type": "string"}},
+            "relevant_tables": {"type": "array", "items": {"type": "string"}},
+            "columns": {"type": "object", "additionalProperties": {"type": "array", "items": {"type": "string"}}},
+            "justification": {"type": "string"}
+        }
+    }
+
+    def __init__(self):
+        self.llm = get_llm(chain="fused")
+        self.prompt = ChatPromptTemplate.from_template(
+            """You are an agent tasked with planning a SQL query for a natural language request.
+            In one step, work out the user's intent, the tables needed and the columns needed.
+
+            Available table schemas:
+            {table_schemas}
+
+            User Query: {query}
+
+            Similar SQL examples for reference:
+            {sql_examples}
+
+            Rules:
+            1. Only use tables and columns that appear in the schemas above
+            2. Include columns needed for SELECT, JOIN, WHERE, GROUP BY and ORDER BY
+            3. Keep the column lists as small as the query allows
+
+            Return only JSON in this format:
+            {{
+                "operation_type": "SELECT|INSERT|UPDATE|DELETE",
+                "intent_summary": "Brief summary of what the user wants to do",
+                "conditions": ["condition1", "condition2"],
+                "aggregations": ["aggregation1", "aggregation2"],
+                "relevant_tables": ["table1", "table2"],
+                "columns": {{
+                    "table1": ["col1", "col2"],
+                    "table2": ["col1", "col3"]
+                }},
+                "justification": "Brief explanation of the table and column choices"
+            }}"""
+        )
+
+    def select(self, user_query, similar_sql, usage=None):
+        """
+        Analyze intent and select tables and columns in one LLM call
+
+        Args:
+            user_query (str): The natural language query from the user
+            similar_sql (list): Similar SQL examples for reference
+            usage (dict, optional): Receives the estimated prompt tokens under "fused"
+
+        Returns:
+            str: The LLM's answer, ending with its JSON intent fields plus relevant_tables and columns
+        """
+        model = get_schema_model()
+        if token_budget.PROMPT_SCHEMA_STYLE == "compact":
+            table_schemas = model.compact_schema(model.table_names)
+        else:
+            table_schemas = model.schema_text(model.table_names)
+
+        inputs = token_budget.fit_examples(
+            self.prompt, {"table_schemas": table_schemas, "query": user_query}, similar_sql, "fused"
+        )
+        token_budget.record_usage(usage, "fused", self.prompt, inputs)
+        return complete_json(self.llm, self.prompt, inputs)
@@ -1,11 +1,24 @@
-from llm.llm_gateway import get_llm
+from llm.llm_gateway import get_llm, complete_json
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
 from retriever.sql_retriever import retrieve_similar_sql
+from prompts.token_budget import fit_examples, record_usage
 
 class IntentAgent:
+    # Shape of the JSON answer; see utils.sql_utils.validate_json
+    OUTPUT_SCHEMA = {
+        "type": "object",
+        "required": ["intent_summary"],
+        "properties": {
+            "operation_type": {"type": "string"},
+            "possible_tables": {"type": "array", "items": {"type": "string"}},
+            "conditions": {"type": "array", "items": {"type": "string"}},
+            "aggregations": {"type": "array", "items": {"type": "string"}},
+            "intent_summary": {"type": "string"}
+        }
+    }
+
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm(chain="intent")
         self.prompt = ChatPromptTemplate.from_template(
             """You are an agent tasked with understanding the intent of a natural language query
             related to database operations. Based on the user's query, identify:
@@ -29,25 +42,25 @@ class IntentAgent:
                 "intent_summary": "Brief summary of what the user wants to do"
             }}"""
         )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
     
-    def analyze_intent(self, user_query):
+    def analyze_intent(self, user_query, similar_sql=None, usage=None):
         """
         Analyze the user's natural language query to understand the intent
         
         Args:
             user_query (str): The natural language query from the user
+            similar_sql (list, optional): Examples already retrieved for this request;
+                retrieved here when not given
+            usage (dict, optional): Receives the estimated prompt tokens under "intent"
             
         Returns:
-            dict: A structured representation of the user's intent
+            str: The LLM's answer, ending with its JSON intent analysis
         """
         # Retrieve similar SQL examples to help with intent recognition
-        similar_sql = retrieve_similar_sql(user_query)
-        sql_examples_text = "\n".join([f"Example {i+1}: {sql}" for i, sql in enumerate(similar_sql)])
-        
-        # Get intent analysis from LLM
-        response = self.chain.invoke({"query": user_query, "sql_examples": sql_examples_text})
+        if similar_sql is None:
+            similar_sql = retrieve_similar_sql(user_query)
+        inputs = fit_examples(self.prompt, {"query": user_query}, similar_sql, "intent")
+        record_usage(usage, "intent", self.prompt, inputs)
         
-        # The response is expected to be in JSON format as per the prompt
-        # In a production system, you'd want to add error handling here
-        return response
\ No newline at end of file
+        # Get intent analysis from LLM; the caller parses and validates the JSON
+        return complete_json(self.llm, self.prompt, inputs)
\ No newline at end of file
@@ -1,12 +1,21 @@
-from llm.llm_gateway import get_llm
+from llm.llm_gateway import get_llm, complete_json
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from metadata.schema_loader import load_schema
-from config import TABLES
+from metadata.schema_model import get_schema_model
+from prompts.token_budget import record_usage
 
 class TableAgent:
+    # Shape of the JSON answer; see utils.sql_utils.validate_json
+    OUTPUT_SCHEMA = {
+        "type": "object",
+        "required": ["relevant_tables"],
+        "properties": {
+            "relevant_tables": {"type": "array", "items": {"type": "string"}},
+            "justification": {"type": "string"}
+        }
+    }
+
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm(chain="tables")
         self.prompt = ChatPromptTemplate.from_template(
             """You are an agent tasked with identifying the most relevant tables for a SQL query based on a user's intent.
             
@@ -25,20 +34,21 @@ class TableAgent:
                 "justification": "Explanation of why these tables were selected"
             }}"""
         )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
     
-    def identify_tables(self, intent_data):
+    def identify_tables(self, intent_data, usage=None):
         """
         Identify the most relevant tables based on the user's intent
         
         Args:
             intent_data (dict): The user's query intent as analyzed by the IntentAgent
+            usage (dict, optional): Receives the estimated prompt tokens under "tables"
             
         Returns:
-            dict: A list of relevant tables and justification
+            str: The LLM's answer, ending with its JSON list of relevant tables and justification
         """
         # Get list of available tables
-        available_tables = "\n".join([f"- {table}: {load_schema(table).split('(')[0]}" for table in TABLES])
+        model = get_schema_model()
+        available_tables = model.table_listing(model.table_names)
         
         # Extract relevant data from intent
         intent_summary = intent_data.get("intent_summary", "")
@@ -48,10 +58,10 @@ class TableAgent:
         possible_tables_str = ", ".join(possible_tables) if possible_tables else "None specifically mentioned"
         
         # Get table recommendations from LLM
-        response = self.chain.invoke({
+        inputs = {
             "available_tables": available_tables,
             "intent_summary": intent_summary,
             "possible_tables": possible_tables_str
-        })
-        
-        return response
\ No newline at end of file
+        }
+        record_usage(usage, "tables", self.prompt, inputs)
+        return complete_json(self.llm, self.prompt, inputs)
\ No newline at end of file
@@ -1,20 +1,30 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Literal
 import json
 import logging
+import time
 import traceback
 
-# Import our agents
-from agents.intent_agent import IntentAgent
-from agents.table_agent import TableAgent
-from agents.column_prune_agent import ColumnPruneAgent
-from prompts.generate_prompts import QueryPromptGenerator
-from retriever.sql_retriever import retrieve_similar_sql
-from utils.sql_utils import extract_json_from_llm_response, format_sql_query, log_query
-from db.db_pool import init_db_pool, get_connection
-from config import TABLES
+from pipeline.sql_pipeline import run_pipeline, stream_pipeline
+from pipeline.explanations import get_explanation
+from pipeline.batch import run_batch, BATCH_MAX_QUERIES, BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY
+from db.db_pool import (
+    init_db_pool, init_async_pool, start_health_checks, close_pools, pool_stats, PoolExhaustedError
+)
+from db.sql_executor import (
+    open_stream, iter_ndjson, fetch_results, check_format, check_statement, resolve_page,
+    UnsupportedFormatError, UnsupportedStatementError, QueryTimeoutError, STREAM_MAX_ROWS
+)
+from db.cost_guard import QueryTooExpensiveError, COST_GUARD_MODES, COST_GUARD_LIMIT_ROWS
+from cache.result_cache import get_result_cache
+from llm.llm_gateway import get_response_cache
+from retriever.sql_retriever import init_retriever
+from metadata.schema_loader import init_schema, SCHEMA_MAP
+from metadata.schema_model import get_schema_model
+from utils import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,15 +33,50 @@ logger = logging.getLogger(__name__)
 # Initialize FastAPI app
 app = FastAPI(title="QueryGPT API", description="Natural language to SQL query API")
 
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests served", ["method", "path", "status"])
+HTTP_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time to response headers (streamed bodies excluded)", ["method", "path"]
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so /explanations/{explanation_id} is one series
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, path=path, status=status)
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path)
+
 # Request model
 class QueryRequest(BaseModel):
     query: str
     debug: Optional[bool] = False
+    # none: no explanation; inline: explain before responding;
+    # deferred: respond with explanation_id, poll /explanations/{id}
+    # (treated as none while EXPLANATION_MAX_PENDING are queued)
+    explain: Literal["none", "inline", "deferred"] = "inline"
+    # fast: one fused selection call; accurate: separate agents.
+    # Defaults to pipeline.sql_pipeline.PIPELINE_MODE
+    mode: Optional[Literal["fast", "accurate"]] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    concurrency: Optional[int] = BATCH_DEFAULT_CONCURRENCY
+    debug: Optional[bool] = False
+    explain: Literal["none", "inline", "deferred"] = "inline"
+    mode: Optional[Literal["fast", "accurate"]] = None
 
 # Response model
 class QueryResponse(BaseModel):
     sql: str
-    explanation: str
+    explanation: Optional[str] = None
+    explanation_id: Optional[str] = None
     debug_info: Optional[Dict[str, Any]] = None
 
 # Simple error response model
@@ -41,45 +86,37 @@ class ErrorResponse(BaseModel):
 
 @app.on_event("startup")
 async def startup():
-    """Initialize database pool on app startup"""
+    """Initialize database pool, schema metadata and vector retriever on app startup"""
     logger.info("Initializing database connection pool...")
     try:
         init_db_pool()
-        logger.info("Database connection pool initialized")
+        init_async_pool()
+        start_health_checks()
+        logger.info("Database connection pools initialized")
     except Exception as e:
         logger.error(f"Failed to initialize database pool: {str(e)}")
-        # App will continue but DB operations will fail
-
-# Initialize agents lazily when needed to prevent startup failures
-intent_agent = None
-table_agent = None
-column_prune_agent = None
-query_generator = None
-
-def get_intent_agent():
-    global intent_agent
-    if intent_agent is None:
-        intent_agent = IntentAgent()
-    return intent_agent
-
-def get_table_agent():
-    global table_agent
-    if table_agent is None:
-        table_agent = TableAgent()
-    return table_agent
-
-def get_column_prune_agent():
-    global column_prune_agent
-    if column_prune_agent is None:
-        column_prune_agent = ColumnPruneAgent()
-    return column_prune_agent
-
-def get_query_generator():
-    global query_generator
-    if query_generator is None:
-        query_generator = QueryPromptGenerator()
-    return query_generator
-import time
+        # App will continue but DB operations will fail; the schema still
+        # loads from the snapshot and retrieval uses the built-in examples
+
+    logger.info("Loading schema metadata...")
+    try:
+        await run_in_threadpool(init_schema)
+        logger.info(f"Schema metadata loaded for {len(SCHEMA_MAP)} tables")
+    except Exception as e:
+        logger.error(f"Failed to load schema metadata: {str(e)}")
+
+    logger.info("Initializing vector retriever...")
+    try:
+        init_retriever()
+        logger.info("Vector retriever initialized")
+    except Exception as e:
+        logger.error(f"Failed to initialize vector retriever: {str(e)}")
+        # Retrieval falls back to the built-in examples until it can be built
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the database connection pools"""
+    await close_pools()
 
 @app.post("/generate_sql", response_model=QueryResponse, responses={500: {"model": ErrorResponse}})
 async def generate_sql(request: QueryRequest):
@@ -87,119 +124,16 @@ async def generate_sql(request: QueryRequest):
     Generate SQL from natural language query
     """
     try:
-        start_time = time.time()
-        user_query = request.query
-        debug_mode = request.debug
-        debug_info = {}
-
-        print("Step 1: Analyzing query intent")
-        step_start = time.time()
-        intent_agent = get_intent_agent()
-        intent_response = intent_agent.analyze_intent(user_query)
-        intent_data = extract_json_from_llm_response(intent_response)
-        if intent_data is None:
-            logger.warning("Failed to parse intent response JSON, using fallback")
-            intent_data = {
-                "operation_type": "SELECT",
-                "possible_tables": [],
-                "conditions": [],
-                "aggregations": [],
-                "intent_summary": user_query
-            }
-        print(f"Step 1 completed in {time.time() - step_start:.2f} seconds")
-
-        if debug_mode:
-            debug_info["intent_analysis"] = intent_data
-
-        logger.info("Step 2: Identifying relevant tables")
-        step_start = time.time()
-        table_agent = get_table_agent()
-        tables_response = table_agent.identify_tables(intent_data)
-        tables_data = extract_json_from_llm_response(tables_response)
-        if tables_data is None:
-            logger.warning("Failed to parse tables response JSON, using fallback")
-            tables_data = {
-                "relevant_tables": TABLES[:2],
-                "justification": "Fallback selection due to parsing error"
-            }
-        print(f"Step 2 completed in {time.time() - step_start:.2f} seconds")
-
-        if debug_mode:
-            debug_info["table_selection"] = tables_data
-
-        print("Step 3: Selecting relevant columns")
-        step_start = time.time()
-        column_agent = get_column_prune_agent()
-        columns_response = column_agent.prune_columns(intent_data, tables_data)
-        columns_data = extract_json_from_llm_response(columns_response)
-        if columns_data is None:
-            logger.warning("Failed to parse columns response JSON, using fallback")
-            columns_data = {
-                "columns": {table: ["*"] for table in tables_data.get("relevant_tables", TABLES[:2])},
-                "justification": "Fallback selection due to parsing error"
-            }
-        print(f"Step 3 completed in {time.time() - step_start:.2f} seconds")
-
-        if debug_mode:
-            debug_info["column_selection"] = columns_data
-
-        print("Step 4: Retrieving similar SQL examples")
-        step_start = time.time()
-        try:
-            similar_sql = retrieve_similar_sql(user_query)
-        except Exception as e:
-            logger.error(f"Error retrieving similar SQL: {str(e)}")
-            similar_sql = []
-        print(f"Step 4 completed in {time.time() - step_start:.2f} seconds")
-
-        if debug_mode:
-            debug_info["similar_sql"] = similar_sql
-
-        print("Step 5: Generating SQL query")
-        step_start = time.time()
-        query_gen = get_query_generator()
-        prompt_data = query_gen.generate_sql_prompt(
-            user_query, intent_data, tables_data, columns_data, similar_sql
+        result = await run_pipeline(
+            request.query, debug_mode=request.debug, explain=request.explain, mode=request.mode
         )
-        sql_query = query_gen.generate_sql(prompt_data)
-        if isinstance(sql_query, dict):
-            sql_query = sql_query.get("text", "")
-            if not sql_query:
-                raise ValueError("SQL query not found in the response dictionary")
-        if not isinstance(sql_query, str):
-            raise TypeError(f"Expected a string, got {type(sql_query).__name__} instead.")
-        print(f"Step 5 completed in {time.time() - step_start:.2f} seconds")
-
-        print("Step 6: Formatting SQL query")
-        step_start = time.time()
-        formatted_sql = format_sql_query(sql_query)
-        print(f"Step 6 completed in {time.time() - step_start:.2f} seconds")
-
-        print("Step 7: Generating explanation")
-        step_start = time.time()
-        try:
-            explanation = query_gen.generate_explanation(user_query, formatted_sql)
-            if isinstance(explanation, dict):
-                explanation = explanation.get("text", "")
-                if not explanation:
-                    raise ValueError("Explanation text not found in the response dictionary")
-            if not isinstance(explanation, str):
-                raise TypeError(f"Expected a string for explanation, got {type(explanation).__name__} instead.")
-        except Exception as e:
-            logger.error(f"Error generating explanation: {str(e)}")
-            explanation = "An explanation could not be generated for this query."
-        print(f"Step 7 completed in {time.time() - step_start:.2f} seconds")
-
-        print(f"Total time taken: {time.time() - start_time:.2f} seconds")
-
-        # Log the query for auditing
-        log_query(user_query, formatted_sql)
 
         # Return the response
         return QueryResponse(
-            sql=formatted_sql,
-            explanation=explanation,
-            debug_info=debug_info if debug_mode else None
+            sql=result["sql"],
+            explanation=result["explanation"],
+            explanation_id=result["explanation_id"],
+            debug_info=result["debug_info"]
         )
 
     except Exception as e:
@@ -210,51 +144,179 @@ async def generate_sql(request: QueryRequest):
             content={"error": "Error generating SQL", "details": str(e)}
         )
 
-from datetime import datetime
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/generate_sql/stream")
+async def generate_sql_stream(request: QueryRequest):
+    """
+    Generate SQL from natural language query, streamed as Server-Sent Events.
+
+    Stage results (intent, tables, columns, examples) are sent as each
+    finishes, then the SQL and explanation token by token (sql_token /
+    explanation_token) followed by the complete sql / explanation, and
+    finally done or error.
+    """
+    async def events():
+        async for event, data in stream_pipeline(
+            request.query, debug_mode=request.debug, explain=request.explain, mode=request.mode
+        ):
+            yield _sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate_sql/batch")
+async def generate_sql_batch(request: BatchQueryRequest):
+    """
+    Generate SQL for many natural language queries at once.
+
+    Results are streamed back as newline-delimited JSON in completion order,
+    one object per input query with its "index"; failed items carry "error"
+    instead of "sql". Duplicate questions are answered once ("duplicate_of"
+    points at the item that was actually run).
+    """
+    if not request.queries:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "At least one query is required"}
+        )
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Too many queries", "details": f"At most {BATCH_MAX_QUERIES} per batch"}
+        )
+    concurrency = max(1, min(request.concurrency or BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+    async def items():
+        async for item in run_batch(
+            request.queries, concurrency=concurrency, explain=request.explain,
+            debug_mode=request.debug, mode=request.mode
+        ):
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(items(), media_type="application/x-ndjson")
+
+@app.get("/explanations/{explanation_id}")
+async def read_explanation(explanation_id: str):
+    """
+    Poll a deferred explanation: status is pending, done or failed
+    """
+    entry = get_explanation(explanation_id)
+    if entry is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Explanation not found", "details": "Unknown or expired explanation id"}
+        )
+    return {"id": explanation_id, "status": entry["status"], "explanation": entry["explanation"]}
 
 @app.post("/execute_sql")
 async def execute_sql(request: Request):
     """
-    Execute a SQL query and return the results
+    Execute a SQL query and return the results.
+
+    With "stream": true the rows are sent as newline-delimited JSON while
+    they are fetched, instead of being collected into one JSON body.
+    "format" selects the payload shape: "rows" (default), "columnar" or
+    "arrow" (see db.sql_executor.RESULT_FORMATS).
+
+    Buffered responses return at most EXECUTE_MAX_ROWS rows; pass
+    "page_size" and the returned "next_page_token" as "page_token" to page
+    through larger results. "truncated" says whether more rows remain.
+
+    "binds" supplies bind values for the SQL. Buffered results are cached by
+    SQL fingerprint + binds (see cache/result_cache.py); "cache": false
+    bypasses the cache.
+
+    Queries are checked against their estimated plan first (see
+    db/cost_guard.py); "cost_guard" overrides the configured mode for one
+    request. Warned or limited queries carry an X-Cost-Guard header; rejected
+    ones get a 422 with the estimate, and queries past the call timeout a 504.
     """
     try:
         data = await request.json()
         sql_query = data.get("sql")
+        stream = bool(data.get("stream", False))
+        result_format = data.get("format", "rows")
+        page_size = data.get("page_size")
+        page_token = data.get("page_token")
+        binds = data.get("binds") or {}
+        use_cache = bool(data.get("cache", True))
+        guard_mode = data.get("cost_guard")
         
         if not sql_query:
             return JSONResponse(
                 status_code=400,
                 content={"error": "SQL query is required"}
             )
+
+        try:
+            check_format(result_format, stream)
+            if not isinstance(binds, dict):
+                raise TypeError("binds must be an object of name -> value")
+            if guard_mode is not None and guard_mode not in COST_GUARD_MODES:
+                raise ValueError(f"cost_guard must be one of: {', '.join(COST_GUARD_MODES)}")
+            check_statement(sql_query)
+            if not stream:
+                resolve_page(sql_query, page_size, page_token)
+        except UnsupportedFormatError as e:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Unsupported format", "details": str(e)}
+            )
+        except UnsupportedStatementError as e:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Unsupported statement", "details": str(e)}
+            )
+        except (TypeError, ValueError) as e:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Invalid request parameters", "details": str(e)}
+            )
         
         try:
-            # Get a database connection
-            connection = get_connection()
-            cursor = connection.cursor()
-            
-            try:
-                # Execute the query
-                cursor.execute(sql_query)
-                columns = [col[0] for col in cursor.description]
-                rows = cursor.fetchall()
-                
-                # Convert rows to list of dicts
-                results = []
-                for row in rows:
-                    result = {}
-                    for i, col in enumerate(columns):
-                        value = row[i]
-                        # Convert datetime objects to strings
-                        if isinstance(value, datetime):
-                            value = value.isoformat()
-                        result[col] = value
-                    results.append(result)
-                
-                return JSONResponse(content={"results": results})
-                
-            finally:
-                cursor.close()
-                connection.close()
+            if stream:
+                # Execute eagerly so SQL errors still come back as a 500 body
+                connection, cursor, columns, assessment = await open_stream(
+                    sql_query, result_format, binds, guard_mode
+                )
+                headers = {"X-Columns": ",".join(columns), "X-Row-Limit": str(STREAM_MAX_ROWS)}
+                if assessment is not None and assessment.action != "allow":
+                    headers["X-Cost-Guard"] = assessment.header()
+                    if assessment.action == "limit":
+                        headers["X-Row-Limit"] = str(min(STREAM_MAX_ROWS, COST_GUARD_LIMIT_ROWS))
+                return StreamingResponse(
+                    iter_ndjson(connection, cursor, columns, result_format),
+                    media_type="application/x-ndjson",
+                    headers=headers
+                )
+
+            body, media_type, headers = await fetch_results(
+                sql_query, result_format, page_size, page_token, binds, use_cache, guard_mode
+            )
+            return Response(content=body, media_type=media_type, headers=headers)
+        except QueryTooExpensiveError as e:
+            return JSONResponse(
+                status_code=422,
+                content={"error": "Query too expensive", "details": str(e), "plan": e.assessment.to_dict()}
+            )
+        except QueryTimeoutError as e:
+            logger.warning(f"Query timed out: {str(e)}")
+            return JSONResponse(
+                status_code=504,
+                content={"error": "Query timed out", "details": str(e)}
+            )
+        except PoolExhaustedError as e:
+            logger.warning(f"Database pool exhausted: {str(e)}")
+            return JSONResponse(
+                status_code=503,
+                content={"error": "Database busy", "details": str(e)},
+                headers={"Retry-After": "1"}
+            )
         except Exception as db_error:
             logger.error(f"Database error: {str(db_error)}")
             return JSONResponse(
@@ -269,12 +331,85 @@ async def execute_sql(request: Request):
             content={"error": "Error executing SQL", "details": str(e)}
         )
 
+@app.post("/execute_sql/cache/invalidate")
+async def invalidate_result_cache(request: Request):
+    """
+    Drop cached /execute_sql results that read the given tables, or all
+    cached results when no tables are given
+    """
+    try:
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Invalid request body", "details": str(e)}
+            )
+        tables = data.get("tables") or []
+        if not isinstance(tables, list) or not all(isinstance(table, str) for table in tables):
+            return JSONResponse(
+                status_code=400,
+                content={"error": "tables must be a list of table names"}
+            )
+
+        known = set(get_schema_model().table_names)
+        unknown = [table for table in tables if table.upper() not in known]
+        if unknown:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Unknown tables", "details": ", ".join(unknown)}
+            )
+
+        cache = get_result_cache()
+        removed = cache.invalidate_tables(tables) if tables else cache.clear()
+        return {"invalidated": removed, "cache": cache.stats()}
+    except Exception as e:
+        logger.error(f"Error invalidating the result cache: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Error invalidating the result cache", "details": str(e)}
+        )
+
+@app.get("/llm/cache/stats")
+async def get_llm_cache_stats():
+    """
+    Entries and per-chain hits/misses of the LLM response cache
+    """
+    return get_response_cache().stats()
+
+@app.post("/llm/cache/clear")
+async def clear_llm_cache():
+    """
+    Drop every cached LLM response, e.g. after the model behind a model id
+    was updated
+    """
+    cache = get_response_cache()
+    return {"cleared": cache.clear(), "cache": cache.stats()}
+
+@app.get("/pool/stats")
+async def get_pool_stats():
+    """
+    Size, busy/open connections, acquire waits and timeouts, and the last
+    health check of each database connection pool
+    """
+    return pool_stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Pipeline stage, LLM, vector search, DB pool, cache and HTTP metrics in
+    the Prometheus text format
+    """
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/tables")
 async def list_tables():
     """
     List available tables in the system
     """
-    return {"tables": TABLES}
+    return {"tables": get_schema_model().table_names}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,64 @@
+"""
+Helpers shared by the benchmark scripts: latency summaries and the JSON
+report envelope.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"runs": 0}
+    return {
+        "runs": len(latencies),
+        "mean": statistics.mean(latencies),
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata():
+    """What a result was measured on, so reports from two releases can be compared."""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_report(report, path=None):
+    """Write a JSON report to path, or to stdout when no path is given."""
+    output = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
@@ -0,0 +1,118 @@
+"""
+Compare the "fast" and "accurate" pipeline modes on the same questions.
+
+For every question both modes are run (semantic cache off, no explanation)
+and the script reports per-mode latency plus how closely the fast mode
+agrees with the accurate one: table and column overlap (Jaccard) and
+whether the generated SQL has the same normalized fingerprint.
+
+Usage:
+    python benchmarks/compare_pipeline_modes.py [--questions FILE] [--repeat N] [--output FILE]
+
+FILE holds one question per line. Results are written as JSON.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline.sql_pipeline as sql_pipeline
+from benchmarks.common import latency_summary, run_metadata, write_report
+from utils.sql_utils import normalize_sql
+
+DEFAULT_QUESTIONS = [
+    "Show me all purchase orders created in the last month with total amount greater than 10000",
+    "List the top 10 suppliers by total ordered amount",
+    "How many purchase requisitions are still pending approval?",
+    "Show invoice amounts for purchase orders from supplier ACME",
+    "Which PO lines have a received quantity lower than the ordered quantity?",
+]
+
+
+def _jaccard(a, b):
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _selection(result):
+    debug_info = result["debug_info"]
+    tables = [t.upper() for t in debug_info.get("table_selection", {}).get("relevant_tables", [])]
+    columns = [
+        f"{table.upper()}.{column.upper()}"
+        for table, cols in (debug_info.get("column_selection", {}).get("columns") or {}).items()
+        for column in cols
+    ]
+    return tables, columns
+
+
+async def _run_once(question, mode):
+    start = time.perf_counter()
+    result = await sql_pipeline.run_pipeline(question, debug_mode=True, explain="none", mode=mode)
+    return time.perf_counter() - start, result
+
+
+async def compare(questions, repeat=1):
+    latencies = {mode: [] for mode in sql_pipeline.PIPELINE_MODES}
+    per_question = []
+
+    for question in questions:
+        results = {}
+        for _ in range(repeat):
+            for mode in sql_pipeline.PIPELINE_MODES:
+                elapsed, results[mode] = await _run_once(question, mode)
+                latencies[mode].append(elapsed)
+
+        fast_tables, fast_columns = _selection(results["fast"])
+        accurate_tables, accurate_columns = _selection(results["accurate"])
+        per_question.append({
+            "question": question,
+            "table_jaccard": _jaccard(fast_tables, accurate_tables),
+            "column_jaccard": _jaccard(fast_columns, accurate_columns),
+            "same_sql": normalize_sql(results["fast"]["sql"])[0] == normalize_sql(results["accurate"]["sql"])[0],
+            "fast": {"tables": fast_tables, "sql": results["fast"]["sql"]},
+            "accurate": {"tables": accurate_tables, "sql": results["accurate"]["sql"]},
+        })
+
+    return {
+        "questions": len(questions),
+        "repeat": repeat,
+        "latency_seconds": {mode: latency_summary(values) for mode, values in latencies.items()},
+        "agreement": {
+            "table_jaccard_mean": statistics.mean(q["table_jaccard"] for q in per_question),
+            "column_jaccard_mean": statistics.mean(q["column_jaccard"] for q in per_question),
+            "same_sql_rate": sum(q["same_sql"] for q in per_question) / len(per_question),
+        },
+        "per_question": per_question,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per question and mode")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    # Measure the LLM path, not cache hits
+    sql_pipeline.SEMANTIC_CACHE_ENABLED = False
+    # The pipeline logs every query to stdout; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(compare(questions, max(1, args.repeat)))
+
+    write_report(dict(report, meta=run_metadata()), args.output)
+
+
+if __name__ == "__main__":
+    main()
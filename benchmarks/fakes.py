@@ -0,0 +1,581 @@
+"""
+Local stand-ins for the services the pipeline talks to, so it can be
+benchmarked without OCI GenAI or an Oracle database.
+
+- A stand-in HTTP server plays the LLM and embedding endpoints: it sleeps
+  for a latency drawn from a configurable distribution and answers each
+  agent's prompt with a canned, well-formed response (streamed in chunks
+  when asked to).
+- StandInChatModel / StandInEmbeddings are the LangChain clients for it;
+  the chat model is installed behind the real LLM gateway.
+- FakeVectorStore replaces OracleVS; FakePool and FakeAsyncPool replace
+  the oracledb pools and return generated rows.
+
+install() wires these in. Call it before the app handles its first
+request.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Iterator, List, Optional
+
+import oracledb
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+EMBEDDING_DIMENSIONS = 384
+# Share of a streamed response's latency spent before the first chunk
+STREAM_FIRST_CHUNK_SHARE = 0.3
+STREAM_CHUNKS = 8
+
+
+class Latency:
+    """
+    Seconds to wait per call, drawn from a distribution given as a string:
+
+        "0.05" or "const:0.05"      always 50ms
+        "uniform:0.1,0.3"           uniformly between 100ms and 300ms
+        "normal:0.5,0.1"            mean 500ms, standard deviation 100ms
+        "lognormal:0.8,0.35"        median 800ms, sigma 0.35 (long right tail,
+                                    like real LLM latencies)
+    """
+
+    def __init__(self, spec, seed=None):
+        self.spec = spec
+        kind, _, args = spec.partition(":") if ":" in spec else ("const", "", spec)
+        try:
+            params = [float(arg) for arg in args.split(",") if arg.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid latency '{spec}'")
+        expected = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency '{spec}', see Latency for the accepted forms")
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "const":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._random.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._random.gauss(*self.params)
+            else:
+                median, sigma = self.params
+                value = self._random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, value)
+
+    def wait(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def __repr__(self):
+        return f"Latency({self.spec!r})"
+
+
+# ---------------------------------------------------------------------------
+# Stand-in LLM / embedding server
+
+_CANNED_SQL = """SELECT p.PO_NUM,
+       p.SUPPLIER_NAME,
+       p.ORDERED_AMOUNT,
+       p.PO_CREATION_DATE
+  FROM PO_NORM_TABLE_DUMMY p
+ WHERE p.PO_CREATION_DATE >= ADD_MONTHS(TRUNC(SYSDATE, 'MM'), -1)
+   AND p.ORDERED_AMOUNT > 10000
+ ORDER BY p.ORDERED_AMOUNT DESC"""
+
+_CANNED_COLUMNS = {"PO_NORM_TABLE_DUMMY": ["PO_NUM", "SUPPLIER_NAME", "ORDERED_AMOUNT", "PO_CREATION_DATE"]}
+
+# Prompt phrase -> (agent, response). Responses mimic what the model returns,
+# including prose around the JSON.
+CANNED_RESPONSES = [
+    ("understanding the intent", "intent", "Here is the analysis of the query:\n" + json.dumps({
+        "operation_type": "SELECT",
+        "possible_tables": ["PO_NORM_TABLE_DUMMY"],
+        "conditions": ["creation date in the last month", "ordered amount > 10000"],
+        "aggregations": [],
+        "intent_summary": "List recent purchase orders above an amount threshold",
+    }, indent=2)),
+    # Models often keep talking after the JSON; the agents stop reading there
+    ("identifying the most relevant tables", "tables", json.dumps({
+        "relevant_tables": ["PO_NORM_TABLE_DUMMY"],
+        "justification": "Purchase order headers hold the creation date and ordered amount",
+    }, indent=2) + (
+        "\n\nNote: the line and invoice tables are not needed, because the question only "
+        "filters and sorts on header fields. Let me know if you also need line-level detail."
+    )),
+    ("selecting the most relevant columns", "columns", json.dumps({
+        "columns": _CANNED_COLUMNS,
+        "justification": "Identifier, supplier, amount and date filter columns",
+    }, indent=2) + (
+        "\n\nThe identifier and supplier are shown to the user, the amount is both filtered "
+        "and sorted on, and the creation date is only used in the WHERE clause."
+    )),
+    ("planning a SQL query", "fused", json.dumps({
+        "operation_type": "SELECT",
+        "intent_summary": "List recent purchase orders above an amount threshold",
+        "relevant_tables": ["PO_NORM_TABLE_DUMMY"],
+        "columns": _CANNED_COLUMNS,
+    }, indent=2)),
+    ("expert SQL developer", "sql", _CANNED_SQL),
+    ("explaining SQL queries", "explanation", (
+        "This query lists purchase orders created since the start of last month whose ordered "
+        "amount is above 10,000. For each one it shows the PO number, the supplier, the ordered "
+        "amount and the creation date. The SELECT part picks those four columns, FROM names the "
+        "purchase order table, WHERE keeps only recent and large orders, and ORDER BY puts the "
+        "largest orders first."
+    )),
+]
+
+
+def canned_response(prompt):
+    """(agent, response text) for a prompt, by the agent's prompt wording."""
+    for phrase, agent, response in CANNED_RESPONSES:
+        if phrase in prompt:
+            return agent, response
+    return "unknown", "I could not understand the request."
+
+
+def stand_in_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """
+    Deterministic bag-of-words vector: questions sharing words get similar
+    vectors, so similarity thresholds behave plausibly.
+    """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector] if any(vector) else [1.0 / math.sqrt(dimensions)] * dimensions
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    server_version = "StandInGenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+
+        if self.path == "/embed":
+            self.server.count("embed")
+            self.server.embed_latency.wait()
+            return self._send_json(200, {"embeddings": [stand_in_embedding(t) for t in payload.get("texts", [])]})
+
+        if self.path == "/generate":
+            agent, text = canned_response(payload.get("prompt", ""))
+            self.server.count(agent)
+            delay = self.server.llm_latency.sample()
+            if not payload.get("stream"):
+                time.sleep(delay)
+                return self._send_json(200, {"text": text})
+
+            # Newline-delimited JSON chunks; the connection closes at the end
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            time.sleep(delay * STREAM_FIRST_CHUNK_SHARE)
+            size = max(1, math.ceil(len(text) / STREAM_CHUNKS))
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            interval = delay * (1 - STREAM_FIRST_CHUNK_SHARE) / max(1, len(chunks) - 1)
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(interval)
+                try:
+                    self.wfile.write(json.dumps({"text": chunk}).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading (e.g. once its JSON object was complete)
+                    return
+            return
+
+        self._send_json(404, {"error": f"unknown path {self.path}"})
+
+
+class StandInServer(ThreadingHTTPServer):
+    """The stand-in GenAI service; serve_in_thread() starts it in the background."""
+
+    daemon_threads = True
+
+    def __init__(self, llm_latency, embed_latency, host="127.0.0.1", port=0):
+        super().__init__((host, port), _StandInHandler)
+        self.llm_latency = llm_latency
+        self.embed_latency = embed_latency
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind):
+        with self._calls_lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, name="stand-in-genai", daemon=True)
+        thread.start()
+        return self
+
+
+def _post(url, payload, timeout):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+class StandInChatModel(BaseChatModel):
+    """Chat model backed by the stand-in server."""
+
+    url: str
+    timeout: float = 120.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stand-in"
+
+    @staticmethod
+    def _prompt(messages):
+        return "\n".join(str(message.content) for message in messages)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        with _post(f"{self.url}/generate", {"prompt": self._prompt(messages)}, self.timeout) as response:
+            text = json.loads(response.read())["text"]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        payload = {"prompt": self._prompt(messages), "stream": True}
+        with _post(f"{self.url}/generate", payload, self.timeout) as response:
+            for line in response:
+                if line.strip():
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=json.loads(line)["text"]))
+
+
+class StandInEmbeddings(Embeddings):
+    """Embedding model backed by the stand-in server."""
+
+    def __init__(self, url, timeout=60.0):
+        self.url = url
+        self.timeout = timeout
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with _post(f"{self.url}/embed", {"texts": list(texts)}, self.timeout) as response:
+            return json.loads(response.read())["embeddings"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# ---------------------------------------------------------------------------
+# Vector store and database
+
+class FakeVectorStore:
+    """OracleVS stand-in: same constructor and search method, canned examples."""
+
+    EXAMPLES = [
+        "SELECT PO_NUM, ORDERED_AMOUNT FROM PO_NORM_TABLE_DUMMY WHERE ORDERED_AMOUNT > 10000",
+        "SELECT SUPPLIER_NAME, SUM(ORDERED_AMOUNT) FROM PO_NORM_TABLE_DUMMY GROUP BY SUPPLIER_NAME",
+        "SELECT REQUISTION_NO, REQUISITION_STATUS FROM PR_DATA_DUMMY WHERE REQUISITION_STATUS = 'PENDING'",
+        "SELECT PO_NUMBER, INVOICE_AMOUNT, PAID_AMOUNT FROM PO_INVOICE_DATA_DUMMY WHERE PAID_AMOUNT < INVOICE_AMOUNT",
+        "SELECT PO_NUM, LINE_NUM, ITEM_DESCRIPTION FROM PO_LINE_TABLE_DUMMY WHERE LINE_STATUS = 'OPEN'",
+    ]
+
+    def __init__(self, client=None, table_name=None, distance_strategy=None, embedding_function=None,
+                 latency=None):
+        self.client = client
+        self.table_name = table_name
+        self.latency = latency or Latency("0")
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        self.latency.wait()
+        offset = sum(map(ord, self.table_name or "")) % len(self.EXAMPLES)
+        return [
+            (Document(page_content=self.EXAMPLES[(offset + i) % len(self.EXAMPLES)], metadata={}), 0.1 + 0.05 * i)
+            for i in range(min(k, len(self.EXAMPLES)))
+        ]
+
+
+class FakeCursor:
+    """Enough of an oracledb cursor for db.sql_executor and the retriever."""
+
+    COLUMNS = ("PO_NUM", "SUPPLIER_NAME", "ORDERED_AMOUNT", "PO_CREATION_DATE", "PO_STATUS")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.outputtypehandler = None
+        self.rowfactory = None
+        self.description = None
+        self._rows = iter(())
+
+    def execute(self, sql, binds=None, **kwargs):
+        self.connection.pool.execute_latency.wait()
+        self._open(sql, binds)
+
+    def _open(self, sql, binds):
+        pool = self.connection.pool
+        binds = binds or {}
+        if sql.lstrip().upper().startswith("EXPLAIN PLAN"):
+            if binds:
+                # Oracle explains the statement with its placeholders, never with values
+                raise oracledb.Error(SimpleNamespace(full_code="ORA-01036", message="illegal variable name/number"))
+            self.description = None
+            self._rows = iter(())
+            return
+        if "FROM PLAN_TABLE" in sql.upper():
+            # db.cost_guard's plan summary: (cost, max cardinality, cartesian steps)
+            self.description = [(name, None, None, None, None, None, True) for name in ("COST", "ROWS", "CARTESIAN")]
+            self._rows = iter([pool.plan])
+            return
+        start = int(binds.get("row_offset", 0))
+        stop = min(pool.rows, start + int(binds.get("row_limit", pool.rows)))
+        self.description = [(name, None, None, None, None, None, True) for name in self.COLUMNS]
+        self._rows = (self._row(i) for i in range(start, stop))
+
+    @staticmethod
+    def _row(i):
+        day = date(2024, 1, 1) + timedelta(days=i % 365)
+        return (f"PO{i:08d}", f"Supplier {i % 97}", round(1000 + (i * 37.5) % 50000, 2),
+                day.isoformat(), "OPEN" if i % 3 else "CLOSED")
+
+    def _shape(self, row):
+        return self.rowfactory(*row) if self.rowfactory is not None else row
+
+    def _next_rows(self, size):
+        return [self._shape(row) for _, row in zip(range(size or self.arraysize), self._rows)]
+
+    def fetchmany(self, size=None):
+        rows = self._next_rows(size)
+        if rows:
+            self.connection.pool.fetch_latency.wait()
+        return rows
+
+    def fetchall(self):
+        rows = []
+        while True:
+            batch = self.fetchmany()
+            if not batch:
+                return rows
+            rows.extend(batch)
+
+    def fetchone(self):
+        rows = self._next_rows(1)
+        return rows[0] if rows else None
+
+    def var(self, *args, **kwargs):
+        return None
+
+    def close(self):
+        self._rows = iter(())
+
+
+class FakeAsyncCursor(FakeCursor):
+    """The async driver's cursor: execute and fetches are awaited."""
+
+    async def execute(self, sql, binds=None, **kwargs):
+        await self.connection.pool.execute_latency.wait_async()
+        self._open(sql, binds)
+
+    async def fetchmany(self, size=None):
+        rows = self._next_rows(size)
+        if rows:
+            await self.connection.pool.fetch_latency.wait_async()
+        return rows
+
+    async def fetchall(self):
+        rows = []
+        while True:
+            batch = await self.fetchmany()
+            if not batch:
+                return rows
+            rows.extend(batch)
+
+    async def fetchone(self):
+        rows = self._next_rows(1)
+        return rows[0] if rows else None
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.call_timeout = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def ping(self):
+        self.pool.execute_latency.wait()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAsyncConnection(FakeConnection):
+    def cursor(self):
+        return FakeAsyncCursor(self)
+
+    async def ping(self):
+        await self.pool.execute_latency.wait_async()
+
+    async def rollback(self):
+        pass
+
+
+def _pool_timeout_error():
+    # What oracledb raises when wait_timeout passes (see db.db_pool._is_pool_timeout)
+    return oracledb.Error(SimpleNamespace(
+        full_code="DPY-4005", message="timed out waiting for the connection pool to return a connection"
+    ))
+
+
+class FakePool:
+    """
+    oracledb pool stand-in of a fixed size, in timed-wait mode: acquire()
+    waits while all connections are busy, and fails like oracledb once
+    wait_timeout (ms) passes.
+
+    EXPLAIN PLAN is answered with `plan`, a (cost, cardinality, cartesian
+    join steps) estimate that stays under db.cost_guard's thresholds.
+    """
+
+    min = increment = 1
+    timeout = 0
+    stmtcachesize = 0
+
+    def __init__(self, size=10, execute_latency=None, fetch_latency=None, rows=100, wait_timeout=5000):
+        self.max = self.opened = size
+        self.rows = rows
+        self.plan = (100, rows, 0)
+        self.wait_timeout = wait_timeout
+        self.execute_latency = execute_latency or Latency("0")
+        self.fetch_latency = fetch_latency or Latency("0")
+        self._free = threading.BoundedSemaphore(size)
+        self._busy_lock = threading.Lock()
+        self.busy = 0
+
+    def acquire(self):
+        if not self._free.acquire(timeout=self.wait_timeout / 1000):
+            raise _pool_timeout_error()
+        with self._busy_lock:
+            self.busy += 1
+        return FakeConnection(self)
+
+    def release(self, connection):
+        with self._busy_lock:
+            self.busy -= 1
+        self._free.release()
+
+    drop = release
+
+    def close(self, force=False):
+        pass
+
+
+class FakeAsyncPool(FakePool):
+    """oracledb.AsyncConnectionPool stand-in; use from a single event loop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._free = None
+
+    async def acquire(self):
+        if self._free is None:
+            self._free = asyncio.Semaphore(self.max)
+        try:
+            await asyncio.wait_for(self._free.acquire(), self.wait_timeout / 1000)
+        except asyncio.TimeoutError:
+            raise _pool_timeout_error()
+        self.busy += 1
+        return FakeAsyncConnection(self)
+
+    async def release(self, connection):
+        self.busy -= 1
+        self._free.release()
+
+    drop = release
+
+    async def close(self, force=False):
+        pass
+
+
+def install(llm_url, vector_latency=None, db_latency=None, fetch_latency=None, rows=100, pool_size=None):
+    """
+    Point the app at the stand-ins: LLM and embeddings at the stand-in
+    server at llm_url (with a memory-only response cache), OracleVS at FakeVectorStore, the DB pools at a
+    FakePool / FakeAsyncPool. Call before the app handles its first
+    request.
+
+    Args:
+        pool_size (int, optional): Size of the async pool; db_pool.DB_POOL_MAX by default
+
+    Returns:
+        FakeAsyncPool: The installed async pool
+    """
+    from llm import llm_gateway
+    from llm.embedding_cache import CachedEmbeddings
+    from llm.response_cache import LLMResponseCache
+    from db import db_pool
+    from retriever import sql_retriever
+    from metadata import schema_loader
+
+    llm_gateway._create_llm = lambda model_id: StandInChatModel(url=llm_url)
+    llm_gateway.embedder = CachedEmbeddings(StandInEmbeddings(llm_url), model_id="stand-in", path=None)
+    llm_gateway.response_cache = LLMResponseCache(path=None)
+    sql_retriever.OracleVS = functools.partial(FakeVectorStore, latency=vector_latency)
+    wait_timeout = int(db_pool.DB_POOL_ACQUIRE_TIMEOUT_SECONDS * 1000)
+    db_pool.db_pool = FakePool(db_pool.DB_SYNC_POOL_MAX, db_latency, fetch_latency, rows, wait_timeout)
+    pool = FakeAsyncPool(pool_size or db_pool.DB_POOL_MAX, db_latency, fetch_latency, rows, wait_timeout)
+    db_pool.async_pool = pool
+    # The built-in SCHEMA_MAP stands in for the data dictionary
+    schema_loader.init_schema = lambda: None
+    return pool
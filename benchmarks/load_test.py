@@ -0,0 +1,273 @@
+"""
+Load-test /generate_sql and /execute_sql against local stand-ins.
+
+The API runs in a child process under uvicorn with benchmarks/fakes.py
+installed: the LLM and embedding calls go to a stand-in HTTP server run by
+this process, vector search and the database are in-process fakes. Each
+stand-in waits for a latency drawn from a configurable distribution (see
+fakes.Latency), so no OCI GenAI or Oracle access is needed.
+
+For every endpoint and concurrency level, a fixed number of requests is
+sent by that many concurrent clients (closed loop). The report has latency
+percentiles, throughput, error counts and the mean duration of each
+pipeline stage taken from /metrics.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,4,16,32] [--requests N]
+        [--endpoints generate_sql,execute_sql] [--llm-latency lognormal:0.8,0.35]
+        [--embed-latency SPEC] [--vector-latency SPEC] [--db-latency SPEC]
+        [--rows N] [--pool-size N] [--output FILE]
+
+Results are written as JSON.
+"""
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from benchmarks import fakes
+from benchmarks.common import latency_summary, run_metadata, write_report
+
+DEFAULT_QUESTIONS = [
+    "Show me all purchase orders created in the last month with total amount greater than 10000",
+    "List the top 10 suppliers by total ordered amount",
+    "How many purchase requisitions are still pending approval?",
+    "Show invoice amounts for purchase orders from supplier ACME",
+    "Which PO lines have a received quantity lower than the ordered quantity?",
+]
+
+EXECUTE_SQL = "SELECT PO_NUM, SUPPLIER_NAME, ORDERED_AMOUNT, PO_CREATION_DATE, PO_STATUS FROM PO_NORM_TABLE_DUMMY"
+
+ENDPOINTS = ("generate_sql", "execute_sql")
+
+SERVER_START_TIMEOUT_SECONDS = 60
+
+_STAGE_SAMPLE = re.compile(r'^pipeline_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(args):
+    """Child process: the API with the fakes installed."""
+    fakes.install(
+        args.llm_url,
+        vector_latency=fakes.Latency(args.vector_latency),
+        db_latency=fakes.Latency(args.db_latency),
+        fetch_latency=fakes.Latency(args.fetch_latency),
+        rows=args.rows,
+        pool_size=args.pool_size,
+    )
+    import uvicorn
+    import app
+    import pipeline.sql_pipeline as sql_pipeline
+    from llm import llm_gateway
+
+    sql_pipeline.SEMANTIC_CACHE_ENABLED = args.semantic_cache
+    if not args.llm_cache:
+        llm_gateway.LLM_RESPONSE_CACHE_CHAINS = {}
+    uvicorn.run(app.app, host="127.0.0.1", port=args.serve, log_level="warning", access_log=False)
+
+
+def _start_api(args, llm_url):
+    port = _free_port()
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve", str(port), "--llm-url", llm_url,
+        "--vector-latency", args.vector_latency, "--db-latency", args.db_latency,
+        "--fetch-latency", args.fetch_latency, "--rows", str(args.rows), "--pool-size", str(args.pool_size),
+    ]
+    if args.semantic_cache:
+        command.append("--semantic-cache")
+    if args.llm_cache:
+        command.append("--llm-cache")
+    # The API logs every query to stdout; keep stdout for the report
+    process = subprocess.Popen(command, stdout=sys.stderr)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API process exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/tables", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API process did not start in time")
+
+
+def _stage_totals(metrics_text):
+    totals = {}
+    for kind, stage, value in _STAGE_SAMPLE.findall(metrics_text):
+        totals.setdefault(stage, {"sum": 0.0, "count": 0.0})[kind] = float(value)
+    return totals
+
+
+def _stage_means(before, after):
+    means = {}
+    for stage, total in after.items():
+        previous = before.get(stage, {"sum": 0.0, "count": 0.0})
+        count = total["count"] - previous["count"]
+        if count:
+            means[stage] = (total["sum"] - previous["sum"]) / count
+    return means
+
+
+def _payload(endpoint, i, args, questions):
+    if endpoint == "generate_sql":
+        return {"query": questions[i % len(questions)], "explain": args.explain}
+    return {"sql": EXECUTE_SQL, "cache": args.result_cache}
+
+
+async def _run_level(client, endpoint, concurrency, total, args, questions):
+    latencies, errors = [], {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"/{endpoint}", json=_payload(endpoint, i, args, questions))
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    # Warm up connections and lazily built singletons outside the measurement
+    await asyncio.gather(*[
+        client.post(f"/{endpoint}", json=_payload(endpoint, i, args, questions))
+        for i in range(min(concurrency, args.warmup))
+    ])
+
+    before = _stage_totals((await client.get("/metrics")).text)
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    after = _stage_totals((await client.get("/metrics")).text)
+
+    result = {
+        "endpoint": f"/{endpoint}",
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else None,
+        "latency_seconds": latency_summary(latencies),
+    }
+    if endpoint == "generate_sql":
+        result["stage_mean_seconds"] = _stage_means(before, after)
+    return result
+
+
+async def run_load(base_url, args, questions):
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                total = max(args.requests, concurrency)
+                print(f"{endpoint}: {total} requests at concurrency {concurrency}", file=sys.stderr)
+                results.append(await _run_level(client, endpoint, concurrency, total, args, questions))
+    return results
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _endpoint_list(value):
+    endpoints = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16, 32],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each level")
+    parser.add_argument("--endpoints", type=_endpoint_list, default=list(ENDPOINTS))
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--explain", choices=["none", "inline", "deferred"], default="inline")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.35", help="Per LLM call")
+    parser.add_argument("--embed-latency", default="lognormal:0.1,0.3", help="Per embedding call")
+    parser.add_argument("--vector-latency", default="lognormal:0.02,0.3", help="Per vector store search")
+    parser.add_argument("--db-latency", default="lognormal:0.01,0.3", help="Per statement execution")
+    parser.add_argument("--fetch-latency", default="0.001", help="Per fetch round-trip")
+    parser.add_argument("--rows", type=int, default=200, help="Rows returned by every query")
+    parser.add_argument("--pool-size", type=int, default=10, help="Fake DB pool size")
+    parser.add_argument("--semantic-cache", action="store_true", help="Leave the semantic cache on")
+    parser.add_argument("--llm-cache", action="store_true", help="Leave the LLM response cache on")
+    parser.add_argument("--result-cache", action="store_true", help="Let /execute_sql use the result cache")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--llm-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    for spec in (args.llm_latency, args.embed_latency, args.vector_latency, args.db_latency, args.fetch_latency):
+        try:
+            fakes.Latency(spec)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.serve:
+        return serve(args)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    stand_in = fakes.StandInServer(fakes.Latency(args.llm_latency), fakes.Latency(args.embed_latency))
+    stand_in.serve_in_thread()
+    process, base_url = _start_api(args, stand_in.url)
+    try:
+        results = asyncio.run(run_load(base_url, args, questions))
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        stand_in.shutdown()
+
+    write_report({
+        "meta": run_metadata(),
+        "config": {
+            "llm_latency": args.llm_latency,
+            "embed_latency": args.embed_latency,
+            "vector_latency": args.vector_latency,
+            "db_latency": args.db_latency,
+            "fetch_latency": args.fetch_latency,
+            "rows": args.rows,
+            "pool_size": args.pool_size,
+            "explain": args.explain,
+            "semantic_cache": args.semantic_cache,
+            "llm_cache": args.llm_cache,
+            "result_cache": args.result_cache,
+        },
+        "stand_in_calls": stand_in.calls,
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
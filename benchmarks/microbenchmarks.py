@@ -0,0 +1,216 @@
+"""
+Microbenchmarks of the CPU-bound helpers on the request path: LLM response
+JSON extraction, SQL formatting and fingerprinting, and prompt assembly.
+
+The SQL cases also run the regex-per-keyword implementations that the
+single-pass lexer (utils.sql_utils.analyze_sql) replaced, as "*.legacy",
+on hand-written queries and on large generated ones.
+
+Each case is timed with timeit: the loop count is calibrated so one
+repeat takes at least 0.2s, then --repeat repeats are run. Reported times
+are per call, in microseconds; "best" is the least noisy figure to track.
+
+Usage:
+    python benchmarks/microbenchmarks.py [--repeat N] [--filter SUBSTRING] [--output FILE]
+
+Results are written as JSON.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes
+from benchmarks.common import run_metadata, write_report
+
+# Prompt assembly builds the agents, which need an LLM client; it is never called
+fakes.install("http://127.0.0.1:9")
+
+from utils.sql_utils import (
+    JSONObjectScanner, analyze_sql, extract_json_from_llm_response, extract_table_names, format_sql_query, normalize_sql
+)
+from agents.intent_agent import IntentAgent
+from prompts.generate_prompts import QueryPromptGenerator
+from prompts.token_budget import fit_examples
+from metadata.schema_model import get_schema_model
+
+_INTENT = json.loads(fakes.CANNED_RESPONSES[0][2].split("\n", 1)[1])
+_COLUMNS = {
+    "columns": {"PO_NORM_TABLE_DUMMY": ["PO_NUM", "SUPPLIER_NAME", "ORDERED_AMOUNT", "PO_CREATION_DATE"]},
+    "justification": "Identifier, supplier, amount and date filter columns",
+}
+
+LLM_RESPONSES = {
+    "clean": json.dumps(_INTENT),
+    "prose": "Sure! Here is the analysis you asked for:\n" + json.dumps(_INTENT, indent=2) + "\nLet me know if you need more.",
+    "fenced": "```json\n" + json.dumps(_COLUMNS, indent=2) + "\n```",
+    "nested_prose": "Selected columns:\n" + json.dumps(_COLUMNS, indent=2),
+    "long_prose": ("The user wants recent purchase orders. " * 40) + json.dumps(_INTENT),
+}
+
+SHORT_SQL = "select po_num, supplier_name from po_norm_table_dummy where ordered_amount > 10000 order by ordered_amount desc"
+LONG_SQL = """SELECT p.PO_NUM, p.SUPPLIER_NAME, SUM(l.ORDERED_AMOUNT) AS ordered, SUM(i.INVOICE_AMOUNT) AS invoiced,
+       -- outstanding = ordered - invoiced
+       SUM(l.ORDERED_AMOUNT) - NVL(SUM(i.INVOICE_AMOUNT), 0) AS outstanding
+  FROM PO_NORM_TABLE_DUMMY p
+  JOIN PO_LINE_TABLE_DUMMY l ON l.PO_NUM = p.PO_NUM
+  LEFT JOIN PO_INVOICE_DATA_DUMMY i ON i.PO_NUMBER = p.PO_NUM
+ WHERE p.PO_CREATION_DATE >= DATE '2024-01-01' AND p.PO_STATUS IN ('OPEN', 'APPROVED') AND p.SUPPLIER_NAME LIKE 'A%'
+   AND p.DESCRIPTION <> 'Where the ORDER BY is in a string'
+ GROUP BY p.PO_NUM, p.SUPPLIER_NAME
+HAVING SUM(l.ORDERED_AMOUNT) > 50000
+ ORDER BY outstanding DESC
+ FETCH FIRST 50 ROWS ONLY"""
+
+# UNION ALL branches in the generated "large" query (~1k characters each)
+LARGE_SQL_BRANCHES = 50
+
+
+def generated_sql(branches):
+    """LONG_SQL-like branches with distinct literals, joined by UNION ALL."""
+    return "\nUNION ALL\n".join(
+        LONG_SQL.replace("50000", str(50000 + n)).replace("'A%'", f"'S{n}%'").replace(
+            " FETCH FIRST 50 ROWS ONLY", ""
+        )
+        for n in range(branches)
+    )
+
+
+LARGE_SQL = generated_sql(LARGE_SQL_BRANCHES)
+TABLES = ["PO_NORM_TABLE_DUMMY", "PO_LINE_TABLE_DUMMY", "PO_INVOICE_DATA_DUMMY", "PR_DATA_DUMMY"]
+
+SQL_EXAMPLES = fakes.FakeVectorStore.EXAMPLES[:3]
+
+
+def legacy_format_sql_query(query):
+    """format_sql_query before the lexer: one re.sub per keyword."""
+    query = re.sub(r' +', ' ', query)
+    for keyword in ['SELECT', 'FROM', 'WHERE', 'GROUP BY', 'HAVING', 'ORDER BY', 'LIMIT']:
+        query = re.sub(rf'\b({keyword})\b', r'\n\1', query, flags=re.IGNORECASE)
+    lines = query.strip().split('\n')
+    return '\n'.join([lines[0]] + ['  ' + line for line in lines[1:]])
+
+
+_LEGACY_FINGERPRINT_TOKENS = re.compile(
+    r"(?P<comment>--[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>'(?:[^']|'')*')"
+    r"|(?P<quoted>\"[^\"]*\")"
+    r"|(?P<number>\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b)"
+    r"|(?P<space>\s+)",
+    re.DOTALL
+)
+
+
+def legacy_normalize_sql(query):
+    """normalize_sql before the lexer: a token regex plus two re.sub passes."""
+    parts = []
+    literals = []
+    position = 0
+    for match in _LEGACY_FINGERPRINT_TOKENS.finditer(query):
+        parts.append(query[position:match.start()].upper())
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ("string", "number"):
+            literals.append(match.group())
+            parts.append("?")
+        elif kind == "quoted":
+            parts.append(match.group())
+        else:
+            parts.append(" ")
+    parts.append(query[position:].upper())
+    fingerprint = re.sub(r" +", " ", "".join(parts)).strip().rstrip(";").strip()
+    return re.sub(r" ?([(),=<>+*/-]) ?", r"\1", fingerprint), literals
+
+
+def legacy_extract_table_names(query, available_tables):
+    fingerprint, _ = legacy_normalize_sql(query)
+    words = set(re.findall(r"[A-Z0-9_$#]+", fingerprint))
+    return [table for table in available_tables if table.upper() in words]
+
+
+def _scan_chunks(chunks):
+    scanner = JSONObjectScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk) is not None:
+            return scanner.value
+
+
+def _cases():
+    cases = {}
+    for name, response in LLM_RESPONSES.items():
+        cases[f"extract_json.{name}"] = lambda response=response: extract_json_from_llm_response(response)
+    cases["extract_json.llmchain_dict"] = lambda: extract_json_from_llm_response({"text": LLM_RESPONSES["prose"]})
+    # An agent's streamed answer, parsed as it arrives (fakes.STREAM_CHUNKS pieces)
+    streamed = LLM_RESPONSES["prose"]
+    size = -(-len(streamed) // fakes.STREAM_CHUNKS)
+    chunks = [streamed[i:i + size] for i in range(0, len(streamed), size)]
+    cases["extract_json.incremental"] = lambda: _scan_chunks(chunks)
+
+    for name, sql in (("short", SHORT_SQL), ("long", LONG_SQL), ("large", LARGE_SQL)):
+        cases[f"format_sql.{name}"] = lambda sql=sql: format_sql_query(sql)
+        cases[f"format_sql.{name}.legacy"] = lambda sql=sql: legacy_format_sql_query(sql)
+        cases[f"normalize_sql.{name}"] = lambda sql=sql: normalize_sql(sql)
+        cases[f"normalize_sql.{name}.legacy"] = lambda sql=sql: legacy_normalize_sql(sql)
+        # What /execute_sql's result cache needs: fingerprint and tables read
+        cases[f"cache_key_and_tables.{name}"] = lambda sql=sql: extract_table_names(analyze_sql(sql), TABLES)
+        cases[f"cache_key_and_tables.{name}.legacy"] = lambda sql=sql: (
+            legacy_normalize_sql(sql), legacy_extract_table_names(sql, TABLES)
+        )
+
+    generator = QueryPromptGenerator()
+    tables = {"relevant_tables": ["PO_NORM_TABLE_DUMMY", "PO_LINE_TABLE_DUMMY"]}
+    cases["prompt.sql_inputs"] = lambda: generator.generate_sql_prompt(
+        "Show purchase orders over 10000 from last month", _INTENT, tables, _COLUMNS, SQL_EXAMPLES
+    )
+    prompt_data = generator.generate_sql_prompt(
+        "Show purchase orders over 10000 from last month", _INTENT, tables, _COLUMNS, SQL_EXAMPLES
+    )
+    cases["prompt.sql_render"] = lambda: generator.sql_generation_prompt.format(**prompt_data)
+
+    intent_prompt = IntentAgent().prompt
+    cases["prompt.intent_inputs"] = lambda: fit_examples(
+        intent_prompt, {"query": "Show purchase orders over 10000 from last month"}, SQL_EXAMPLES, "intent"
+    )
+    model = get_schema_model()
+    cases["prompt.compact_schema"] = lambda: model.compact_schema(list(model.tables))
+    return cases
+
+
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(number, 1)
+    per_call = [total / number * 1e6 for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "calls_per_repeat": number,
+        "repeats": repeat,
+        "best_us": min(per_call),
+        "median_us": statistics.median(per_call),
+        "mean_us": statistics.mean(per_call),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per case")
+    parser.add_argument("--filter", help="Only run cases whose name contains this")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in _cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        print(f"{name}...", file=sys.stderr)
+        results[name] = measure(func, max(1, args.repeat))
+
+    write_report({"meta": run_metadata(), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+from metadata.schema_model import get_schema_model
+from utils.sql_utils import SQLAnalysis, analyze_sql, extract_table_names
+
+# Seconds a cached result stays valid, per table. A query's TTL is the
+# shortest TTL among the tables it reads; unknown tables get the default.
+RESULT_CACHE_TABLE_TTLS = {
+    "PO_NORM_TABLE_DUMMY": 300,
+    "PO_LINE_TABLE_DUMMY": 300,
+    "PO_INVOICE_DATA_DUMMY": 120,
+    "PR_DATA_DUMMY": 600,
+}
+RESULT_CACHE_DEFAULT_TTL_SECONDS = 60
+# Total bytes of serialized result bodies kept in memory
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Results larger than this share of the budget are never cached
+RESULT_CACHE_MAX_ENTRY_FRACTION = 0.1
+
+
+def result_cache_key(sql_query, binds=None, **variant):
+    """
+    Cache key for a query result: the normalized SQL fingerprint, its
+    literal values, the bind values and any response variant (format, page).
+    sql_query may be given as its analyze_sql() result.
+    """
+    analysis = sql_query if isinstance(sql_query, SQLAnalysis) else analyze_sql(sql_query)
+    fingerprint, literals = analysis.fingerprint, analysis.literals
+    payload = json.dumps(
+        [fingerprint, literals, sorted((binds or {}).items()), sorted(variant.items())],
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    In-memory cache of serialized /execute_sql responses.
+
+    Entries are evicted LRU once their total size passes max_bytes, expire
+    after the TTL of the tables they read, and can be dropped per table with
+    invalidate_tables().
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, table_ttls=None,
+                 default_ttl=RESULT_CACHE_DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.table_ttls = dict(RESULT_CACHE_TABLE_TTLS if table_ttls is None else table_ttls)
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def tables_for(self, sql_query):
+        return extract_table_names(sql_query, get_schema_model().table_names)
+
+    def ttl_for(self, tables):
+        return min((self.table_ttls.get(table, self.default_ttl) for table in tables), default=self.default_ttl)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        for table in entry["tables"]:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def get(self, key):
+        """
+        Returns:
+            tuple or None: (body, media_type, headers) for a live entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["body"], entry["media_type"], entry["headers"]
+
+    def put(self, key, tables, body, media_type, headers):
+        size = len(body)
+        if size > self.max_bytes * RESULT_CACHE_MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = {
+                "body": body,
+                "media_type": media_type,
+                "headers": headers,
+                "tables": tables,
+                "size": size,
+                "expires_at": time.time() + self.ttl_for(tables)
+            }
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+
+    def invalidate_tables(self, tables):
+        """
+        Drop every cached result that reads any of the given tables.
+
+        Returns:
+            int: Number of entries removed
+        """
+        removed = 0
+        with self._lock:
+            for table in tables:
+                for key in list(self._by_table.get(table.upper(), ())):
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+result_cache = ResultCache()
+
+def get_result_cache():
+    return result_cache
+
+metrics.register_cache("result", lambda: result_cache.stats())
@@ -0,0 +1,236 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metadata import schema_loader
+from utils import metrics
+
+# Minimum cosine similarity between two query embeddings for them to be
+# treated as the same question.
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+SEMANTIC_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+# Numbers ("10000", "10,000", "2.5") and quoted values ('ACME', "ACME") in a question
+_QUESTION_LITERAL = re.compile(r"(?<!\w)'[^']*'(?!\w)|(?<!\w)\"[^\"]*\"(?!\w)|\d+(?:[.,]\d+)*")
+
+
+def question_literals(user_query):
+    """
+    The numbers and quoted values of a question, in order. Questions that
+    embed almost identically can still ask for different values ("over
+    10000" / "over 50000", "top 10" / "top 20"), and those values end up in
+    the SQL, so answers are only shared between questions whose literals match.
+
+    Returns:
+        tuple: Numbers without thousands separators, and quoted values without their quotes
+    """
+    literals = []
+    for literal in _QUESTION_LITERAL.findall(user_query or ""):
+        if literal[0] in "'\"":
+            literals.append(literal[1:-1])
+        else:
+            literals.append(re.sub(r",(?=\d{3}\b)", "", literal))
+    return tuple(literals)
+
+
+def schema_fingerprint():
+    """Hash of the schema the pipeline prompts are built from (SCHEMA_MAP + the tables offered)."""
+    digest = hashlib.sha1()
+    for table in schema_loader.table_names():
+        digest.update(table.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(schema_loader.schema_digest().encode("ascii"))
+    return digest.hexdigest()
+
+
+class SemanticCache:
+    """
+    Cache of pipeline answers keyed by query embedding.
+
+    A lookup embeds nothing itself: it takes the query embedding and returns
+    the entry whose stored embedding has the highest cosine similarity, if
+    that similarity clears the threshold. Entries are evicted LRU once
+    max_entries is reached, expire after ttl_seconds, and the whole cache is
+    dropped whenever the schema fingerprint changes. Each entry is tagged
+    with the pipeline mode that produced it, and lookups can be restricted
+    to answers from given modes. Lookups given the question only match
+    entries whose question has the same literals (question_literals).
+    """
+
+    def __init__(self, similarity_threshold=SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> entry dict, in LRU order; each entry owns one row ("slot") of
+        # the preallocated _vectors matrix so lookups are one matrix-vector product.
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._vectors = None
+        self._active = np.zeros(max_entries, dtype=bool)
+        self._slot_keys = [None] * max_entries
+        self._slot_modes = np.empty(max_entries, dtype=object)
+        self._slot_literals = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._schema = schema_fingerprint()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Lookups that cleared the threshold only with answers for other literals
+        self.literal_mismatches = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_schema(self):
+        current = schema_fingerprint()
+        if current != self._schema:
+            self._clear()
+            self._schema = current
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._vectors = None
+        self._active[:] = False
+        self._slot_keys = [None] * self.max_entries
+        self._slot_literals = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._active[entry["slot"]] = False
+        self._slot_keys[entry["slot"]] = None
+        self._slot_literals[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            self._remove(key)
+
+    def lookup(self, embedding, modes=None, user_query=None):
+        """
+        Find a cached answer for a semantically equivalent query.
+
+        Args:
+            embedding (list): Embedding of the user's query
+            modes (list, optional): Only consider answers produced in these pipeline modes
+            user_query (str, optional): The query itself; when given, only answers to
+                questions with the same literals are considered
+
+        Returns:
+            tuple: (entry dict or None, best similarity or None)
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_schema()
+            self._expire(time.time())
+            if not self._entries or self._vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None, None
+
+            scores = self._vectors @ vector
+            scores[~self._active] = -np.inf
+            if modes is not None:
+                scores[~np.isin(self._slot_modes, list(modes))] = -np.inf
+            slot = int(np.argmax(scores))
+            similarity = float(scores[slot])
+            if not np.isfinite(similarity):
+                # Nothing eligible for this lookup
+                self.misses += 1
+                return None, None
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None, similarity
+            if user_query is not None:
+                # Few entries clear the threshold; take the closest with the same literals
+                literals = question_literals(user_query)
+                close = np.flatnonzero(scores >= self.similarity_threshold)
+                matching = [i for i in close[np.argsort(-scores[close])] if self._slot_literals[i] == literals]
+                if not matching:
+                    self.misses += 1
+                    self.literal_mismatches += 1
+                    return None, similarity
+                slot = int(matching[0])
+                similarity = float(scores[slot])
+
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry = self._entries[key]
+            return {
+                "sql": entry["sql"],
+                "explanation": entry["explanation"],
+                "query": entry["query"],
+                "mode": entry["mode"]
+            }, similarity
+
+    def store(self, embedding, user_query, sql, explanation, mode="accurate"):
+        """Remember the answer generated for a query embedding."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_schema()
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed dimension
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            key = self._next_key
+            self._next_key += 1
+            self._vectors[slot] = vector
+            self._active[slot] = True
+            self._slot_keys[slot] = key
+            self._slot_modes[slot] = mode
+            self._slot_literals[slot] = question_literals(user_query)
+            self._entries[key] = {
+                "slot": slot,
+                "mode": mode,
+                "query": user_query,
+                "sql": sql,
+                "explanation": explanation,
+                "created_at": time.time()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "literal_mismatches": self.literal_mismatches
+            }
+
+
+semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache():
+    global semantic_cache
+    with _semantic_cache_lock:
+        if semantic_cache is None:
+            semantic_cache = SemanticCache()
+    return semantic_cache
+
+metrics.register_cache("semantic", lambda: semantic_cache.stats() if semantic_cache is not None else None)
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import oracledb
+
+from db.db_pool import is_call_timeout
+from utils import metrics
+from utils.sql_utils import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# What /execute_sql does with a query whose estimated plan is over a threshold:
+# "off":    don't explain queries at all
+# "warn":   run it, with an X-Cost-Guard response header
+# "limit":  run it with at most COST_GUARD_LIMIT_ROWS rows fetched and a
+#           call timeout of COST_GUARD_LIMIT_TIMEOUT_SECONDS
+# "reject": don't run it (422)
+# Requests may override the mode with "cost_guard".
+COST_GUARD_MODES = ("off", "warn", "limit", "reject")
+COST_GUARD_MODE = "warn"
+# Thresholds on the optimizer's estimates: total plan cost, and the largest
+# row count of any plan step (a cartesian join blows up before any GROUP BY)
+COST_GUARD_MAX_COST = 500000
+COST_GUARD_MAX_ROWS = 10000000
+# Treat any MERGE JOIN CARTESIAN step as over the thresholds
+COST_GUARD_FLAG_CARTESIAN = True
+COST_GUARD_LIMIT_ROWS = 1000
+COST_GUARD_LIMIT_TIMEOUT_SECONDS = 10
+# Plans are cached by SQL fingerprint and literal values: a literal can change
+# the estimate (a skewed column, a partition key), so only queries differing in
+# layout or keyword case share one EXPLAIN. Estimates follow table statistics,
+# hence the TTL.
+COST_GUARD_PLAN_CACHE_SIZE = 1000
+COST_GUARD_PLAN_TTL_SECONDS = 3600
+
+COST_GUARD_DECISIONS = metrics.counter(
+    "sql_cost_guard_decisions_total",
+    "Cost guard outcomes per query: allow, warn, limit, reject, error, timeout",
+    ["action"]
+)
+EXPLAIN_SECONDS = metrics.histogram("sql_explain_duration_seconds", "EXPLAIN PLAN round-trips")
+
+# Sums up PLAN_TABLE for one statement; the row with id 0 carries the total cost
+_PLAN_SUMMARY = """
+    SELECT MAX(CASE WHEN id = 0 THEN cost END),
+           MAX(cardinality),
+           COUNT(CASE WHEN operation = 'MERGE JOIN' AND options = 'CARTESIAN' THEN 1 END)
+      FROM plan_table
+     WHERE statement_id = :statement_id"""
+
+
+class QueryTooExpensiveError(Exception):
+    """Raised when the cost guard rejects a query; carries the assessment."""
+
+    def __init__(self, assessment):
+        super().__init__(f"Estimated plan is over the cost guard limits: {', '.join(assessment.reasons)}")
+        self.assessment = assessment
+
+
+class PlanEstimate:
+    """The optimizer's estimates for one statement."""
+
+    def __init__(self, cost, rows, cartesian):
+        self.cost = cost
+        self.rows = rows
+        self.cartesian = cartesian
+        self.explained_at = time.time()
+
+    def to_dict(self):
+        return {"cost": self.cost, "rows": self.rows, "cartesian_join": self.cartesian}
+
+
+class CostAssessment:
+    """A plan estimate and what the guard decided to do about it."""
+
+    def __init__(self, plan, reasons, action):
+        self.plan = plan
+        self.reasons = reasons
+        self.action = action
+
+    def header(self):
+        """Value of the X-Cost-Guard response header."""
+        return f"{self.action}; cost={self.plan.cost}; rows={self.plan.rows}; reasons={', '.join(self.reasons)}"
+
+    def to_dict(self):
+        return dict(self.plan.to_dict(), action=self.action, reasons=self.reasons)
+
+
+class PlanCache:
+    """LRU of PlanEstimates by (SQL fingerprint, literals), with a TTL."""
+
+    def __init__(self, max_entries=COST_GUARD_PLAN_CACHE_SIZE, ttl=COST_GUARD_PLAN_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None and time.time() - plan.explained_at >= self.ttl:
+                del self._entries[key]
+                plan = None
+            if plan is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return plan
+
+    def put(self, key, plan):
+        with self._lock:
+            self._entries[key] = plan
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+plan_cache = PlanCache()
+
+metrics.register_cache("query_plan", lambda: plan_cache.stats())
+
+
+async def explain_plan(connection, sql_query):
+    """
+    Run EXPLAIN PLAN for a query on an async connection and read the
+    estimates back from PLAN_TABLE. The plan rows are rolled back afterwards.
+
+    Bind placeholders stay in the statement without values: EXPLAIN PLAN
+    fails when given binds, and the plan doesn't depend on their values.
+
+    Returns:
+        PlanEstimate: The estimates
+    """
+    statement_id = uuid.uuid4().hex[:30]
+    statement = sql_query.strip().rstrip(";").strip()
+    cursor = connection.cursor()
+    try:
+        with EXPLAIN_SECONDS.time():
+            await cursor.execute(f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {statement}")
+            await cursor.execute(_PLAN_SUMMARY, statement_id=statement_id)
+            cost, rows, cartesian = await cursor.fetchone()
+    finally:
+        cursor.close()
+        await connection.rollback()
+    return PlanEstimate(cost or 0, rows or 0, bool(cartesian))
+
+
+def _over_limits(plan):
+    reasons = []
+    if plan.cost > COST_GUARD_MAX_COST:
+        reasons.append(f"cost {plan.cost} > {COST_GUARD_MAX_COST}")
+    if plan.rows > COST_GUARD_MAX_ROWS:
+        reasons.append(f"rows {plan.rows} > {COST_GUARD_MAX_ROWS}")
+    if COST_GUARD_FLAG_CARTESIAN and plan.cartesian:
+        reasons.append("cartesian join")
+    return reasons
+
+
+async def assess_query(connection, sql_query, mode=None):
+    """
+    Check a query's estimated plan before it runs, explaining it on the
+    given connection unless its plan is cached.
+
+    A query that can't be explained is let through: the guard must not
+    take /execute_sql down with it. An EXPLAIN that runs past the call
+    timeout is different: the connection may still be busy with it, and
+    the query itself would likely time out too, so the error is raised for
+    the caller to discard the connection and report the timeout.
+
+    Args:
+        mode (str, optional): One of COST_GUARD_MODES; COST_GUARD_MODE by default
+
+    Returns:
+        CostAssessment or None: None when the guard is off or the query couldn't be explained
+
+    Raises:
+        QueryTooExpensiveError: If mode is "reject" and the plan is over the limits
+        oracledb.Error: If explaining the query ran past the call timeout
+    """
+    mode = mode or COST_GUARD_MODE
+    if mode == "off":
+        return None
+
+    fingerprint, literals = normalize_sql(sql_query)
+    key = (fingerprint, tuple(literals))
+    plan = plan_cache.get(key)
+    if plan is None:
+        try:
+            plan = await explain_plan(connection, sql_query)
+        except oracledb.Error as e:
+            if is_call_timeout(e):
+                COST_GUARD_DECISIONS.inc(action="timeout")
+                raise
+            logger.warning(f"Cost guard could not explain the query, letting it run: {str(e)}")
+            COST_GUARD_DECISIONS.inc(action="error")
+            return None
+        plan_cache.put(key, plan)
+
+    reasons = _over_limits(plan)
+    assessment = CostAssessment(plan, reasons, mode if reasons else "allow")
+    COST_GUARD_DECISIONS.inc(action=assessment.action)
+    if assessment.action == "reject":
+        raise QueryTooExpensiveError(assessment)
+    if reasons:
+        logger.warning(f"Expensive query ({assessment.header()}): {sql_query[:200]}")
+    return assessment
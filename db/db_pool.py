@@ -1,22 +1,300 @@
+import asyncio
+import logging
+import threading
+import time
 import oracledb
+from contextlib import asynccontextmanager, contextmanager
 from config import DB_USER, DB_PWD, DSN, WALLET_DIR, WALLET_PWD
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# The async pool serves /execute_sql. The sync pool serves the code that
+# can only use a blocking connection: OracleVS searches (up to four per
+# request, in parallel) and the schema loader.
+DB_POOL_MIN = 2
+DB_POOL_MAX = 20
+DB_SYNC_POOL_MAX = 10
+# Connections opened at a time when the pool grows
+DB_POOL_INCREMENT = 2
+# Idle connections above DB_POOL_MIN are closed after this many seconds
+DB_POOL_IDLE_TIMEOUT_SECONDS = 300
+# Longest wait for a free connection; past it the caller gets PoolExhaustedError
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = 5
+# Statements kept parsed per connection
+DB_STATEMENT_CACHE_SIZE = 50
+# A connection idle for longer than this is pinged when it is handed out
+DB_POOL_PING_INTERVAL_SECONDS = 60
+# How often the background health check pings one connection of each pool (0: never)
+DB_POOL_HEALTH_CHECK_INTERVAL_SECONDS = 30
+
+POOL_WAIT_SECONDS = metrics.histogram(
+    "db_pool_acquire_duration_seconds", "Time spent waiting for a pooled connection", ["pool"]
+)
+POOL_TIMEOUTS = metrics.counter(
+    "db_pool_acquire_timeouts_total", "Connection requests that timed out on a full pool", ["pool"]
+)
+POOL_CONNECTIONS = metrics.gauge("db_pool_connections", "Pooled connections by state", ["pool", "state"])
+
+# oracledb error raised when wait_timeout passes without a free connection
+_POOL_TIMEOUT_CODE = "DPY-4005"
+# oracledb errors raised when a call runs past the connection's call_timeout
+_CALL_TIMEOUT_CODES = {"DPY-4024", "DPI-1067", "ORA-03156", "ORA-01013"}
 
 db_pool = None
+async_pool = None
+_health_task = None
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection became free within DB_POOL_ACQUIRE_TIMEOUT_SECONDS."""
+
+
+class PoolStats:
+    """Acquire counts, waits and the last health check of one pool."""
+
+    def __init__(self, name):
+        self.name = name
+        self.acquires = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.health = None
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds, timed_out=False):
+        POOL_WAIT_SECONDS.observe(seconds, pool=self.name)
+        if timed_out:
+            POOL_TIMEOUTS.inc(pool=self.name)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.acquires += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_health(self, ok, latency, error=None):
+        self.health = {
+            "ok": ok,
+            "checked_at": time.time(),
+            "latency_ms": round(latency * 1000, 3),
+            "error": error,
+        }
+
+    def to_dict(self, pool):
+        with self._lock:
+            attempts = self.acquires + self.timeouts
+            stats = {
+                "initialized": pool is not None,
+                "acquires": self.acquires,
+                "timeouts": self.timeouts,
+                "wait_ms_mean": round(self.wait_seconds_total / attempts * 1000, 3) if attempts else 0.0,
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+                "health": self.health,
+            }
+        if pool is not None:
+            stats.update({
+                "min": pool.min,
+                "max": pool.max,
+                "increment": pool.increment,
+                "opened": pool.opened,
+                "busy": pool.busy,
+                "wait_timeout_ms": pool.wait_timeout,
+                "idle_timeout_seconds": pool.timeout,
+                "statement_cache_size": pool.stmtcachesize,
+            })
+        return stats
+
+
+sync_stats = PoolStats("sync")
+async_stats = PoolStats("async")
+
+
+def _pool_params(max_size):
+    return dict(
+        user=DB_USER,
+        password=DB_PWD,
+        dsn=DSN,
+        min=min(DB_POOL_MIN, max_size),
+        max=max_size,
+        increment=DB_POOL_INCREMENT,
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        wait_timeout=int(DB_POOL_ACQUIRE_TIMEOUT_SECONDS * 1000),
+        timeout=DB_POOL_IDLE_TIMEOUT_SECONDS,
+        ping_interval=DB_POOL_PING_INTERVAL_SECONDS,
+        stmtcachesize=DB_STATEMENT_CACHE_SIZE,
+        wallet_location=WALLET_DIR,
+        wallet_password=WALLET_PWD
+    )
+
+
+def _is_pool_timeout(error):
+    args = getattr(error, "args", ())
+    return bool(args) and getattr(args[0], "full_code", None) == _POOL_TIMEOUT_CODE
+
+
+def is_call_timeout(error):
+    """
+    Whether error is a call that ran past the connection's call_timeout. The
+    connection may still be busy server-side, so it shouldn't be reused.
+    """
+    args = getattr(error, "args", ())
+    return bool(args) and getattr(args[0], "full_code", None) in _CALL_TIMEOUT_CODES
+
 
 def init_db_pool():
     global db_pool
     if db_pool is None:
-        db_pool = oracledb.create_pool(
-            user=DB_USER,
-            password=DB_PWD,
-            dsn=DSN,
-            min=2,
-            max=10,
-            increment=1,
-            wallet_location=WALLET_DIR,
-            wallet_password=WALLET_PWD
-        )
+        db_pool = oracledb.create_pool(**_pool_params(DB_SYNC_POOL_MAX))
+
+def init_async_pool():
+    """Create the async pool; call from the running event loop (e.g. app startup)."""
+    global async_pool
+    if async_pool is None:
+        async_pool = oracledb.create_pool_async(**_pool_params(DB_POOL_MAX))
 
 def get_connection():
+    """
+    Raises:
+        PoolExhaustedError: If no connection became free in time
+    """
     global db_pool
-    return db_pool.acquire()
+    start = time.perf_counter()
+    try:
+        connection = db_pool.acquire()
+    except oracledb.Error as e:
+        if _is_pool_timeout(e):
+            sync_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise PoolExhaustedError("No database connection became available in time") from e
+        raise
+    sync_stats.record_wait(time.perf_counter() - start)
+    return connection
+
+def release_connection(connection):
+    """Return a connection obtained from get_connection() to the pool."""
+    global db_pool
+    db_pool.release(connection)
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the pool for the duration of a with-block and
+    always hand it back, even if the body raises.
+    """
+    connection = get_connection()
+    try:
+        yield connection
+    finally:
+        release_connection(connection)
+
+async def get_async_connection():
+    """
+    Borrow a connection from the async pool; hand it back with release_async_connection().
+
+    Raises:
+        PoolExhaustedError: If no connection became free in time
+        RuntimeError: If init_async_pool() hasn't run
+    """
+    if async_pool is None:
+        raise RuntimeError("Async database pool is not initialized")
+    start = time.perf_counter()
+    try:
+        connection = await async_pool.acquire()
+    except oracledb.Error as e:
+        if _is_pool_timeout(e):
+            async_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise PoolExhaustedError("No database connection became available in time") from e
+        raise
+    async_stats.record_wait(time.perf_counter() - start)
+    return connection
+
+async def release_async_connection(connection, discard=False):
+    """Hand a connection back; discard=True closes it instead (e.g. after a call timeout)."""
+    if discard:
+        await async_pool.drop(connection)
+    else:
+        await async_pool.release(connection)
+
+@asynccontextmanager
+async def async_pooled_connection():
+    """pooled_connection for the async pool."""
+    connection = await get_async_connection()
+    try:
+        yield connection
+    finally:
+        await release_async_connection(connection)
+
+
+def _ping_sync_pool():
+    connection = db_pool.acquire()
+    try:
+        connection.ping()
+    except Exception:
+        # Don't put a dead connection back in circulation
+        db_pool.drop(connection)
+        raise
+    db_pool.release(connection)
+
+async def _ping_async_pool():
+    connection = await async_pool.acquire()
+    try:
+        await connection.ping()
+    except Exception:
+        await async_pool.drop(connection)
+        raise
+    await async_pool.release(connection)
+
+async def check_pool_health():
+    """Ping one connection of each initialized pool and record the outcome in the pool stats."""
+    checks = []
+    if async_pool is not None:
+        checks.append((async_stats, _ping_async_pool))
+    if db_pool is not None:
+        checks.append((sync_stats, lambda: asyncio.to_thread(_ping_sync_pool)))
+    for stats, ping in checks:
+        start = time.perf_counter()
+        try:
+            await ping()
+            stats.record_health(True, time.perf_counter() - start)
+        except Exception as e:
+            logger.warning(f"Database pool {stats.name} failed its health check: {str(e)}")
+            stats.record_health(False, time.perf_counter() - start, str(e))
+
+async def _health_check_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        await check_pool_health()
+
+def start_health_checks():
+    """Start pinging the pools every DB_POOL_HEALTH_CHECK_INTERVAL_SECONDS; call from the event loop."""
+    global _health_task
+    if DB_POOL_HEALTH_CHECK_INTERVAL_SECONDS and _health_task is None:
+        _health_task = asyncio.get_running_loop().create_task(
+            _health_check_loop(DB_POOL_HEALTH_CHECK_INTERVAL_SECONDS)
+        )
+
+async def close_pools():
+    """Stop the health checks and close both pools (app shutdown)."""
+    global db_pool, async_pool, _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        _health_task = None
+    if async_pool is not None:
+        await async_pool.close(force=True)
+        async_pool = None
+    if db_pool is not None:
+        await asyncio.to_thread(db_pool.close, True)
+        db_pool = None
+
+def pool_stats():
+    return {"async": async_stats.to_dict(async_pool), "sync": sync_stats.to_dict(db_pool)}
+
+def _collect_pool_metrics():
+    for name, pool in (("sync", db_pool), ("async", async_pool)):
+        if pool is not None:
+            POOL_CONNECTIONS.set(pool.busy, pool=name, state="busy")
+            POOL_CONNECTIONS.set(pool.opened, pool=name, state="open")
+            POOL_CONNECTIONS.set(pool.max, pool=name, state="max")
+
+metrics.register_collector(_collect_pool_metrics)
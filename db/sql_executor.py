@@ -0,0 +1,495 @@
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import oracledb
+
+from db import cost_guard
+from db.db_pool import get_async_connection, is_call_timeout, release_async_connection
+from cache.result_cache import get_result_cache, result_cache_key
+from utils.sql_utils import analyze_sql, tokenize_sql
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:  # optional, only needed for format="arrow"
+    pyarrow = None
+
+# Rows fetched per round-trip when streaming results. prefetchrows is set one
+# higher so the first fetchmany() after execute() needs no extra round-trip.
+STREAM_ARRAYSIZE = 1000
+
+# "rows":     {"results": [{col: value, ...}, ...]}  (default, original shape)
+# "columnar": {"columns": [...], "data": [[col 1 values], [col 2 values], ...], "row_count": n}
+# "arrow":    Apache Arrow IPC stream (requires pyarrow)
+RESULT_FORMATS = ("rows", "columnar", "arrow")
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Hard cap on rows returned by one buffered (non-streaming) response, and the
+# largest page a client may ask for. Anything beyond is reported as truncated
+# with a next_page_token to continue from.
+EXECUTE_MAX_ROWS = 10000
+# Streaming keeps memory flat but still holds a pooled connection, so it is
+# capped too, just much higher.
+STREAM_MAX_ROWS = 1000000
+
+# Longest one database call (execute or fetch round-trip) of /execute_sql may
+# take; the cost guard's "limit" mode uses its own, shorter timeout
+EXECUTE_CALL_TIMEOUT_SECONDS = 60
+
+# Statements /execute_sql runs: queries only
+QUERY_STATEMENTS = ("SELECT", "WITH")
+# Queries whose paging-relevant structure is remembered, by exact text
+QUERY_SHAPE_CACHE_SIZE = 1024
+
+_DATETIME_TYPES = {
+    oracledb.DB_TYPE_DATE,
+    oracledb.DB_TYPE_TIMESTAMP,
+    oracledb.DB_TYPE_TIMESTAMP_LTZ,
+    oracledb.DB_TYPE_TIMESTAMP_TZ,
+}
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised for a result format that is unknown or whose dependency is missing."""
+
+
+class InvalidPageTokenError(ValueError):
+    """Raised for a page token that is malformed or belongs to another query."""
+
+
+class UnsupportedStatementError(ValueError):
+    """Raised for SQL that is not a query (SELECT or WITH)."""
+
+
+class QueryTimeoutError(TimeoutError):
+    """Raised when a database call ran past the connection's call timeout."""
+
+
+def _strip_statement(sql_query):
+    return sql_query.strip().rstrip(";").strip()
+
+
+def _query_hash(sql_query):
+    return hashlib.sha1(_strip_statement(sql_query).encode("utf-8")).hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=QUERY_SHAPE_CACHE_SIZE)
+def query_shape(sql_query):
+    """
+    What paging needs to know about a query, read from its tokens outside
+    parentheses. Strings, quoted names and comments are single tokens, so
+    words inside them never count, nor do columns named OFFSET or FETCH.
+
+    Returns:
+        tuple: (first keyword, upper-cased or None; whether it has a FETCH /
+                OFFSET row limit; whether it has an ORDER BY)
+    """
+    tokens = [(kind, text.upper()) for kind, text, _ in tokenize_sql(sql_query) if kind != "comment"]
+    first = next((token for token in tokens if token[1] != "("), None)
+    statement = first[1] if first is not None and first[0] == "word" else None
+
+    top = []
+    depth = 0
+    for kind, text in tokens:
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            top.append((kind, text))
+
+    words = [text if kind == "word" else None for kind, text in top]
+    limited = ordered = False
+    for i, word in enumerate(words):
+        following = next((w for w in words[i + 1:] if w is not None), None)
+        if word == "ORDER":
+            ordered = ordered or following in ("BY", "SIBLINGS")
+        elif word == "FETCH":
+            limited = limited or following in ("FIRST", "NEXT")
+        elif word == "OFFSET":
+            # OFFSET <expression> ROW[S]; the expression has no words outside parentheses
+            limited = limited or following in ("ROW", "ROWS")
+    return statement, limited, ordered
+
+
+def check_statement(sql_query):
+    """
+    Raises:
+        UnsupportedStatementError: If the SQL is not a SELECT or WITH query
+    """
+    statement = query_shape(_strip_statement(sql_query))[0]
+    if statement not in QUERY_STATEMENTS:
+        raise UnsupportedStatementError(
+            f"Only {' / '.join(QUERY_STATEMENTS)} queries can be executed, got {statement or 'no statement'}"
+        )
+
+
+def paginate_sql(sql_query):
+    """
+    Rewrite a query so only one window of its rows is fetched.
+
+    The row-limiting clause is appended directly when the query has none
+    (on a new line, so a trailing -- comment can't swallow it); wrapping in
+    SELECT * FROM (...) is only used when the query already limits rows at
+    the top level, since it fails on joins that select two columns of the
+    same name. The window is passed as the :row_offset / :row_limit binds.
+
+    Raises:
+        UnsupportedStatementError: If the SQL is not a SELECT or WITH query
+    """
+    statement = _strip_statement(sql_query)
+    check_statement(statement)
+    clause = "OFFSET :row_offset ROWS FETCH NEXT :row_limit ROWS ONLY"
+    if query_shape(statement)[1]:
+        return f"SELECT * FROM (\n{statement}\n) {clause}"
+    return f"{statement}\n{clause}"
+
+
+def is_ordered(sql_query):
+    """Whether the query has a top-level ORDER BY, so its pages are stable."""
+    return query_shape(_strip_statement(sql_query))[2]
+
+
+def encode_page_token(sql_query, offset, page_size):
+    payload = json.dumps({"o": offset, "n": page_size, "q": _query_hash(sql_query)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_token(sql_query, page_token):
+    """
+    Returns:
+        tuple: (offset, page size) encoded in the token
+
+    Raises:
+        InvalidPageTokenError: If the token is malformed or was issued for different SQL
+    """
+    try:
+        padded = page_token + "=" * (-len(page_token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset, page_size, query_hash = int(payload["o"]), int(payload["n"]), payload["q"]
+    except Exception:
+        raise InvalidPageTokenError("Malformed page_token")
+    if query_hash != _query_hash(sql_query):
+        raise InvalidPageTokenError("page_token was issued for a different SQL query")
+    if offset < 0 or page_size <= 0:
+        raise InvalidPageTokenError("Malformed page_token")
+    return offset, page_size
+
+
+def resolve_page(sql_query, page_size=None, page_token=None):
+    """
+    Work out the row window for a request.
+
+    Returns:
+        tuple: (offset, limit), limit never above EXECUTE_MAX_ROWS
+
+    Raises:
+        UnsupportedStatementError: If the SQL is not a SELECT or WITH query
+        InvalidPageTokenError: For a bad page_token, or one for a query without ORDER BY
+        ValueError: For a non-positive page_size
+    """
+    check_statement(sql_query)
+    offset, limit = 0, EXECUTE_MAX_ROWS
+    if page_token:
+        offset, limit = decode_page_token(sql_query, page_token)
+        if not is_ordered(sql_query):
+            raise InvalidPageTokenError("page_token needs a query with ORDER BY; without one pages may overlap")
+    if page_size is not None:
+        page_size = int(page_size)
+        if page_size <= 0:
+            raise ValueError("page_size must be a positive integer")
+        limit = page_size
+    return offset, min(limit, EXECUTE_MAX_ROWS)
+
+
+def _json_default(value):
+    """JSON encoder hook for the Oracle types json can't encode natively."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(value):
+    """Serialize to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default)
+    return json.dumps(value, default=_json_default).encode("utf-8")
+
+
+def _inline_lobs(cursor, metadata):
+    """
+    Output type handler: fetch CLOB/BLOB values inline instead of as LOB
+    locators, which the async driver could only read with an extra await
+    (and round-trip) per value.
+    """
+    if metadata.type_code in (oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB):
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    if metadata.type_code == oracledb.DB_TYPE_BLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+    return None
+
+
+def _isoformat_dates(cursor, metadata):
+    """
+    Output type handler: have the driver hand back DATE/TIMESTAMP columns as
+    ISO-8601 strings while fetching, instead of converting row by row later.
+    """
+    if metadata.type_code in _DATETIME_TYPES:
+        return cursor.var(
+            metadata.type_code,
+            arraysize=cursor.arraysize,
+            outconverter=lambda value: value.isoformat()
+        )
+    return _inline_lobs(cursor, metadata)
+
+
+def check_format(result_format, stream=False):
+    """
+    Raises:
+        UnsupportedFormatError: If the format can't be served
+    """
+    if result_format not in RESULT_FORMATS:
+        raise UnsupportedFormatError(
+            f"Unknown format '{result_format}', expected one of: {', '.join(RESULT_FORMATS)}"
+        )
+    if result_format == "arrow":
+        if stream:
+            raise UnsupportedFormatError("format 'arrow' cannot be combined with stream")
+        if pyarrow is None:
+            raise UnsupportedFormatError("format 'arrow' requires the pyarrow package")
+
+
+async def open_query(sql_query, result_format="rows", arraysize=STREAM_ARRAYSIZE, window=None, binds=None,
+                     guard_mode=None):
+    """
+    Execute a query on a connection from the async pool and hand back the
+    open cursor for incremental fetching.
+
+    The query's plan is checked by the cost guard first, on the same
+    connection. When the guard limits it, the window is capped to
+    COST_GUARD_LIMIT_ROWS and the call timeout shortened. Every call on the
+    connection is bounded by its call_timeout.
+
+    The connection stays checked out until the caller passes it to
+    close_query (iter_ndjson does this when it finishes).
+
+    Args:
+        window (tuple, optional): (offset, limit) to fetch via paginate_sql
+        binds (dict, optional): Bind values for the query
+        guard_mode (str, optional): Cost guard mode, COST_GUARD_MODE by default
+
+    Returns:
+        tuple: (connection, cursor, column names, CostAssessment or None)
+
+    Raises:
+        UnsupportedStatementError: If a window is given and the SQL is not a SELECT or WITH query
+        PoolExhaustedError: If no pooled connection became free in time
+        QueryTooExpensiveError: If the cost guard rejected the query
+        QueryTimeoutError: If a call ran past the call timeout
+    """
+    connection = await get_async_connection()
+    try:
+        connection.call_timeout = int(EXECUTE_CALL_TIMEOUT_SECONDS * 1000)
+        assessment = await cost_guard.assess_query(connection, sql_query, guard_mode)
+        if assessment is not None and assessment.action == "limit":
+            connection.call_timeout = int(cost_guard.COST_GUARD_LIMIT_TIMEOUT_SECONDS * 1000)
+            offset, limit = window if window is not None else (0, cost_guard.COST_GUARD_LIMIT_ROWS)
+            window = (offset, min(limit, cost_guard.COST_GUARD_LIMIT_ROWS))
+            arraysize = min(arraysize, cost_guard.COST_GUARD_LIMIT_ROWS)
+
+        cursor = connection.cursor()
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        # Arrow keeps native timestamps; JSON formats want strings
+        cursor.outputtypehandler = _inline_lobs if result_format == "arrow" else _isoformat_dates
+        binds = dict(binds or {})
+        if window is not None:
+            offset, limit = window
+            await cursor.execute(paginate_sql(sql_query), dict(binds, row_offset=offset, row_limit=limit))
+        else:
+            await cursor.execute(sql_query, binds)
+        columns = [col[0] for col in cursor.description]
+        return connection, cursor, columns, assessment
+    except BaseException as e:
+        timed_out = is_call_timeout(e)
+        # A timed-out connection may still be busy server-side; don't reuse it
+        await release_async_connection(connection, discard=timed_out)
+        if timed_out:
+            raise QueryTimeoutError("The query ran past its call timeout") from e
+        raise
+
+
+async def close_query(connection, cursor, discard=False):
+    try:
+        cursor.close()
+    finally:
+        await release_async_connection(connection, discard=discard)
+
+
+async def open_stream(sql_query, result_format="rows", binds=None, guard_mode=None):
+    """open_query for streaming: the whole result, up to STREAM_MAX_ROWS rows."""
+    return await open_query(sql_query, result_format, window=(0, STREAM_MAX_ROWS), binds=binds, guard_mode=guard_mode)
+
+
+async def iter_ndjson(connection, cursor, columns, result_format="rows"):
+    """
+    Yield query results as newline-delimited JSON.
+
+    In "rows" format each line is a {column: value} object. In "columnar"
+    format the first line is {"columns": [...]} and each following line is a
+    bare array of values, so column names are not repeated per row.
+
+    Rows are pulled with fetchmany() and each batch is serialized into one
+    chunk, so memory stays bounded by the batch size regardless of how many
+    rows the query returns. The connection is released when the generator
+    finishes or is closed early (e.g. the client disconnects), and dropped
+    if a fetch timed out.
+    """
+    timed_out = False
+    try:
+        if result_format == "columnar":
+            yield dumps_json({"columns": columns}) + b"\n"
+        else:
+            cursor.rowfactory = lambda *values: dict(zip(columns, values))
+
+        while True:
+            rows = await cursor.fetchmany()
+            if not rows:
+                break
+            yield b"".join(dumps_json(row) + b"\n" for row in rows)
+    except oracledb.Error as e:
+        timed_out = is_call_timeout(e)
+        raise
+    finally:
+        await close_query(connection, cursor, discard=timed_out)
+
+
+def _arrow_ipc(columns, rows):
+    table = pyarrow.table({
+        name: list(values)
+        for name, values in zip(columns, zip(*rows) if rows else [()] * len(columns))
+    })
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+async def fetch_results(sql_query, result_format="rows", page_size=None, page_token=None, binds=None, use_cache=True,
+                        guard_mode=None):
+    """
+    Execute one page of a query and return it serialized.
+
+    At most EXECUTE_MAX_ROWS rows are returned. One extra row is fetched to
+    tell whether more remain; if so the response is marked truncated and,
+    when the query has an ORDER BY, carries a next_page_token for the
+    following page. Without one Oracle may return the rows in a different
+    order each time, so later pages could repeat or skip rows.
+
+    Pages are served from the result cache when possible, keyed by the SQL
+    fingerprint, literals, binds, format and window; a hit never touches
+    the connection pool. Pages cut short by the cost guard are not cached.
+
+    Args:
+        sql_query (str): The SQL to run
+        result_format (str): One of RESULT_FORMATS
+        page_size (int, optional): Rows per page, capped at EXECUTE_MAX_ROWS
+        page_token (str, optional): Token from a previous page of the same SQL
+        binds (dict, optional): Bind values for the query
+        use_cache (bool): Whether to read and fill the result cache
+        guard_mode (str, optional): Cost guard mode, COST_GUARD_MODE by default
+
+    Returns:
+        tuple: (body bytes, media type, extra response headers)
+
+    Raises:
+        QueryTooExpensiveError: If the cost guard rejected the query
+        QueryTimeoutError: If a database call ran past its timeout
+    """
+    offset, limit = resolve_page(sql_query, page_size, page_token)
+
+    cache = get_result_cache()
+    cache_key = None
+    if use_cache:
+        # Lexed once for both the key and the tables read
+        analysis = analyze_sql(sql_query)
+        cache_key = result_cache_key(analysis, binds, format=result_format, offset=offset, limit=limit)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            body, media_type, headers = cached
+            return body, media_type, dict(headers, **{"X-Cache": "HIT"})
+
+    body, media_type, headers, assessment = await _fetch_page(sql_query, result_format, offset, limit, binds, guard_mode)
+    if use_cache and (assessment is None or assessment.action != "limit"):
+        cache.put(cache_key, cache.tables_for(analysis), body, media_type, headers)
+        headers = dict(headers, **{"X-Cache": "MISS"})
+    return body, media_type, headers
+
+
+async def _fetch_page(sql_query, result_format, offset, limit, binds, guard_mode=None):
+    connection, cursor, columns, assessment = await open_query(
+        sql_query, result_format, arraysize=min(limit + 1, STREAM_ARRAYSIZE),
+        window=(offset, limit + 1), binds=binds, guard_mode=guard_mode
+    )
+    if assessment is not None and assessment.action == "limit":
+        # open_query capped the window; keep its last row to detect truncation
+        limit = min(limit, cost_guard.COST_GUARD_LIMIT_ROWS - 1)
+    timed_out = False
+    try:
+        if result_format == "rows":
+            cursor.rowfactory = lambda *values: dict(zip(columns, values))
+        rows = await cursor.fetchall()
+    except oracledb.Error as e:
+        timed_out = is_call_timeout(e)
+        if timed_out:
+            raise QueryTimeoutError("The query ran past its call timeout") from e
+        raise
+    finally:
+        await close_query(connection, cursor, discard=timed_out)
+
+    # Serializing up to EXECUTE_MAX_ROWS rows is CPU work; keep it off the event loop
+    body, media_type, headers = await asyncio.to_thread(
+        _serialize_page, sql_query, result_format, columns, rows, offset, limit
+    )
+    if assessment is not None and assessment.action != "allow":
+        headers["X-Cost-Guard"] = assessment.header()
+    return body, media_type, headers, assessment
+
+
+def _serialize_page(sql_query, result_format, columns, rows, offset, limit):
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    next_page_token = None
+    if truncated and is_ordered(sql_query):
+        next_page_token = encode_page_token(sql_query, offset + limit, limit)
+    headers = {"X-Truncated": "true" if truncated else "false"}
+    if next_page_token:
+        headers["X-Next-Page-Token"] = next_page_token
+
+    if result_format == "rows":
+        body = {"results": rows}
+    elif result_format == "arrow":
+        return _arrow_ipc(columns, rows), ARROW_MEDIA_TYPE, headers
+    else:
+        body = {
+            "columns": columns,
+            "data": [list(values) for values in zip(*rows)] if rows else [[] for _ in columns],
+            "row_count": len(rows)
+        }
+    body["truncated"] = truncated
+    body["next_page_token"] = next_page_token
+    return dumps_json(body), "application/json", headers
@@ -0,0 +1,457 @@
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Outbound LLM calls in flight at once, across all models
+LLM_MAX_CONCURRENCY = 16
+# ... and per model; models not listed get LLM_DEFAULT_MODEL_CONCURRENCY
+LLM_MODEL_CONCURRENCY = {}
+LLM_DEFAULT_MODEL_CONCURRENCY = 8
+# Longest wait for one attempt (hedges included) before it counts as failed
+LLM_TIMEOUT_SECONDS = 60
+# Retries after a timeout or a retryable error, with jittered exponential backoff
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BASE_DELAY_SECONDS = 0.5
+LLM_RETRY_MAX_DELAY_SECONDS = 8
+# HTTP statuses worth retrying: throttling and transient server errors
+LLM_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Send a second, identical request when the first has been running longer than
+# this percentile of the model's recent latencies, and use whichever answers
+# first. None disables hedging.
+LLM_HEDGE_PERCENTILE = None
+# Recent calls needed before hedging kicks in, and how many are remembered
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+
+LLM_GATEWAY_EVENTS = metrics.counter(
+    "llm_gateway_events_total",
+    "Gateway interventions per model: coalesced, retry, timeout, hedge, hedge_won, early_stop",
+    ["model", "event"]
+)
+LLM_IN_FLIGHT = metrics.gauge("llm_gateway_in_flight", "Outbound LLM calls in flight per model", ["model"])
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call didn't answer within LLM_TIMEOUT_SECONDS."""
+
+
+def is_retryable(error):
+    """Timeouts, network errors and throttling / 5xx responses are worth another try."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in LLM_RETRYABLE_STATUS
+    # requests / urllib3 network errors derive from OSError
+    return isinstance(error, OSError)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff, so throttled callers don't come back in lockstep."""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY_SECONDS, LLM_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+_global_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# Every running call holds a global slot, so this many workers never queue
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
+
+class ModelChannel:
+    """
+    Everything between the agents and one model's client: the concurrency
+    limits, coalescing of identical in-flight requests, timeouts, retries and
+    hedging.
+
+    Calls run on a shared worker pool while the caller waits, so a call that
+    times out is abandoned rather than interrupted; it keeps its concurrency
+    slot until it really finishes, so the limits hold.
+    """
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        limit = LLM_MODEL_CONCURRENCY.get(model_id, LLM_DEFAULT_MODEL_CONCURRENCY)
+        self._slots = threading.BoundedSemaphore(limit)
+        self._in_flight = {}
+        self._streams = {}
+        self._in_flight_lock = threading.Lock()
+        self._latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+        self._latency_lock = threading.Lock()
+        self.running = 0
+        self._running_lock = threading.Lock()
+
+    def _event(self, event):
+        LLM_GATEWAY_EVENTS.inc(model=self.model_id, event=event)
+
+    def _acquire(self, blocking=True):
+        # Model slot first, so callers queued on a busy model don't hold global slots
+        if not self._slots.acquire(blocking):
+            return False
+        if not _global_slots.acquire(blocking):
+            self._slots.release()
+            return False
+        with self._running_lock:
+            self.running += 1
+        return True
+
+    def _release(self):
+        with self._running_lock:
+            self.running -= 1
+        _global_slots.release()
+        self._slots.release()
+
+    def _run(self, func):
+        """Worker side of a call; owns the slots acquired for it."""
+        start = time.perf_counter()
+        try:
+            result = func()
+        finally:
+            self._release()
+        with self._latency_lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def hedge_delay(self):
+        """Seconds after which a call gets hedged, or None."""
+        if LLM_HEDGE_PERCENTILE is None:
+            return None
+        with self._latency_lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE / 100))]
+
+    def _attempt(self, func):
+        self._acquire()
+        primary = _executor.submit(self._run, func)
+        pending = {primary}
+        deadline = time.monotonic() + LLM_TIMEOUT_SECONDS
+
+        delay = self.hedge_delay()
+        if delay is not None and delay < LLM_TIMEOUT_SECONDS:
+            done, _ = wait(pending, timeout=delay)
+            # Don't hedge when saturated: the extra load would make the tail worse
+            if not done and self._acquire(blocking=False):
+                self._event("hedge")
+                pending.add(_executor.submit(self._run, func))
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._event("hedge_won")
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        self._event("timeout")
+        raise LLMTimeoutError(f"{self.model_id} did not answer within {LLM_TIMEOUT_SECONDS}s")
+
+    def _with_retries(self, func):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return self._attempt(func)
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"LLM call to {self.model_id} failed ({str(e)}), retrying in {delay:.2f}s")
+                self._event("retry")
+                time.sleep(delay)
+
+    def call(self, key, func):
+        """
+        Run func (one model call) with limits, timeout, retries and hedging.
+        Concurrent calls with the same key share one execution and its result.
+        """
+        with self._in_flight_lock:
+            shared = self._in_flight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._in_flight[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            self._event("coalesced")
+            shared["done"].wait()
+            if shared["error"] is not None:
+                raise shared["error"]
+            return shared["result"]
+
+        try:
+            shared["result"] = self._with_retries(func)
+            return shared["result"]
+        except BaseException as e:
+            shared["error"] = e
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+            shared["done"].set()
+
+    def _join_stream(self, key, open_stream):
+        """The in-flight stream for key, opening it (on a worker) when there is none."""
+        with self._in_flight_lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream(self.model_id)
+            else:
+                shared.consumers += 1
+        if not leader:
+            self._event("coalesced")
+            return shared
+        self._acquire()
+        _executor.submit(self._pump, key, shared, open_stream)
+        return shared
+
+    def _drop_stream(self, key, shared):
+        """Stop handing out shared to new callers."""
+        with self._in_flight_lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def _leave_stream(self, key, shared):
+        with self._in_flight_lock:
+            shared.consumers -= 1
+            last = shared.consumers == 0
+            if last and self._streams.get(key) is shared:
+                del self._streams[key]
+        if last:
+            shared.finish()
+
+    def _pump(self, key, shared, open_stream):
+        """Worker side of a stream: reads it into shared and owns its slots."""
+        upstream = None
+        try:
+            shared.start()
+            upstream = open_stream()
+            for chunk in upstream:
+                if not shared.put(chunk):
+                    break
+            shared.finish()
+        except BaseException as e:
+            shared.finish(e)
+        finally:
+            self._drop_stream(key, shared)
+            # Also runs when every consumer stopped early: drop the model's stream
+            if upstream is not None and hasattr(upstream, "close"):
+                upstream.close()
+            self._release()
+
+    def stream(self, key, open_stream):
+        """
+        Iterate a streamed call under the concurrency limits. Concurrent streams
+        with the same key share one model stream: it is read on a worker and
+        every caller replays its chunks. A stream sending nothing for
+        LLM_TIMEOUT_SECONDS (before the first chunk or between two) fails with
+        LLMTimeoutError; the worker closes it once the stalled read returns.
+        Failures before the first chunk are retried like call(); once text has
+        been yielded an error is passed on.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            shared = self._join_stream(key, open_stream)
+            position = 0
+            try:
+                while True:
+                    chunk = shared.next(position, LLM_TIMEOUT_SECONDS)
+                    if chunk is _STALLED:
+                        self._event("timeout")
+                        self._drop_stream(key, shared)
+                        raise shared.error
+                    if chunk is None:
+                        return
+                    position += 1
+                    yield chunk
+            except Exception as e:
+                if position or attempt == LLM_MAX_RETRIES or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"LLM stream from {self.model_id} failed ({str(e)}), retrying in {delay:.2f}s")
+                self._event("retry")
+            finally:
+                self._leave_stream(key, shared)
+            time.sleep(delay)
+
+
+# Returned by _SharedStream.next to the caller that noticed the stream stalled
+_STALLED = object()
+
+
+class _SharedStream:
+    """
+    Chunks of one model stream, buffered for every caller coalesced onto it.
+    Closed when it ends, fails, stalls or loses its last caller; the worker
+    reading it stops at the next chunk after that.
+    """
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.chunks = []
+        self.error = None
+        self.closed = False
+        self.consumers = 1
+        # When the worker last made progress; None while it waits for a slot
+        self.progress_at = None
+        self.changed = threading.Condition()
+
+    def start(self):
+        with self.changed:
+            self.progress_at = time.monotonic()
+            self.changed.notify_all()
+
+    def put(self, chunk):
+        """Returns: bool, whether anyone still wants the stream."""
+        with self.changed:
+            if self.closed:
+                return False
+            self.chunks.append(chunk)
+            self.progress_at = time.monotonic()
+            self.changed.notify_all()
+            return True
+
+    def finish(self, error=None):
+        with self.changed:
+            if not self.closed:
+                self.closed = True
+                self.error = error
+                self.changed.notify_all()
+
+    def next(self, position, timeout):
+        """
+        Chunk number position, waiting until the stream has sent nothing for
+        timeout seconds.
+
+        Returns:
+            The chunk; None at the end of the stream; _STALLED to the caller
+            that found the stream stalled (its error is then an LLMTimeoutError)
+
+        Raises:
+            The stream's error, once the buffered chunks are replayed
+        """
+        with self.changed:
+            while position >= len(self.chunks) and not self.closed:
+                if self.progress_at is None:
+                    self.changed.wait()
+                    continue
+                remaining = self.progress_at + timeout - time.monotonic()
+                if remaining <= 0:
+                    self.finish(LLMTimeoutError(f"{self.model_id} stream sent nothing for {timeout}s"))
+                    return _STALLED
+                self.changed.wait(remaining)
+            if position < len(self.chunks):
+                return self.chunks[position]
+            if self.error is not None:
+                raise self.error
+            return None
+
+
+def request_key(model_id, messages, stop, kwargs, temperature=None):
+    """Identity of a model request, for coalescing and caching identical ones."""
+    payload = {
+        "model": model_id,
+        "messages": [(message.type, message.content) for message in messages],
+        "temperature": temperature,
+        "stop": stop,
+        "kwargs": kwargs,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Chat model that sends every call for one model through its ModelChannel.
+    get_llm() hands out one instance per chain; they share the model's client
+    and channel.
+
+    With a response cache, a prompt answered before is served from it
+    without a model call, streamed or not.
+
+    Streaming callers may pass until=callable: it gets the text of each
+    chunk and returns something truthy once the response is complete (e.g.
+    JSONObjectScanner.feed), and the model's stream is cut off there.
+    """
+
+    client: BaseChatModel
+    model_id: str
+    channel: Any
+    chain: Optional[str] = None
+    response_cache: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "gateway"
+
+    @property
+    def _identifying_params(self):
+        return {"model_id": self.model_id}
+
+    def _temperature(self, kwargs):
+        if "temperature" in kwargs:
+            return kwargs["temperature"]
+        model_kwargs = getattr(self.client, "model_kwargs", None) or {}
+        return model_kwargs.get("temperature", getattr(self.client, "temperature", None))
+
+    def _key(self, messages, stop, kwargs):
+        return request_key(self.model_id, messages, stop, kwargs, self._temperature(kwargs))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(key, self.chain)
+            if cached is not None:
+                return ChatResult(generations=[ChatGeneration(message=AIMessage(content=cached))])
+
+        result = self.channel.call(key, lambda: self.client._generate(messages, stop=stop, **kwargs))
+        if self.response_cache is not None and result.generations:
+            text = result.generations[0].message.content
+            if isinstance(text, str) and text:
+                self.response_cache.put(key, text)
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, until: Optional[Callable[[str], Any]] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, kwargs)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(key, self.chain)
+            if cached is not None:
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=cached))
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                return
+
+        parts = []
+        stream = self.channel.stream(key, lambda: self.client._stream(messages, stop=stop, **kwargs))
+        try:
+            for chunk in stream:
+                parts.append(chunk.text)
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                if until is not None and until(chunk.text):
+                    self.channel._event("early_stop")
+                    break
+        finally:
+            stream.close()
+        # Only complete responses are cached; an abandoned stream never gets here
+        if self.response_cache is not None and any(parts):
+            self.response_cache.put(key, "".join(parts))
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 20000
+# Rows kept in the SQLite file; the oldest writes are pruned past this
+EMBEDDING_CACHE_MAX_STORED_ENTRIES = 200000
+# Stay well under SQLite's bound-parameter limit
+_SQLITE_BATCH = 500
+
+EMBEDDING_SECONDS = metrics.histogram(
+    "embedding_request_duration_seconds", "Latency of embedding model calls (cache misses only)", ["kind"]
+)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that memoizes text -> vector.
+
+    Vectors are kept as float32 numpy arrays in an in-memory LRU and written
+    through to a SQLite file, so a restarted worker starts warm. The file
+    keeps at most max_stored_entries rows, dropping the oldest writes first.
+    Callers still get plain lists back, as LangChain (and OracleVS) expect.
+    """
+
+    def __init__(self, embeddings, model_id, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 max_stored_entries=EMBEDDING_CACHE_MAX_STORED_ENTRIES):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.max_stored_entries = max_stored_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        # Upper bound on the rows on disk (replaced keys are counted twice), so
+        # pruning never has to count the table on every write
+        self._stored = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._prune()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Embedding cache store unavailable, using memory only: {str(e)}")
+                self._db = None
+
+    def _prune(self):
+        """Delete the oldest rows once over max_stored_entries; call with the lock held."""
+        self._stored = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._stored > self.max_stored_entries:
+            # Down to 90%, so a full store isn't pruned again on every write
+            excess = self._stored - self.max_stored_entries * 9 // 10
+            # REPLACE gives a row a new rowid, so rowid order is write order
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (excess,)
+            )
+            self._stored -= excess
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        """Return {key: vector} for every key found in memory or on disk (memory only if the file can't be read)."""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if self._db is not None:
+                for start in range(0, len(missing), _SQLITE_BATCH):
+                    batch = missing[start:start + _SQLITE_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    try:
+                        rows = self._db.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                        ).fetchall()
+                    except sqlite3.Error as e:
+                        # The rest are misses: embedded again rather than failing the request
+                        logger.error(f"Failed to read the embedding cache: {str(e)}")
+                        break
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        found[key] = vector
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in items]
+                    )
+                    self._stored += len(items)
+                    if self._stored > self.max_stored_entries:
+                        self._prune()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist embeddings: {str(e)}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, sending only the uncached ones to the model."""
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(dict.fromkeys(keys))
+
+        # Deduplicate so repeated texts in one batch are embedded once
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                pending.setdefault(key, text)
+
+        with self._lock:
+            self.hits += len(texts) - sum(1 for key in keys if key in pending)
+            self.misses += len(pending)
+
+        if pending:
+            with EMBEDDING_SECONDS.time(kind="documents"):
+                vectors = self.embeddings.embed_documents(list(pending.values()))
+            new_items = [
+                (key, np.asarray(vector, dtype=np.float32))
+                for key, vector in zip(pending.keys(), vectors)
+            ]
+            self._store(new_items)
+            found.update(new_items)
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._lookup([key]).get(key)
+        with self._lock:
+            if vector is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if vector is not None:
+            return vector.tolist()
+
+        with EMBEDDING_SECONDS.time(kind="query"):
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        self._store([(key, vector)])
+        return vector.tolist()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._memory), "hits": self.hits, "misses": self.misses}
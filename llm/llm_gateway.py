@@ -1,38 +1,147 @@
+import threading
 from langchain_community.chat_models.oci_generative_ai import ChatOCIGenAI
 from langchain_community.embeddings.oci_generative_ai import OCIGenAIEmbeddings
+from llm.chat_gateway import GatewayChatModel, ModelChannel, LLM_IN_FLIGHT
+from llm.embedding_cache import CachedEmbeddings
+from llm.response_cache import LLMResponseCache, LLM_RESPONSE_CACHE_CHAINS
+from utils import metrics
+from utils.sql_utils import JSONObjectScanner
 from config import ENDPOINT, EMBEDDING_MODEL, GENERATE_MODEL, ORACLE_COMPARTMENT_ID
 
-def get_llm():
+embedder = None
+_embedder_lock = threading.Lock()
+response_cache = None
+_response_cache_lock = threading.Lock()
+# model id -> (client, ModelChannel), shared by every chain using the model
+channels = {}
+# (model id, chain) -> GatewayChatModel
+llms = {}
+_llms_lock = threading.Lock()
+
+def get_llm(model_id=GENERATE_MODEL, chain=None):
     """
-    Get the Language Model client with proper configuration
+    Get the shared Language Model client for a model.
+
+    Every chain of a model shares its client and ModelChannel (concurrency
+    limits, coalescing, timeouts, retries and hedging; see
+    llm/chat_gateway.py). Chains enabled in LLM_RESPONSE_CACHE_CHAINS also
+    answer repeated prompts from the response cache.
+
+    Args:
+        model_id: The model to call
+        chain: Name of the calling chain (e.g. "intent", "sql")
     """
-    try:
-        return ChatOCIGenAI(
-            model_id=GENERATE_MODEL, 
-            service_endpoint=ENDPOINT,
-            compartment_id=ORACLE_COMPARTMENT_ID  # Added compartment_id
-        )
-    except Exception as e:
-        print(f"Error initializing LLM: {str(e)}")
-        # Return a dummy LLM for testing
-        from langchain.llms.fake import FakeListLLM
-        return FakeListLLM(responses=["This is a placeholder response as the LLM service is unavailable."])
+    with _llms_lock:
+        llm = llms.get((model_id, chain))
+        if llm is None:
+            try:
+                if model_id not in channels:
+                    channels[model_id] = (_create_llm(model_id), ModelChannel(model_id))
+            except Exception as e:
+                print(f"Error initializing LLM: {str(e)}")
+                # Return a dummy LLM for testing
+                from langchain.llms.fake import FakeListLLM
+                return FakeListLLM(responses=["This is a placeholder response as the LLM service is unavailable."])
+            client, channel = channels[model_id]
+            cache = get_response_cache() if LLM_RESPONSE_CACHE_CHAINS.get(chain) else None
+            llm = GatewayChatModel(
+                client=client, model_id=model_id, channel=channel, chain=chain, response_cache=cache
+            )
+            llms[(model_id, chain)] = llm
+    return llm
+
+def complete_json(llm, prompt, inputs):
+    """
+    Ask for a JSON object and stop the model as soon as it has been
+    written, instead of waiting for whatever it adds after it.
+
+    Args:
+        llm: A model from get_llm()
+        prompt: The prompt template
+        inputs (dict): The prompt inputs
+
+    Returns:
+        str: The response text, up to the end of the first JSON object
+    """
+    scanner = JSONObjectScanner()
+    messages = prompt.format_messages(**inputs)
+    parts = []
+    if isinstance(llm, GatewayChatModel):
+        # The gateway stops the model's stream itself, once the object closes
+        for chunk in llm.stream(messages, until=scanner.feed):
+            parts.append(chunk.content)
+    else:
+        for chunk in llm.stream(messages):
+            parts.append(getattr(chunk, "content", chunk))
+            if scanner.feed(parts[-1]) is not None:
+                break
+    return "".join(parts)
+
+def get_response_cache():
+    """Get the shared LLM response cache"""
+    global response_cache
+    with _response_cache_lock:
+        if response_cache is None:
+            response_cache = LLMResponseCache()
+    return response_cache
+
+def _create_llm(model_id):
+    return ChatOCIGenAI(
+        model_id=model_id,
+        service_endpoint=ENDPOINT,
+        compartment_id=ORACLE_COMPARTMENT_ID  # Added compartment_id
+    )
 
 def get_embedder():
     """
-    Get the Embedding Model client with proper configuration
+    Get the shared, caching Embedding Model client with proper configuration
     """
+    global embedder
+    with _embedder_lock:
+        if embedder is None:
+            embedder = _create_embedder()
+    return embedder
+
+def _create_embedder():
     try:
-        return OCIGenAIEmbeddings(
-            model_id=EMBEDDING_MODEL, 
-            service_endpoint=ENDPOINT,
-            compartment_id=ORACLE_COMPARTMENT_ID  # Added compartment_id
+        return CachedEmbeddings(
+            OCIGenAIEmbeddings(
+                model_id=EMBEDDING_MODEL, 
+                service_endpoint=ENDPOINT,
+                compartment_id=ORACLE_COMPARTMENT_ID  # Added compartment_id
+            ),
+            model_id=EMBEDDING_MODEL
         )
     except Exception as e:
         print(f"Error initializing embedder: {str(e)}")
         # Return a simple embedding function for testing
         class SimpleEmbedder:
+            # Constant vectors: fine for smoke tests, useless for similarity
+            placeholder = True
+
             def embed_query(self, text):
                 # Return a simple embedding vector (not for production use)
                 return [0.1] * 384
-        return SimpleEmbedder()
\ No newline at end of file
+
+            def embed_documents(self, texts):
+                return [self.embed_query(text) for text in texts]
+        return SimpleEmbedder()
+
+def _embedding_cache_stats():
+    stats = getattr(embedder, "stats", None)
+    return stats() if stats is not None else None
+
+metrics.register_cache("embedding", _embedding_cache_stats)
+
+def _response_cache_stats():
+    return response_cache.stats() if response_cache is not None else None
+
+metrics.register_cache("llm_response", _response_cache_stats)
+
+def _collect_llm_metrics():
+    with _llms_lock:
+        current = list(channels.items())
+    for model_id, (_, channel) in current:
+        LLM_IN_FLIGHT.set(channel.running, model=model_id)
+
+metrics.register_collector(_collect_llm_metrics)
@@ -0,0 +1,161 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LLM_RESPONSE_CACHE_PATH = "llm_response_cache.sqlite3"
+LLM_RESPONSE_CACHE_MAX_ENTRIES = 5000
+# Rows kept in the SQLite file; past this, expired and then the oldest rows are pruned
+LLM_RESPONSE_CACHE_MAX_STORED_ENTRIES = 50000
+# Entries older than this are ignored and overwritten (None: keep forever)
+LLM_RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Chains whose responses are cached, by the chain name given to get_llm().
+# Chains not listed (or without a name) are not cached.
+LLM_RESPONSE_CACHE_CHAINS = {
+    "intent": True,
+    "tables": True,
+    "columns": True,
+    "fused": True,
+    "sql": True,
+    "explanation": True,
+}
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache of LLM response text, keyed by a hash of (model,
+    rendered prompt, temperature, stop words).
+
+    Entries are kept in an in-memory LRU and written through to a SQLite
+    file, so a restarted worker starts warm. The file keeps at most
+    max_stored_entries rows. Hits and misses are counted per chain.
+    """
+
+    def __init__(self, path=LLM_RESPONSE_CACHE_PATH, max_entries=LLM_RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl=LLM_RESPONSE_CACHE_TTL_SECONDS, max_stored_entries=LLM_RESPONSE_CACHE_MAX_STORED_ENTRIES):
+        self.max_entries = max_entries
+        self.max_stored_entries = max_stored_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.chain_stats = {}
+        self._db = None
+        # Upper bound on the rows on disk (replaced keys are counted twice), so
+        # pruning never has to count the table on every write
+        self._stored = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._prune()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"LLM response cache store unavailable, using memory only: {str(e)}")
+                self._db = None
+
+    def _prune(self):
+        """Delete expired rows, then the oldest once over max_stored_entries; call with the lock held."""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        self._stored = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self._stored > self.max_stored_entries:
+            # Down to 90%, so a full store isn't pruned again on every write
+            excess = self._stored - self.max_stored_entries * 9 // 10
+            self._db.execute(
+                "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY created_at LIMIT ?)",
+                (excess,)
+            )
+            self._stored -= excess
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _fresh(self, created_at):
+        return self.ttl is None or time.time() - created_at < self.ttl
+
+    def _count(self, chain, hit):
+        stats = self.chain_stats.setdefault(chain, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+
+    def get(self, key, chain=None):
+        """
+        Returns:
+            str or None: The cached response text
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to read the LLM response cache: {str(e)}")
+                    row = None
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, *entry)
+
+            if entry is not None and not self._fresh(entry[1]):
+                del self._memory[key]
+                entry = None
+            self._count(chain, entry is not None)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, response):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, response, created_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                        (key, response, created_at)
+                    )
+                    self._stored += 1
+                    if self._stored > self.max_stored_entries:
+                        self._prune()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist LLM response: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._memory)
+            self._memory.clear()
+            if self._db is not None:
+                try:
+                    removed = max(removed, self._db.execute("DELETE FROM responses").rowcount)
+                    self._stored = 0
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to clear the LLM response cache: {str(e)}")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            chains = {chain: dict(stats) for chain, stats in self.chain_stats.items()}
+            stats = {
+                "entries": len(self._memory),
+                "hits": sum(s["hits"] for s in chains.values()),
+                "misses": sum(s["misses"] for s in chains.values()),
+                "chains": chains,
+            }
+            if self._db is not None:
+                try:
+                    stats["stored_entries"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return stats
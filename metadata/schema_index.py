@@ -0,0 +1,187 @@
+import logging
+import threading
+
+import numpy as np
+
+from metadata.schema_model import get_schema_model
+from llm.llm_gateway import get_embedder
+
+logger = logging.getLogger(__name__)
+
+# Selections below this confidence are handed to TableAgent / ColumnPruneAgent
+SCHEMA_INDEX_MIN_CONFIDENCE = 0.75
+# Question-to-table cosine at which a match counts as fully strong; weaker
+# best matches scale the confidence down
+SCHEMA_INDEX_STRONG_SIMILARITY = 0.4
+# Lead over the runner-up table needed for full confidence; a smaller lead
+# scales it down, a tie gives none
+SCHEMA_INDEX_SEPARATION = 0.15
+# A column is selected when it matches what the question has left unexplained
+# with at least this cosine
+SCHEMA_INDEX_COLUMN_MIN_SIMILARITY = 0.3
+# A column scoring within this of a selected one at the time it was selected,
+# and not selected itself, makes the column choice ambiguous
+SCHEMA_INDEX_COLUMN_MARGIN = 0.05
+
+
+def _words(name):
+    return name.lower().replace("_", " ")
+
+
+def column_text(column):
+    """What is embedded for a column: its name in words and its comment."""
+    return f"{_words(column.name)}: {column.description}" if column.description else _words(column.name)
+
+
+def table_text(table):
+    """What is embedded for a table: its name, comment and columns in words."""
+    head = f"{_words(table.name)}: {table.description}" if table.description else _words(table.name)
+    return f"{head}. Columns: {', '.join(column_text(column) for column in table.columns)}"
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class SchemaIndex:
+    """
+    In-process index over the schema model for picking a table and its
+    columns without an LLM call.
+
+    Each table is embedded once as its name, comment and column names and
+    comments (the comments come from the data dictionary), and each column
+    as its name and comment; CachedEmbeddings keeps the vectors across
+    rebuilds and restarts. A question goes to the table whose text is
+    closest by cosine. The confidence is how strong that match is times how
+    clearly it beats the runner-up, so questions that fit several tables
+    equally well are left to the agents. Joins are too.
+
+    Columns are picked greedily: the closest column to the question, then
+    the closest to what that column leaves unexplained, and so on. When a
+    column that scored as well as a pick is explained away by it ("total
+    amount" against four amount columns), the columns are left to
+    ColumnPruneAgent.
+    """
+
+    def __init__(self, model, embedder=None):
+        self.digest = model.digest
+        self.embedder = None
+        self.tables = []
+        for table in (model.tables[name] for name in model.table_names):
+            self.tables.append({
+                "name": table.name,
+                "text": table_text(table),
+                "columns": [{"name": c.name, "text": column_text(c)} for c in table.columns],
+                "key": table.key,
+            })
+
+        self.table_vectors = None
+        if embedder is not None and not getattr(embedder, "placeholder", False) and self.tables:
+            try:
+                texts = [table["text"] for table in self.tables]
+                for table in self.tables:
+                    texts.extend(column["text"] for column in table["columns"])
+                vectors = _unit_rows(embedder.embed_documents(texts))
+                self.table_vectors = vectors[:len(self.tables)]
+                offset = len(self.tables)
+                for table in self.tables:
+                    table["column_vectors"] = vectors[offset:offset + len(table["columns"])]
+                    offset += len(table["columns"])
+                self.embedder = embedder
+            except Exception as e:
+                logger.warning(f"Schema index embeddings unavailable, leaving selection to the agents: {str(e)}")
+                self.table_vectors = None
+
+    def _query_vector(self, user_query, embedding):
+        if self.table_vectors is None:
+            return None
+        if embedding is None:
+            try:
+                embedding = self.embedder.embed_query(user_query)
+            except Exception as e:
+                logger.warning(f"Schema index could not embed the question: {str(e)}")
+                return None
+        query = np.asarray(embedding, dtype=np.float32)
+        if query.shape != (self.table_vectors.shape[1],):
+            return None
+        norm = np.linalg.norm(query)
+        return query / norm if norm else None
+
+    @staticmethod
+    def _columns(table, query):
+        """
+        Greedy column pick for a table (see the class docstring), or None when
+        nothing matches or the choice is ambiguous.
+        """
+        vectors = table["column_vectors"]
+        remaining = list(range(len(vectors)))
+        residual = query
+        chosen, contenders = [], set()
+        while remaining:
+            scores = vectors[remaining] @ residual
+            best = int(np.argmax(scores))
+            if scores[best] < SCHEMA_INDEX_COLUMN_MIN_SIMILARITY:
+                break
+            contenders.update(
+                remaining[i] for i in np.flatnonzero(scores >= scores[best] - SCHEMA_INDEX_COLUMN_MARGIN)
+            )
+            picked = remaining.pop(best)
+            chosen.append(picked)
+            residual = residual - (residual @ vectors[picked]) * vectors[picked]
+        if not chosen or contenders - set(chosen):
+            return None
+        names = {table["columns"][i]["name"] for i in chosen}
+        # The row identifier comes along so results can be told apart
+        return [c["name"] for c in table["columns"] if c["name"] in names or c["name"] == table["key"]]
+
+    def select(self, user_query, embedding=None):
+        """
+        Pick a table and its columns for a question.
+
+        Args:
+            user_query (str): The natural language query from the user
+            embedding (list, optional): Embedding of user_query; computed here when absent
+
+        Returns:
+            dict: {"relevant_tables": [...], "columns": {table: [columns] or None},
+                   "confidence": float, "similarities": {table: cosine}}.
+                   The table maps to None when no column choice could be made;
+                   nothing is selected when embeddings are unavailable.
+        """
+        query = self._query_vector(user_query, embedding)
+        if query is None:
+            return {"relevant_tables": [], "columns": {}, "confidence": 0.0, "similarities": {}}
+
+        similarities = self.table_vectors @ query
+        order = np.argsort(-similarities)
+        best = similarities[order[0]]
+        runner_up = similarities[order[1]] if len(order) > 1 else 0.0
+        strength = min(1.0, max(0.0, best) / SCHEMA_INDEX_STRONG_SIMILARITY)
+        separation = min(1.0, max(0.0, best - runner_up) / SCHEMA_INDEX_SEPARATION)
+        table = self.tables[order[0]]
+
+        return {
+            "relevant_tables": [table["name"]],
+            "columns": {table["name"]: self._columns(table, query)},
+            "confidence": round(float(strength * separation), 3),
+            "similarities": {self.tables[i]["name"]: round(float(similarities[i]), 3) for i in order},
+        }
+
+
+schema_index = None
+_schema_index_lock = threading.Lock()
+
+def get_schema_index():
+    """
+    Build the shared schema index on first use (embeds the table and column
+    texts once), and rebuild it when the schema loader picks up DDL or
+    comment changes.
+    """
+    global schema_index
+    model = get_schema_model()
+    with _schema_index_lock:
+        if schema_index is None or schema_index.digest != model.digest:
+            schema_index = SchemaIndex(model, embedder=get_embedder())
+    return schema_index
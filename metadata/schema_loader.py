@@ -1,3 +1,36 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from db.db_pool import pooled_connection
+
+try:
+    from config import TABLES
+except ImportError:  # optional: the loaded schema decides which tables exist
+    TABLES = None
+
+logger = logging.getLogger(__name__)
+
+# Schema whose tables are loaded; None means the connecting user's schema
+SCHEMA_OWNER = None
+# Optional filter on the tables loaded from the data dictionary (and offered
+# from the built-in schema); None uses every table of the owner. Tables added
+# to the schema show up without a config change unless this is set.
+SCHEMA_TABLES = TABLES
+# Structured copy of the loaded dictionary, read on cold start before the
+# first incremental refresh
+SCHEMA_SNAPSHOT_PATH = "schema_snapshot.json"
+# Seconds between incremental refreshes; 0 disables the background refresh
+SCHEMA_REFRESH_INTERVAL_SECONDS = 300
+SCHEMA_FETCH_ARRAYSIZE = 5000
+# Bind variables per IN (...) list when re-reading a subset of tables
+_IN_LIST_CHUNK = 500
+
+# Built-in schema, used until (or unless) the data dictionary can be read.
+# Replaced in place by the loader, so modules holding a reference see updates.
 SCHEMA_MAP = {
     "PO_INVOICE_DATA_DUMMY": """PO_INVOICE_DATA_DUMMY(
         PO_NUMBER VARCHAR2(26),
@@ -46,5 +79,303 @@ SCHEMA_MAP = {
         DEPARTMENT VARCHAR2(128)
     )"""
 }
+
+# table -> {"columns": [{"name", "type", "nullable", "comment"}], "primary_key": [...],
+#           "foreign_keys": [{"columns", "ref_table", "ref_columns"}], "comment", "last_ddl_time"}
+SCHEMA_TABLE_INFO = {}
+
+_schema_lock = threading.Lock()
+_schema_digest = None
+_refresh_thread = None
+
+_CURRENT_SCHEMA_SQL = "SELECT SYS_CONTEXT('USERENV', 'CURRENT_SCHEMA') FROM dual"
+
+_OBJECTS_SQL = """
+SELECT object_name, TO_CHAR(last_ddl_time, 'YYYY-MM-DD"T"HH24:MI:SS')
+FROM all_objects
+WHERE owner = :owner AND object_type = 'TABLE'
+"""
+
+_COLUMNS_SQL = """
+SELECT c.table_name, c.column_name, c.data_type, c.data_length, c.data_precision, c.data_scale, c.nullable,
+       cc.comments
+FROM all_tab_columns c
+LEFT JOIN all_col_comments cc
+  ON cc.owner = c.owner AND cc.table_name = c.table_name AND cc.column_name = c.column_name
+WHERE c.owner = :owner{table_filter}
+ORDER BY c.table_name, c.column_id
+"""
+
+_TABLE_COMMENTS_SQL = """
+SELECT table_name, comments
+FROM all_tab_comments
+WHERE owner = :owner AND comments IS NOT NULL{table_filter}
+"""
+
+_CONSTRAINTS_SQL = """
+SELECT c.table_name, c.constraint_name, c.constraint_type, cc.column_name, r.table_name, rc.column_name
+FROM all_constraints c
+JOIN all_cons_columns cc
+  ON cc.owner = c.owner AND cc.constraint_name = c.constraint_name AND cc.table_name = c.table_name
+LEFT JOIN all_constraints r
+  ON r.owner = c.r_owner AND r.constraint_name = c.r_constraint_name
+LEFT JOIN all_cons_columns rc
+  ON rc.owner = r.owner AND rc.constraint_name = r.constraint_name AND rc.position = cc.position
+WHERE c.owner = :owner AND c.constraint_type IN ('P', 'R'){table_filter}
+ORDER BY c.table_name, c.constraint_name, cc.position
+"""
+
+
 def load_schema(table_name: str):
     return SCHEMA_MAP.get(table_name.upper(), "No schema found.")
+
+
+def schema_digest():
+    """
+    Hash of the current SCHEMA_MAP and the table and column comments,
+    recomputed only when the loader changes them.
+    """
+    global _schema_digest
+    with _schema_lock:
+        if _schema_digest is None:
+            digest = hashlib.sha1()
+            for table, ddl in sorted(SCHEMA_MAP.items()):
+                digest.update(table.encode("utf-8"))
+                digest.update(b"\0")
+                digest.update(ddl.encode("utf-8"))
+                digest.update(b"\0")
+                info = SCHEMA_TABLE_INFO.get(table) or {}
+                comments = [info.get("comment")] + [c.get("comment") for c in info.get("columns", [])]
+                digest.update(json.dumps(comments).encode("utf-8"))
+            _schema_digest = digest.hexdigest()
+        return _schema_digest
+
+
+def table_names(schema_map=None):
+    """
+    Tables the pipeline may use: those of the loaded schema (SCHEMA_MAP by
+    default), limited to SCHEMA_TABLES when it is set.
+
+    Returns:
+        list: Upper-case table names, in schema order
+    """
+    if schema_map is None:
+        with _schema_lock:
+            names = list(SCHEMA_MAP)
+    else:
+        names = list(schema_map)
+    if SCHEMA_TABLES is None:
+        return names
+    wanted = {table.upper() for table in SCHEMA_TABLES}
+    return [name for name in names if name in wanted]
+
+
+def current_schema():
+    """Consistent copies of (SCHEMA_MAP, SCHEMA_TABLE_INFO), never caught mid-refresh."""
+    with _schema_lock:
+        return dict(SCHEMA_MAP), dict(SCHEMA_TABLE_INFO)
+
+
+def _format_type(data_type, length, precision, scale):
+    if data_type == "NUMBER":
+        if precision is None:
+            return "NUMBER"
+        return f"NUMBER({precision},{scale})" if scale else f"NUMBER({precision})"
+    if data_type in ("VARCHAR2", "NVARCHAR2", "CHAR", "NCHAR", "RAW"):
+        return f"{data_type}({length})"
+    return data_type
+
+
+def render_ddl(table, info):
+    """Render a table in the same DDL-like form as the built-in SCHEMA_MAP entries."""
+    columns = ",\n".join(f"        {col['name']} {col['type']}" for col in info["columns"])
+    return f"{table}(\n{columns}\n    )"
+
+
+def _table_filter(names, column):
+    """AND <column> IN (:t0, ...) for one chunk of table names, with its binds."""
+    binds = {f"t{i}": name for i, name in enumerate(names)}
+    placeholders = ", ".join(f":{key}" for key in binds)
+    return f" AND {column} IN ({placeholders})", binds
+
+
+def _fetch(cursor, sql, binds):
+    cursor.arraysize = SCHEMA_FETCH_ARRAYSIZE
+    cursor.prefetchrows = SCHEMA_FETCH_ARRAYSIZE + 1
+    cursor.execute(sql, binds)
+    return cursor.fetchall()
+
+
+def _read_objects(cursor, owner):
+    """Returns: dict of table name -> LAST_DDL_TIME for the tables to load."""
+    wanted = {t.upper() for t in SCHEMA_TABLES} if SCHEMA_TABLES is not None else None
+    return {
+        name: ddl_time
+        for name, ddl_time in _fetch(cursor, _OBJECTS_SQL, {"owner": owner})
+        if wanted is None or name in wanted
+    }
+
+
+def _read_tables(cursor, owner, names, ddl_times):
+    """
+    Read columns, keys and comments of the given tables, a chunk of names per
+    query (all tables when names is None).
+    """
+    chunks = [None] if names is None else [names[i:i + _IN_LIST_CHUNK] for i in range(0, len(names), _IN_LIST_CHUNK)]
+    tables = {}
+    for chunk in chunks:
+        table_filter, binds = _table_filter(chunk, "table_name") if chunk else ("", {})
+        prefixed_filter, _ = _table_filter(chunk, "c.table_name") if chunk else ("", {})
+        binds["owner"] = owner
+
+        for table, column, data_type, length, precision, scale, nullable, comment in _fetch(
+            cursor, _COLUMNS_SQL.format(table_filter=prefixed_filter), binds
+        ):
+            if table not in ddl_times:
+                continue
+            info = tables.setdefault(table, {
+                "columns": [], "primary_key": [], "foreign_keys": [], "comment": None,
+                "last_ddl_time": ddl_times[table]
+            })
+            info["columns"].append({
+                "name": column,
+                "type": _format_type(data_type, length, precision, scale),
+                "nullable": nullable == "Y",
+                "comment": comment
+            })
+
+        for table, comment in _fetch(cursor, _TABLE_COMMENTS_SQL.format(table_filter=table_filter), binds):
+            if table in tables:
+                tables[table]["comment"] = comment
+
+        foreign_keys = {}
+        for table, constraint, constraint_type, column, ref_table, ref_column in _fetch(
+            cursor, _CONSTRAINTS_SQL.format(table_filter=prefixed_filter), binds
+        ):
+            info = tables.get(table)
+            if info is None:
+                continue
+            if constraint_type == "P":
+                info["primary_key"].append(column)
+            else:
+                fk = foreign_keys.get((table, constraint))
+                if fk is None:
+                    fk = foreign_keys[(table, constraint)] = {"columns": [], "ref_table": ref_table, "ref_columns": []}
+                    info["foreign_keys"].append(fk)
+                fk["columns"].append(column)
+                fk["ref_columns"].append(ref_column)
+    return tables
+
+
+def _apply(tables):
+    global _schema_digest
+    with _schema_lock:
+        SCHEMA_TABLE_INFO.clear()
+        SCHEMA_TABLE_INFO.update(tables)
+        SCHEMA_MAP.clear()
+        SCHEMA_MAP.update({table: render_ddl(table, info) for table, info in sorted(tables.items())})
+        _schema_digest = None
+
+
+def save_snapshot(path=SCHEMA_SNAPSHOT_PATH):
+    with _schema_lock:
+        payload = {"captured_at": time.time(), "tables": SCHEMA_TABLE_INFO}
+        data = json.dumps(payload)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path=SCHEMA_SNAPSHOT_PATH):
+    """
+    Returns:
+        bool: Whether a snapshot was found and applied
+    """
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        tables = json.load(f).get("tables") or {}
+    if not tables:
+        return False
+    _apply(tables)
+    return True
+
+
+def refresh_schema(full=False):
+    """
+    Bring the schema up to date with the data dictionary.
+
+    One ALL_OBJECTS query finds the tables whose LAST_DDL_TIME moved (or
+    that are new or dropped); only those are re-read from ALL_TAB_COLUMNS,
+    ALL_CONSTRAINTS and the comment views. With full=True, or on the first load, every table
+    is read in one pass per view.
+
+    Returns:
+        dict: {"tables", "changed", "dropped"} counts
+    """
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            owner = SCHEMA_OWNER or _fetch(cursor, _CURRENT_SCHEMA_SQL, {})[0][0]
+            ddl_times = _read_objects(cursor, owner)
+            if not ddl_times:
+                logger.warning(f"No tables found in the data dictionary for {owner}, keeping the current schema")
+                return {"tables": len(SCHEMA_MAP), "changed": 0, "dropped": 0}
+
+            with _schema_lock:
+                current = {table: dict(info) for table, info in SCHEMA_TABLE_INFO.items()}
+            changed = [t for t, ddl_time in ddl_times.items() if full or current.get(t, {}).get("last_ddl_time") != ddl_time]
+            dropped = [t for t in current if t not in ddl_times]
+            if not changed and not dropped:
+                return {"tables": len(current), "changed": 0, "dropped": 0}
+
+            # Reading the whole schema filtered only by owner beats long IN lists
+            names = None if len(changed) == len(ddl_times) and SCHEMA_TABLES is None else sorted(changed)
+            tables = {t: info for t, info in current.items() if t in ddl_times}
+            tables.update(_read_tables(cursor, owner, names, ddl_times))
+        finally:
+            cursor.close()
+
+    _apply(tables)
+    try:
+        save_snapshot()
+    except OSError as e:
+        logger.warning(f"Could not write schema snapshot: {str(e)}")
+    logger.info(f"Schema refreshed: {len(changed)} changed, {len(dropped)} dropped, {len(tables)} tables")
+    return {"tables": len(tables), "changed": len(changed), "dropped": len(dropped)}
+
+
+def _refresh_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_schema()
+        except Exception as e:
+            logger.error(f"Schema refresh failed: {str(e)}")
+
+
+def init_schema():
+    """
+    Load the schema at startup: the local snapshot first (fast cold start),
+    then an incremental refresh from the data dictionary, then a background
+    refresh every SCHEMA_REFRESH_INTERVAL_SECONDS. Falls back to the
+    built-in SCHEMA_MAP when neither is available.
+    """
+    global _refresh_thread
+    try:
+        if load_snapshot():
+            logger.info(f"Loaded schema snapshot with {len(SCHEMA_MAP)} tables")
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable schema snapshot: {str(e)}")
+
+    try:
+        refresh_schema()
+    except Exception as e:
+        logger.error(f"Failed to load schema from the data dictionary: {str(e)}")
+
+    if SCHEMA_REFRESH_INTERVAL_SECONDS and _refresh_thread is None:
+        _refresh_thread = threading.Thread(
+            target=_refresh_loop, args=(SCHEMA_REFRESH_INTERVAL_SECONDS,), name="schema-refresh", daemon=True
+        )
+        _refresh_thread.start()
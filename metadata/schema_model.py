@@ -0,0 +1,179 @@
+import functools
+import re
+import threading
+
+from metadata import schema_loader
+
+# Memoized prompt fragments kept per kind, per schema model
+SCHEMA_FRAGMENT_CACHE_SIZE = 4096
+
+NO_SCHEMA = "No schema found."
+
+
+def parse_ddl(ddl):
+    """
+    Returns:
+        list: (column name, type) pairs from a SCHEMA_MAP DDL string
+    """
+    body = ddl[ddl.index("(") + 1:ddl.rindex(")")]
+    columns = []
+    for line in re.split(r",\s*\n", body):
+        parts = line.split(None, 1)
+        if parts:
+            columns.append((parts[0].strip().upper(), parts[1].strip().rstrip(",") if len(parts) > 1 else ""))
+    return columns
+
+
+def abbreviate_type(data_type):
+    """Short type name for compact prompts: NUMBER(38,2) -> decimal, VARCHAR2(26) -> text, ..."""
+    base = data_type.split("(")[0].strip().upper()
+    if base == "NUMBER":
+        if "(" not in data_type:
+            return "number"
+        args = data_type[data_type.index("(") + 1:data_type.rindex(")")].split(",")
+        return "decimal" if len(args) > 1 and args[1].strip() not in ("", "0") else "int"
+    if base in ("VARCHAR2", "NVARCHAR2", "CHAR", "NCHAR", "VARCHAR", "CLOB", "NCLOB", "LONG"):
+        return "text"
+    if base.startswith("TIMESTAMP"):
+        return "timestamp"
+    return base.lower()
+
+
+class Column:
+    __slots__ = ("name", "type", "nullable", "primary_key", "references", "description")
+
+    def __init__(self, name, type, nullable=True, primary_key=False, references=None, description=None):
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+        self.primary_key = primary_key
+        # (table, column) this column is a foreign key to, if any
+        self.references = references
+        # Column comment from the data dictionary, if any
+        self.description = description
+
+
+class Table:
+    __slots__ = ("name", "columns", "column_map", "primary_key", "description", "ddl")
+
+    def __init__(self, name, columns, primary_key=(), description="", ddl=""):
+        self.name = name
+        self.columns = tuple(columns)
+        self.column_map = {column.name: column for column in self.columns}
+        self.primary_key = tuple(primary_key)
+        # Table comment from the data dictionary, if any
+        self.description = description
+        self.ddl = ddl
+
+    @property
+    def key(self):
+        """Column identifying a row: the primary key, else by convention the first column."""
+        if self.primary_key:
+            return self.primary_key[0]
+        return self.columns[0].name if self.columns else None
+
+
+class SchemaModel:
+    """
+    Structured, read-only view of the schema, built once per schema version.
+
+    Prompt fragments are rendered on first use and memoized: whole-table
+    DDL, the table listing, "TABLE (col, ...)" lines per column subset and
+    compact "TABLE(COL type, ...)" renderings.
+    """
+
+    def __init__(self, schema_map, table_info=None, digest=None):
+        self.digest = digest
+        table_info = table_info or {}
+        self.tables = {}
+        for name, ddl in schema_map.items():
+            info = table_info.get(name)
+            if info is not None:
+                references = {}
+                for fk in info.get("foreign_keys", []):
+                    for column, ref_column in zip(fk["columns"], fk["ref_columns"]):
+                        references[column] = (fk["ref_table"], ref_column)
+                primary_key = info.get("primary_key", [])
+                columns = [
+                    Column(c["name"], c["type"], c.get("nullable", True), c["name"] in primary_key,
+                           references.get(c["name"]), c.get("comment"))
+                    for c in info["columns"]
+                ]
+                description = info.get("comment") or ""
+            else:
+                primary_key = []
+                columns = [Column(column, data_type) for column, data_type in parse_ddl(ddl)]
+                description = ""
+            self.tables[name] = Table(name, columns, primary_key, description, ddl)
+        # What prompts, validation and the caches offer: the loaded tables, filtered by SCHEMA_TABLES
+        self.table_names = schema_loader.table_names(schema_map)
+
+        for name in ("table_listing", "schema_text", "column_subset", "compact_table"):
+            render = getattr(self, f"_render_{name}")
+            setattr(self, f"_{name}", functools.lru_cache(maxsize=SCHEMA_FRAGMENT_CACHE_SIZE)(render))
+
+    def table(self, name):
+        return self.tables.get(name.upper())
+
+    def ddl(self, name):
+        table = self.table(name)
+        return table.ddl if table is not None else NO_SCHEMA
+
+    def table_listing(self, names):
+        """"- TABLE: TABLE" lines for TableAgent."""
+        return self._table_listing(tuple(names))
+
+    def schema_text(self, names, labeled=False):
+        """DDL of the given tables, blank-line separated; labeled prefixes each with "TABLE:"."""
+        return self._schema_text(tuple(names), labeled)
+
+    def column_subset(self, name, columns):
+        """"TABLE (col1, col2)" for the selected columns (just TABLE when there are none)."""
+        return self._column_subset(name, tuple(columns))
+
+    def compact_table(self, name, columns=None):
+        """
+        "TABLE(COL type, ...)" with abbreviated types, for the given columns
+        only; all columns when columns is empty or ["*"]. Unknown tables and
+        columns are rendered by name alone.
+        """
+        return self._compact_table(name, tuple(columns or ()))
+
+    def compact_schema(self, names):
+        """compact_table for each table, one per line."""
+        return "\n".join(self.compact_table(name) for name in names)
+
+    def _render_compact_table(self, name, columns):
+        table = self.table(name)
+        if table is None:
+            return self._render_column_subset(name, columns)
+        if not columns or "*" in columns:
+            columns = [column.name for column in table.columns]
+        parts = []
+        for column_name in columns:
+            column = table.column_map.get(column_name.upper())
+            parts.append(f"{column.name} {abbreviate_type(column.type)}" if column is not None else column_name)
+        return f"{table.name}({', '.join(parts)})"
+
+    def _render_table_listing(self, names):
+        return "\n".join(f"- {name}: {self.ddl(name).split('(')[0]}" for name in names)
+
+    def _render_schema_text(self, names, labeled):
+        return "\n\n".join(f"{name}:\n{self.ddl(name)}" if labeled else self.ddl(name) for name in names)
+
+    def _render_column_subset(self, name, columns):
+        return f"{name} ({', '.join(columns)})" if columns else name
+
+
+schema_model = None
+_schema_model_lock = threading.Lock()
+
+def get_schema_model():
+    """The shared SchemaModel, rebuilt when the schema loader picks up DDL changes."""
+    global schema_model
+    digest = schema_loader.schema_digest()
+    with _schema_model_lock:
+        if schema_model is None or schema_model.digest != digest:
+            schema_map, table_info = schema_loader.current_schema()
+            schema_model = SchemaModel(schema_map, table_info, digest=digest)
+    return schema_model
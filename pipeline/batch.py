@@ -0,0 +1,127 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from cache.semantic_cache import question_literals
+from llm.chat_gateway import LLM_MAX_CONCURRENCY
+from llm.llm_gateway import get_embedder
+from retriever.sql_retriever import is_placeholder_embedder
+from pipeline.sql_pipeline import PIPELINE_MAX_WORKERS, run_pipeline, run_blocking
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_QUERIES = 5000
+BATCH_DEFAULT_CONCURRENCY = 8
+# More pipelines at once would only queue for pipeline workers or LLM slots
+BATCH_MAX_CONCURRENCY = min(PIPELINE_MAX_WORKERS, LLM_MAX_CONCURRENCY)
+# Questions at least this similar, with the same numbers and quoted values,
+# are answered once and the result shared
+BATCH_DEDUP_SIMILARITY_THRESHOLD = 0.97
+
+
+def _embed_batch(queries):
+    """Embed all questions in one embed_documents call; None if unavailable."""
+    if is_placeholder_embedder():
+        return None
+    return get_embedder().embed_documents(queries)
+
+
+def group_duplicates(queries, embeddings=None, threshold=BATCH_DEDUP_SIMILARITY_THRESHOLD):
+    """
+    Group identical and near-identical questions.
+
+    Identical text (ignoring case and surrounding whitespace) is grouped
+    first; with embeddings, each remaining question joins the closest earlier
+    representative whose cosine similarity reaches the threshold and whose
+    literals (question_literals) are the same: "top 10" and "top 20" embed
+    alike but need different SQL.
+
+    Returns:
+        list: (representative index, [member indices]) in input order
+    """
+    groups = {}
+    by_text = {}
+    representatives = []
+    rep_literals = []
+    vectors = None
+    if embeddings is not None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        rep_vectors = np.empty_like(vectors)
+
+    for index, query in enumerate(queries):
+        text = query.strip().lower()
+        if text in by_text:
+            groups[by_text[text]].append(index)
+            continue
+
+        literals = question_literals(query)
+        if vectors is not None and representatives:
+            scores = rep_vectors[:len(representatives)] @ vectors[index]
+            close = np.flatnonzero(scores >= threshold)
+            matching = [i for i in close[np.argsort(-scores[close])] if rep_literals[i] == literals]
+            if matching:
+                rep = representatives[matching[0]]
+                groups[rep].append(index)
+                by_text[text] = rep
+                continue
+
+        if vectors is not None:
+            rep_vectors[len(representatives)] = vectors[index]
+        representatives.append(index)
+        rep_literals.append(literals)
+        by_text[text] = index
+        groups[index] = [index]
+
+    return list(groups.items())
+
+
+async def run_batch(queries, concurrency=BATCH_DEFAULT_CONCURRENCY, explain="inline", debug_mode=False, mode=None):
+    """
+    Run the pipeline for many questions, yielding per-item results as they complete.
+
+    All questions are embedded in one batch call, duplicates are answered
+    once, and at most `concurrency` pipelines run at a time.
+
+    Yields:
+        dict: {"index", "query", "sql", "explanation", "explanation_id",
+               "debug_info", "duplicate_of"} or {"index", "query", "error"}
+    """
+    try:
+        embeddings = await run_blocking(_embed_batch, queries)
+    except Exception as e:
+        logger.warning(f"Batch embedding failed, embedding per query: {str(e)}")
+        embeddings = None
+
+    groups = await run_blocking(group_duplicates, queries, embeddings)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_group(rep, members):
+        async with semaphore:
+            try:
+                result = await run_pipeline(
+                    queries[rep], debug_mode=debug_mode, explain=explain, mode=mode,
+                    embedding=embeddings[rep] if embeddings is not None else None
+                )
+                return rep, members, result, None
+            except Exception as e:
+                logger.error(f"Batch item {rep} failed: {str(e)}")
+                return rep, members, None, str(e)
+
+    tasks = [asyncio.create_task(run_group(rep, members)) for rep, members in groups]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            rep, members, result, error = await next_done
+            for index in members:
+                item = {"index": index, "query": queries[index]}
+                if error is not None:
+                    item["error"] = error
+                else:
+                    item.update(result)
+                    item["duplicate_of"] = rep if index != rep else None
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION_WORKERS = 4
+# Explanations queued or running at once; past this, deferred requests get none
+EXPLANATION_MAX_PENDING = 64
+# Finished explanations kept for /explanations/{id}; oldest go first
+EXPLANATION_STORE_MAX_ENTRIES = 5000
+# ... and for at most this long after they finish
+EXPLANATION_TTL_SECONDS = 600
+
+DEFERRED_EXPLANATIONS = metrics.gauge("deferred_explanations", "Deferred explanations by state", ["state"])
+
+_executor = ThreadPoolExecutor(max_workers=EXPLANATION_WORKERS, thread_name_prefix="explanations")
+
+
+class ExplanationStore:
+    """
+    Thread-safe map of explanation id -> job state. Pending jobs are capped
+    at max_pending; finished ones are kept in finishing order, up to
+    max_entries and for ttl seconds.
+    """
+
+    def __init__(self, max_entries=EXPLANATION_STORE_MAX_ENTRIES, max_pending=EXPLANATION_MAX_PENDING,
+                 ttl=EXPLANATION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._pending = {}
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._finished:
+            entry = next(iter(self._finished.values()))
+            if entry["finished_at"] >= cutoff and len(self._finished) <= self.max_entries:
+                break
+            self._finished.popitem(last=False)
+
+    def create(self):
+        """
+        Returns:
+            str or None: New pending id, or None when max_pending jobs are already pending
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                return None
+            explanation_id = uuid.uuid4().hex
+            self._pending[explanation_id] = {"status": "pending", "explanation": None, "created_at": time.time()}
+        return explanation_id
+
+    def finish(self, explanation_id, explanation, status="done"):
+        with self._lock:
+            entry = self._pending.pop(explanation_id, None)
+            if entry is not None:
+                entry.update(status=status, explanation=explanation, finished_at=time.time())
+                self._finished[explanation_id] = entry
+                self._expire()
+
+    def get(self, explanation_id):
+        with self._lock:
+            self._expire()
+            entry = self._pending.get(explanation_id) or self._finished.get(explanation_id)
+            return dict(entry) if entry is not None else None
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {"pending": len(self._pending), "finished": len(self._finished)}
+
+
+explanation_store = ExplanationStore()
+
+
+def _collect_explanation_metrics():
+    for state, count in explanation_store.stats().items():
+        DEFERRED_EXPLANATIONS.set(count, state=state)
+
+metrics.register_collector(_collect_explanation_metrics)
+
+
+def submit_explanation(explain, user_query, sql_query):
+    """
+    Compute an explanation in the background worker pool, unless
+    EXPLANATION_MAX_PENDING explanations are already queued or running.
+
+    Args:
+        explain (callable): explain(user_query, sql_query) -> str, raising on failure
+        user_query (str): The natural language query from the user
+        sql_query (str): The SQL to explain
+
+    Returns:
+        str or None: Id to poll via get_explanation; None when the backlog is full
+    """
+    explanation_id = explanation_store.create()
+    if explanation_id is None:
+        return None
+
+    def job():
+        try:
+            explanation_store.finish(explanation_id, explain(user_query, sql_query))
+        except Exception as e:
+            logger.error(f"Error generating deferred explanation {explanation_id}: {str(e)}")
+            explanation_store.finish(explanation_id, None, status="failed")
+
+    _executor.submit(job)
+    return explanation_id
+
+
+def get_explanation(explanation_id):
+    """
+    Returns:
+        dict or None: {"status": "pending"|"done"|"failed", "explanation": str or None, ...}
+    """
+    return explanation_store.get(explanation_id)
@@ -0,0 +1,669 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.intent_agent import IntentAgent
+from agents.table_agent import TableAgent
+from agents.column_prune_agent import ColumnPruneAgent
+from agents.fused_selection_agent import FusedSelectionAgent
+from prompts.generate_prompts import QueryPromptGenerator
+from retriever.sql_retriever import retrieve_similar_sql_hits, select_examples, embed_query, is_placeholder_embedder
+from cache.semantic_cache import get_semantic_cache
+from metadata.schema_index import get_schema_index, SCHEMA_INDEX_MIN_CONFIDENCE
+from metadata.schema_model import get_schema_model
+from pipeline.explanations import submit_explanation
+from prompts.token_budget import estimate_tokens
+from utils import metrics
+from utils.tracing import request_trace, span
+from utils.sql_utils import (
+    extract_json_from_llm_response, format_sql_query, log_query, validate_json, validate_table_names
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on blocking LLM / vector-search calls running at once per worker.
+# Everything above this queues in the executor instead of on the event loop.
+PIPELINE_MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="sql-pipeline")
+
+# Serve answers for semantically equivalent questions from cache/semantic_cache.py
+SEMANTIC_CACHE_ENABLED = True
+
+# Give SQL generation examples only from the vector stores matching the
+# tables TableAgent selected (see retriever.STORE_DOMAIN_TABLES)
+RETRIEVAL_ROUTE_BY_TABLES = True
+SIMILAR_SQL_TOP_K = 3
+
+# Pick tables and columns with metadata/schema_index.py in accurate mode,
+# calling TableAgent / ColumnPruneAgent only when the index isn't confident
+SCHEMA_INDEX_ENABLED = True
+
+EXPLANATION_UNAVAILABLE = "An explanation could not be generated for this query."
+
+# "accurate": separate IntentAgent / TableAgent / ColumnPruneAgent calls;
+# "fast": one FusedSelectionAgent call does all three. Requests may override.
+PIPELINE_MODES = ("fast", "accurate")
+PIPELINE_MODE = "accurate"
+# Cached answers each mode may be served: fast requests accept accurate answers too
+SEMANTIC_CACHE_ACCEPTED_MODES = {"fast": ("fast", "accurate"), "accurate": ("accurate",)}
+
+STAGE_SECONDS = metrics.histogram(
+    "pipeline_stage_duration_seconds", "Duration of each pipeline stage", ["stage"]
+)
+REQUEST_SECONDS = metrics.histogram(
+    "pipeline_request_duration_seconds", "End-to-end pipeline duration", ["mode"]
+)
+REQUESTS = metrics.counter(
+    "pipeline_requests_total", "Pipeline runs by mode and outcome (generated, cached, error)", ["mode", "outcome"]
+)
+LLM_CALLS = metrics.counter("llm_calls_total", "LLM calls per agent", ["agent", "outcome"])
+LLM_SECONDS = metrics.histogram("llm_call_duration_seconds", "LLM call latency per agent", ["agent"])
+LLM_COMPLETION_TOKENS = metrics.counter(
+    "llm_completion_tokens_total", "Estimated completion tokens per agent", ["agent"]
+)
+LLM_OUTPUT_REJECTED = metrics.counter(
+    "llm_output_rejected_total",
+    "Agent answers replaced by a fallback, by reason (unparsable, invalid)",
+    ["agent", "reason"]
+)
+
+# "none": skip step 7; "inline": explain before responding; "deferred":
+# respond with an explanation_id and explain in the background
+EXPLAIN_MODES = ("none", "inline", "deferred")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking call (LangChain invoke, OracleVS search, ...) on the pipeline
+    thread pool so the event loop stays free to serve other requests.
+    """
+    loop = asyncio.get_running_loop()
+    # Copy the context so trace spans opened in the worker reach this request
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+# Initialize agents lazily when needed to prevent startup failures
+intent_agent = None
+table_agent = None
+column_prune_agent = None
+query_generator = None
+fused_selection_agent = None
+
+def get_intent_agent():
+    global intent_agent
+    if intent_agent is None:
+        intent_agent = IntentAgent()
+    return intent_agent
+
+def get_table_agent():
+    global table_agent
+    if table_agent is None:
+        table_agent = TableAgent()
+    return table_agent
+
+def get_column_prune_agent():
+    global column_prune_agent
+    if column_prune_agent is None:
+        column_prune_agent = ColumnPruneAgent()
+    return column_prune_agent
+
+def get_fused_selection_agent():
+    global fused_selection_agent
+    if fused_selection_agent is None:
+        fused_selection_agent = FusedSelectionAgent()
+    return fused_selection_agent
+
+def get_query_generator():
+    global query_generator
+    if query_generator is None:
+        query_generator = QueryPromptGenerator()
+    return query_generator
+
+
+def _response_text(response, what):
+    """Unwrap the text of an LLMChain response, which may be a dict or a string."""
+    if isinstance(response, dict):
+        response = response.get("text", "")
+        if not response:
+            raise ValueError(f"{what} not found in the response dictionary")
+    if not isinstance(response, str):
+        raise TypeError(f"Expected a string for {what}, got {type(response).__name__} instead.")
+    return response
+
+
+def _invoke_llm(agent, func, *args):
+    """Make one blocking LLM call, counted, timed and traced per agent."""
+    with span(f"llm.{agent}"), LLM_SECONDS.time(agent=agent):
+        try:
+            response = func(*args)
+        except Exception:
+            LLM_CALLS.inc(agent=agent, outcome="error")
+            raise
+    LLM_CALLS.inc(agent=agent, outcome="ok")
+    text = response.get("text", "") if isinstance(response, dict) else response
+    if isinstance(text, str):
+        LLM_COMPLETION_TOKENS.inc(estimate_tokens(text), agent=agent)
+    return response
+
+
+async def _call_llm(agent, func, *args):
+    return await run_blocking(_invoke_llm, agent, func, *args)
+
+
+def _parse_agent_json(agent, response, schema):
+    """
+    Parse an agent's JSON answer and check it against the agent's
+    OUTPUT_SCHEMA.
+
+    Returns:
+        dict or None: The answer, or None when the caller should fall back
+    """
+    data = extract_json_from_llm_response(response)
+    if data is None:
+        LLM_OUTPUT_REJECTED.inc(agent=agent, reason="unparsable")
+        logger.warning(f"Failed to parse {agent} response JSON, using fallback")
+        return None
+    errors = validate_json(data, schema)
+    if errors:
+        LLM_OUTPUT_REJECTED.inc(agent=agent, reason="invalid")
+        logger.warning(f"{agent} response doesn't match its schema ({'; '.join(errors)}), using fallback")
+        return None
+    return data
+
+
+async def analyze_intent(user_query, similar_sql, usage=None):
+    """Step 1: run the IntentAgent and parse its JSON output (with fallback)."""
+    intent_response = await _call_llm("intent", get_intent_agent().analyze_intent, user_query, similar_sql, usage)
+    intent_data = _parse_agent_json("intent", intent_response, IntentAgent.OUTPUT_SCHEMA)
+    if intent_data is None:
+        intent_data = {
+            "operation_type": "SELECT",
+            "possible_tables": [],
+            "conditions": [],
+            "aggregations": [],
+            "intent_summary": user_query
+        }
+    return intent_data
+
+
+async def identify_tables(intent_data, usage=None):
+    """Step 2: run the TableAgent and parse its JSON output (with fallback)."""
+    tables_response = await _call_llm("tables", get_table_agent().identify_tables, intent_data, usage)
+    tables_data = _parse_agent_json("tables", tables_response, TableAgent.OUTPUT_SCHEMA)
+    if tables_data is None:
+        tables_data = {
+            "relevant_tables": get_schema_model().table_names[:2],
+            "justification": "Fallback selection due to parsing error"
+        }
+    return tables_data
+
+
+async def prune_columns(intent_data, tables_data, usage=None):
+    """Step 3: run the ColumnPruneAgent and parse its JSON output (with fallback)."""
+    columns_response = await _call_llm("columns", get_column_prune_agent().prune_columns, intent_data, tables_data, usage)
+    columns_data = _parse_agent_json("columns", columns_response, ColumnPruneAgent.OUTPUT_SCHEMA)
+    if columns_data is None:
+        columns_data = {
+            "columns": {table: ["*"] for table in tables_data.get("relevant_tables", get_schema_model().table_names[:2])},
+            "justification": "Fallback selection due to parsing error"
+        }
+    return columns_data
+
+
+async def fused_selection(user_query, similar_sql, usage=None):
+    """
+    Steps 1-3 in one LLM call ("fast" mode).
+
+    The fused output is split back into the intent / tables / columns
+    shapes the accurate path produces, keeping only known tables and
+    falling back the same way the separate agents do.
+
+    Returns:
+        tuple: (intent_data, tables_data, columns_data)
+    """
+    response = await _call_llm("fused", get_fused_selection_agent().select, user_query, similar_sql, usage)
+    data = _parse_agent_json("fused", response, FusedSelectionAgent.OUTPUT_SCHEMA)
+    if data is None:
+        data = {"justification": "Fallback selection due to parsing error"}
+
+    intent_data = {
+        "operation_type": data.get("operation_type", "SELECT"),
+        "possible_tables": data.get("relevant_tables", []),
+        "conditions": data.get("conditions", []),
+        "aggregations": data.get("aggregations", []),
+        "intent_summary": data.get("intent_summary", user_query)
+    }
+
+    table_names = get_schema_model().table_names
+    relevant_tables, _ = validate_table_names(data.get("relevant_tables") or [], table_names)
+    tables_data = {
+        "relevant_tables": list(dict.fromkeys(table.upper() for table in relevant_tables)) or table_names[:2],
+        "justification": data.get("justification", "")
+    }
+
+    selected = {table.upper(): cols for table, cols in (data.get("columns") or {}).items()}
+    columns_data = {
+        "columns": {table: selected.get(table.upper()) or ["*"] for table in tables_data["relevant_tables"]},
+        "justification": data.get("justification", "")
+    }
+    return intent_data, tables_data, columns_data
+
+
+def select_from_index(user_query, embedding=None):
+    """Steps 2-3 without the LLM: rank tables and columns with the schema index (None on failure)."""
+    try:
+        return get_schema_index().select(user_query, embedding)
+    except Exception as e:
+        logger.error(f"Schema index selection failed: {str(e)}")
+        return None
+
+
+async def embed_user_query(user_query):
+    """Embed the query once per request; None if the embedder is unavailable."""
+    try:
+        return await run_blocking(embed_query, user_query)
+    except Exception as e:
+        logger.warning(f"Could not embed user query: {str(e)}")
+        return None
+
+
+async def retrieve_examples(user_query, embedding=None):
+    """Step 4: fetch similar SQL hits from all stores; failures degrade to no examples."""
+    try:
+        return await run_blocking(retrieve_similar_sql_hits, user_query, SIMILAR_SQL_TOP_K, embedding)
+    except Exception as e:
+        logger.error(f"Error retrieving similar SQL: {str(e)}")
+        return []
+
+
+async def generate_sql(user_query, intent_data, tables_data, columns_data, similar_sql, usage=None):
+    """Step 5: build the generation prompt and ask the LLM for the SQL text."""
+    query_gen = get_query_generator()
+    prompt_data = query_gen.generate_sql_prompt(
+        user_query, intent_data, tables_data, columns_data, similar_sql, usage
+    )
+    sql_query = await _call_llm("sql", query_gen.generate_sql, prompt_data)
+    return _response_text(sql_query, "SQL query")
+
+
+def explain_sql(user_query, formatted_sql):
+    """Blocking explanation call, raising on failure (used by deferred jobs)."""
+    explanation = _invoke_llm("explanation", get_query_generator().generate_explanation, user_query, formatted_sql)
+    return _response_text(explanation, "explanation")
+
+
+async def generate_explanation(user_query, formatted_sql):
+    """Step 7: explain the SQL; failures degrade to a canned message."""
+    try:
+        return await run_blocking(explain_sql, user_query, formatted_sql)
+    except Exception as e:
+        logger.error(f"Error generating explanation: {str(e)}")
+        return EXPLANATION_UNAVAILABLE
+
+
+async def stream_blocking(func, *args):
+    """
+    Iterate a blocking generator (e.g. an LLM token stream) on the pipeline
+    thread pool, yielding its items to the event loop as they are produced.
+    Stopping early closes the underlying generator.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def produce():
+        iterator = func(*args)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, _StreamFailure(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    loop.run_in_executor(_executor, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, _StreamFailure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+class _StreamFailure:
+    def __init__(self, error):
+        self.error = error
+
+
+async def stream_sql(prompt_data, emit):
+    """Step 5, streaming: emit each SQL token as it arrives and return the full text."""
+    chunks = []
+    with span("llm.sql", streamed=True), LLM_SECONDS.time(agent="sql"):
+        try:
+            async for chunk in stream_blocking(get_query_generator().stream_sql, prompt_data):
+                chunks.append(chunk)
+                await emit("sql_token", {"text": chunk})
+        except Exception:
+            LLM_CALLS.inc(agent="sql", outcome="error")
+            raise
+    LLM_CALLS.inc(agent="sql", outcome="ok")
+    sql_query = "".join(chunks)
+    LLM_COMPLETION_TOKENS.inc(estimate_tokens(sql_query), agent="sql")
+    if not sql_query:
+        raise ValueError("SQL query not found in the streamed response")
+    return sql_query
+
+
+async def stream_explanation(user_query, formatted_sql, emit):
+    """Step 7, streaming: emit each explanation token; failures degrade to a canned message."""
+    chunks = []
+    with span("llm.explanation", streamed=True), LLM_SECONDS.time(agent="explanation"):
+        try:
+            async for chunk in stream_blocking(get_query_generator().stream_explanation, user_query, formatted_sql):
+                chunks.append(chunk)
+                await emit("explanation_token", {"text": chunk})
+        except Exception as e:
+            LLM_CALLS.inc(agent="explanation", outcome="error")
+            logger.error(f"Error generating explanation: {str(e)}")
+            return EXPLANATION_UNAVAILABLE
+    LLM_CALLS.inc(agent="explanation", outcome="ok")
+    explanation = "".join(chunks)
+    LLM_COMPLETION_TOKENS.inc(estimate_tokens(explanation), agent="explanation")
+    return explanation or EXPLANATION_UNAVAILABLE
+
+
+async def _stage(stage, awaitable):
+    """Await one pipeline stage, recording its latency histogram and trace span."""
+    start = time.perf_counter()
+    with span(stage):
+        try:
+            return await awaitable
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            logger.info(f"{stage} completed in {elapsed:.2f} seconds")
+
+
+async def _no_emit(event, data):
+    pass
+
+
+async def _explain(user_query, formatted_sql, explain, emit, stream_tokens):
+    """
+    Step 7 according to the explain mode.
+
+    Returns:
+        tuple: (explanation or None, explanation_id or None)
+    """
+    if explain == "none":
+        return None, None
+    if explain == "deferred":
+        explanation_id = submit_explanation(explain_sql, user_query, formatted_sql)
+        if explanation_id is None:
+            # Backlog full: answer as if explain="none" rather than queue without bound
+            logger.warning("Deferred explanation backlog is full, skipping the explanation")
+            return None, None
+        await emit("explanation_id", {"explanation_id": explanation_id})
+        return None, explanation_id
+
+    if stream_tokens:
+        explanation = await _stage("step7_explanation", stream_explanation(user_query, formatted_sql, emit))
+    else:
+        explanation = await _stage("step7_explanation", generate_explanation(user_query, formatted_sql))
+    await emit("explanation", {"explanation": explanation})
+    return explanation, None
+
+
+async def _run(user_query, debug_mode, emit, stream_tokens=False, explain="inline", embedding=None, mode=None):
+    """
+    Shared body of run_pipeline and stream_pipeline.
+
+    emit(event, data) is awaited as each stage finishes (intent, tables,
+    columns, examples, sql, explanation / explanation_id); with
+    stream_tokens the SQL and explanation are also emitted token by token
+    as the LLM produces them.
+
+    Every run feeds the /metrics histograms and counters; with debug_mode
+    the stage and LLM spans are also returned as debug_info["trace"].
+    """
+    if explain not in EXPLAIN_MODES:
+        raise ValueError(f"Unknown explain mode '{explain}', expected one of: {', '.join(EXPLAIN_MODES)}")
+    mode = mode or PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode '{mode}', expected one of: {', '.join(PIPELINE_MODES)}")
+
+    start = time.perf_counter()
+    with request_trace(enabled=debug_mode) as trace:
+        try:
+            result, outcome = await _run_steps(user_query, debug_mode, emit, stream_tokens, explain, embedding, mode)
+        except Exception:
+            REQUESTS.inc(mode=mode, outcome="error")
+            raise
+        if trace is not None:
+            result["debug_info"]["trace"] = trace.to_list()
+
+    elapsed = time.perf_counter() - start
+    REQUESTS.inc(mode=mode, outcome=outcome)
+    REQUEST_SECONDS.observe(elapsed, mode=mode)
+    logger.info(f"Pipeline ({mode}, {outcome}) completed in {elapsed:.2f} seconds")
+    return result
+
+
+async def _run_steps(user_query, debug_mode, emit, stream_tokens, explain, embedding, mode):
+    """
+    Returns:
+        tuple: (result dict, outcome: "cached" or "generated")
+    """
+    debug_info = {"pipeline_mode": mode} if debug_mode else {}
+    # Estimated prompt tokens per LLM stage (prompts/token_budget.py), debug only
+    usage = {} if debug_mode else None
+
+    if embedding is None:
+        embedding = await _stage("embedding", embed_user_query(user_query))
+    use_cache = SEMANTIC_CACHE_ENABLED and embedding is not None and not is_placeholder_embedder()
+
+    if use_cache:
+        cache = get_semantic_cache()
+        with span("semantic_cache.lookup") as attributes, STAGE_SECONDS.time(stage="semantic_cache"):
+            cached, similarity = cache.lookup(
+                embedding, modes=SEMANTIC_CACHE_ACCEPTED_MODES[mode], user_query=user_query
+            )
+            attributes["hit"] = cached is not None
+        if debug_mode:
+            debug_info["semantic_cache"] = {"hit": cached is not None, "similarity": similarity, **cache.stats()}
+        if cached is not None:
+            logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+            log_query(user_query, cached["sql"])
+            if debug_mode:
+                debug_info["semantic_cache"]["matched_query"] = cached["query"]
+            await emit("sql", {"sql": cached["sql"], "cached": True})
+            explanation, explanation_id = None, None
+            if explain != "none" and cached["explanation"] is not None:
+                # Already paid for: return it even when deferred was asked for
+                explanation = cached["explanation"]
+                await emit("explanation", {"explanation": explanation, "cached": True})
+            else:
+                explanation, explanation_id = await _explain(
+                    user_query, cached["sql"], explain, emit, stream_tokens
+                )
+            return {
+                "sql": cached["sql"],
+                "explanation": explanation,
+                "explanation_id": explanation_id,
+                "debug_info": debug_info if debug_mode else None
+            }, "cached"
+
+    # The schema index only needs the question, so it runs while retrieval and
+    # intent analysis wait on the vector stores and the LLM. select_from_index
+    # never raises, so the task is safe to abandon if a step before it fails.
+    # Nothing else overlaps retrieval: the intent and fused prompts include the
+    # examples, and each later step needs the one before it.
+    index_task = None
+    if mode != "fast" and SCHEMA_INDEX_ENABLED:
+        index_task = asyncio.create_task(
+            _stage("schema_index", run_blocking(select_from_index, user_query, embedding))
+        )
+
+    similar_hits = await _stage("step4_retrieval", retrieve_examples(user_query, embedding))
+    similar_sql = select_examples(similar_hits, SIMILAR_SQL_TOP_K)
+
+    if mode == "fast":
+        intent_data, tables_data, columns_data = await _stage(
+            "steps1_3_fused", fused_selection(user_query, similar_sql, usage)
+        )
+        await emit("intent", intent_data)
+        await emit("tables", tables_data)
+        await emit("columns", columns_data)
+    else:
+        intent_data = await _stage("step1_intent", analyze_intent(user_query, similar_sql, usage))
+        await emit("intent", intent_data)
+
+        selection = await index_task if index_task is not None else None
+        index_tables = selection is not None and selection["confidence"] >= SCHEMA_INDEX_MIN_CONFIDENCE
+        index_columns = index_tables and all(cols is not None for cols in selection["columns"].values())
+
+        if index_tables:
+            similarity = selection["similarities"][selection["relevant_tables"][0]]
+            tables_data = {
+                "relevant_tables": selection["relevant_tables"],
+                "justification": f"Schema index match (similarity {similarity:.3f})"
+            }
+        else:
+            tables_data = await _stage("step2_tables", identify_tables(intent_data, usage))
+        await emit("tables", tables_data)
+
+        if index_columns:
+            columns_data = {
+                "columns": selection["columns"],
+                "justification": "Columns closest to the question, plus the row key"
+            }
+        else:
+            columns_data = await _stage("step3_columns", prune_columns(intent_data, tables_data, usage))
+        await emit("columns", columns_data)
+
+        if debug_mode and selection is not None:
+            debug_info["schema_index"] = dict(selection, used_for_tables=index_tables, used_for_columns=index_columns)
+
+    if RETRIEVAL_ROUTE_BY_TABLES:
+        similar_sql = select_examples(
+            similar_hits, SIMILAR_SQL_TOP_K, tables_data.get("relevant_tables", [])
+        )
+    await emit("examples", {"similar_sql": similar_sql})
+
+    if debug_mode:
+        debug_info["intent_analysis"] = intent_data
+        debug_info["table_selection"] = tables_data
+        debug_info["column_selection"] = columns_data
+        debug_info["similar_sql"] = similar_sql
+
+    if stream_tokens:
+        prompt_data = get_query_generator().generate_sql_prompt(
+            user_query, intent_data, tables_data, columns_data, similar_sql, usage
+        )
+        sql_query = await _stage("step5_sql", stream_sql(prompt_data, emit))
+    else:
+        sql_query = await _stage("step5_sql", generate_sql(
+            user_query, intent_data, tables_data, columns_data, similar_sql, usage
+        ))
+    if debug_mode:
+        debug_info["prompt_tokens"] = dict(usage, total=sum(usage.values()))
+
+    with span("step6_format"), STAGE_SECONDS.time(stage="step6_format"):
+        formatted_sql = format_sql_query(sql_query)
+    await emit("sql", {"sql": formatted_sql})
+
+    explanation, explanation_id = await _explain(user_query, formatted_sql, explain, emit, stream_tokens)
+
+    # Log the query for auditing
+    log_query(user_query, formatted_sql)
+
+    if use_cache and explanation != EXPLANATION_UNAVAILABLE:
+        get_semantic_cache().store(embedding, user_query, formatted_sql, explanation, mode=mode)
+
+    return {
+        "sql": formatted_sql,
+        "explanation": explanation,
+        "explanation_id": explanation_id,
+        "debug_info": debug_info if debug_mode else None
+    }, "generated"
+
+
+async def run_pipeline(user_query, debug_mode=False, explain="inline", embedding=None, mode=None):
+    """
+    Run the full NL -> SQL pipeline.
+
+    The query is embedded once up front. That embedding is first checked
+    against the semantic cache, and on a hit the cached SQL and explanation
+    are returned without any LLM call. Otherwise it is reused for retrieving
+    similar SQL examples (step 4) from all vector stores at once. The global
+    top-k feeds the IntentAgent; SQL generation gets the top-k from the
+    stores matching the selected tables. Every blocking call goes through
+    run_blocking.
+
+    The steps run in sequence: retrieval, then intent, tables and columns
+    (or the one fused call), then SQL generation and the explanation. Only
+    the schema index (accurate mode) runs alongside, from retrieval until
+    table selection needs it.
+
+    Args:
+        user_query (str): The natural language query from the user
+        debug_mode (bool): Whether to collect intermediate results
+        explain (str): One of EXPLAIN_MODES
+        embedding (list, optional): Precomputed embedding of user_query
+        mode (str, optional): One of PIPELINE_MODES; PIPELINE_MODE when not given
+
+    Returns:
+        dict: {"sql": str, "explanation": str or None,
+               "explanation_id": str or None, "debug_info": dict or None}
+    """
+    return await _run(user_query, debug_mode, _no_emit, explain=explain, embedding=embedding, mode=mode)
+
+
+async def stream_pipeline(user_query, debug_mode=False, explain="inline", mode=None):
+    """
+    Run the pipeline and yield (event, data) pairs as it progresses.
+
+    Events, in order: intent, tables, columns, examples, sql_token*, sql,
+    then explanation_token* + explanation (inline) or explanation_id
+    (deferred) or nothing (none), then done (carrying debug_info when
+    requested) or error. A semantic cache hit skips straight to sql.
+    """
+    queue = asyncio.Queue()
+
+    async def emit(event, data):
+        await queue.put((event, data))
+
+    task = asyncio.create_task(_run(user_query, debug_mode, emit, stream_tokens=True, explain=explain, mode=mode))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Error generating SQL: {str(error)}")
+            yield "error", {"error": "Error generating SQL", "details": str(error)}
+        else:
+            yield "done", {"debug_info": task.result()["debug_info"]}
+    finally:
+        if not task.done():
+            task.cancel()
@@ -1,11 +1,13 @@
 from llm.llm_gateway import get_llm
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
-from config import TABLES
+from metadata.schema_model import get_schema_model
+from prompts import token_budget
 
 class QueryPromptGenerator:
     def __init__(self):
-        self.llm = get_llm()
+        self.llm = get_llm(chain="sql")
+        self.explanation_llm = get_llm(chain="explanation")
         
         # Prompt for generating the final SQL query
         self.sql_generation_prompt = ChatPromptTemplate.from_template(
@@ -55,9 +57,13 @@ class QueryPromptGenerator:
         )
         
         self.sql_chain = LLMChain(llm=self.llm, prompt=self.sql_generation_prompt)
-        self.explanation_chain = LLMChain(llm=self.llm, prompt=self.explanation_prompt)
+        self.explanation_chain = LLMChain(llm=self.explanation_llm, prompt=self.explanation_prompt)
+
+        # Runnable pipelines for token streaming
+        self.sql_stream_chain = self.sql_generation_prompt | self.llm
+        self.explanation_stream_chain = self.explanation_prompt | self.explanation_llm
     
-    def generate_sql_prompt(self, user_query, intent_data, tables_data, columns_data, sql_examples):
+    def generate_sql_prompt(self, user_query, intent_data, tables_data, columns_data, sql_examples, usage=None):
         """
         Generate a prompt for the SQL query generation
         
@@ -66,7 +72,9 @@ class QueryPromptGenerator:
             intent_data (dict): The intent analysis from IntentAgent
             tables_data (dict): The tables selected by TableAgent
             columns_data (dict): The columns selected by ColumnPruneAgent
-            sql_examples (list): Similar SQL examples for reference
+            sql_examples (list): Similar SQL examples for reference, most relevant first;
+                trimmed to the "sql" token budget
+            usage (dict, optional): Receives the estimated prompt tokens under "sql"
             
         Returns:
             dict: The prompt for SQL query generation
@@ -77,17 +85,15 @@ class QueryPromptGenerator:
         
         # Format table schemas
         relevant_tables = tables_data.get("relevant_tables", [])
-        table_schemas_formatted = []
-        
-        for table in relevant_tables:
-            selected_cols = columns_data.get("columns", {}).get(table, [])
-            if selected_cols:
-                cols_str = ", ".join(selected_cols)
-                table_schemas_formatted.append(f"{table} ({cols_str})")
-            else:
-                table_schemas_formatted.append(table)
-        
-        table_schemas = "\n".join(table_schemas_formatted)
+        schema_model = get_schema_model()
+        if token_budget.PROMPT_SCHEMA_STYLE == "compact":
+            render = schema_model.compact_table
+        else:
+            render = schema_model.column_subset
+        table_schemas = "\n".join(
+            render(table, columns_data.get("columns", {}).get(table) or [])
+            for table in relevant_tables
+        )
         
         # Format selected columns
         selected_columns_formatted = []
@@ -97,17 +103,16 @@ class QueryPromptGenerator:
         
         selected_columns = "\n".join(selected_columns_formatted)
         
-        # Format SQL examples
-        sql_examples_text = "\n".join([f"Example {i+1}: {sql}" for i, sql in enumerate(sql_examples)])
-        
-        return {
+        # Add as many SQL examples as the token budget allows
+        prompt_data = token_budget.fit_examples(self.sql_generation_prompt, {
             "user_query": user_query,
             "operation_type": operation_type,
             "intent_summary": intent_summary,
             "table_schemas": table_schemas,
-            "selected_columns": selected_columns,
-            "sql_examples": sql_examples_text
-        }
+            "selected_columns": selected_columns
+        }, sql_examples, "sql")
+        token_budget.record_usage(usage, "sql", self.sql_generation_prompt, prompt_data)
+        return prompt_data
     
     def generate_sql(self, prompt_data):
         """Generate the SQL query using the prepared prompt"""
@@ -115,7 +120,18 @@ class QueryPromptGenerator:
     
     def generate_explanation(self, user_query, sql_query):
         """Generate an explanation for the SQL query"""
-        return self.explanation_chain.invoke({
-            "user_query": user_query,
-            "sql_query": sql_query
-        })
\ No newline at end of file
+        inputs = {"user_query": user_query, "sql_query": sql_query}
+        token_budget.record_usage(None, "explanation", self.explanation_prompt, inputs)
+        return self.explanation_chain.invoke(inputs)
+
+    def stream_sql(self, prompt_data):
+        """Stream the SQL query text chunk by chunk as the LLM produces it"""
+        for chunk in self.sql_stream_chain.stream(prompt_data):
+            yield getattr(chunk, "content", chunk)
+
+    def stream_explanation(self, user_query, sql_query):
+        """Stream the explanation text chunk by chunk as the LLM produces it"""
+        inputs = {"user_query": user_query, "sql_query": sql_query}
+        token_budget.record_usage(None, "explanation", self.explanation_prompt, inputs)
+        for chunk in self.explanation_stream_chain.stream(inputs):
+            yield getattr(chunk, "content", chunk)
@@ -0,0 +1,79 @@
+import math
+
+from utils import metrics
+
+# Upper bound on the estimated input tokens per pipeline stage. Few-shot
+# examples are dropped (least similar first) until a prompt fits; schema text
+# is never cut, so a stage can still exceed its budget on a huge schema.
+PROMPT_TOKEN_BUDGETS = {
+    "intent": 1500,
+    "tables": 1500,
+    "columns": 2500,
+    "fused": 4000,
+    "sql": 3000,
+}
+
+# "compact": TABLE(COL type, ...) with abbreviated types, and only the pruned
+# columns in the SQL generation prompt. "ddl": the original full DDL text.
+PROMPT_SCHEMA_STYLE = "compact"
+
+# Average characters per token for English prompts mixed with SQL
+CHARS_PER_TOKEN = 4
+
+PROMPT_TOKENS = metrics.counter("llm_prompt_tokens_total", "Estimated prompt tokens sent per agent", ["agent"])
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for a prompt string; no tokenizer round-trip."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def prompt_tokens(prompt, inputs):
+    """Estimated tokens of a prompt template rendered with its inputs."""
+    return estimate_tokens(prompt.format(**inputs))
+
+
+def render_examples(examples):
+    return "\n".join([f"Example {i+1}: {sql}" for i, sql in enumerate(examples)])
+
+
+def fit_examples(prompt, inputs, examples, stage, field="sql_examples"):
+    """
+    Fill a prompt's few-shot examples field with as many examples as fit the
+    stage's token budget.
+
+    Examples are taken in the given (relevance) order; one that doesn't fit
+    is skipped and smaller later ones are still tried.
+
+    Args:
+        prompt: The prompt template the inputs are for
+        inputs (dict): The other prompt inputs
+        examples (list): Candidate SQL examples, most relevant first
+        stage (str): Key into PROMPT_TOKEN_BUDGETS
+
+    Returns:
+        dict: inputs with the examples field filled in
+    """
+    budget = PROMPT_TOKEN_BUDGETS.get(stage)
+    if budget is None:
+        return dict(inputs, **{field: render_examples(examples)})
+
+    used = prompt_tokens(prompt, dict(inputs, **{field: ""}))
+    kept = []
+    for sql in examples:
+        cost = estimate_tokens(f"Example {len(kept) + 1}: {sql}\n")
+        if used + cost <= budget:
+            kept.append(sql)
+            used += cost
+    return dict(inputs, **{field: render_examples(kept)})
+
+
+def record_usage(usage, stage, prompt, inputs):
+    """
+    Count the estimated prompt size of a stage in /metrics, and store it in
+    a per-request usage dict (if any).
+    """
+    tokens = prompt_tokens(prompt, inputs)
+    PROMPT_TOKENS.inc(tokens, agent=stage)
+    if usage is not None:
+        usage[stage] = tokens
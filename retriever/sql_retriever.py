@@ -1,78 +1,249 @@
+import contextvars
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.vectorstores.oraclevs import OracleVS, DistanceStrategy
 from llm.llm_gateway import get_embedder
-from config import ORACLE_COMPARTMENT_ID,VECTOR_STORE_PO, VECTOR_STORE_PR, VECTOR_STORE_LINE, VECTOR_STORE_GRN
-from db.db_pool import get_connection  # Assuming db_pool is initialized in db/db_pool.py
+from config import VECTOR_STORE_PO, VECTOR_STORE_PR, VECTOR_STORE_LINE, VECTOR_STORE_GRN
+from db.db_pool import pooled_connection
+from utils import metrics
+from utils.tracing import span
 
-def get_vectorstore():
-    embedding_model = get_embedder()
-    
-    try:
-        # Get connection from your db pool
-        db_connection = get_connection()
-        
-        vector_stores = {
-            "PO": OracleVS(
-                client=db_connection,
-                table_name=VECTOR_STORE_PO,
-                distance_strategy=DistanceStrategy.COSINE,
-                embedding_function=embedding_model.embed_query
-            ),
-            "PR": OracleVS(
-                client=db_connection,
-                table_name=VECTOR_STORE_PR,
-                distance_strategy=DistanceStrategy.COSINE,
-                embedding_function=embedding_model.embed_query
-            ),
-            "GRN": OracleVS(
-                client=db_connection,
-                table_name=VECTOR_STORE_GRN,
-                distance_strategy=DistanceStrategy.COSINE,
-                embedding_function=embedding_model.embed_query
-            ),
-            "LINE": OracleVS(
-                client=db_connection,
-                table_name=VECTOR_STORE_LINE,
-                distance_strategy=DistanceStrategy.COSINE,
-                embedding_function=embedding_model.embed_query
-            )
-        }
-        
-        # Return the first vector store for simplicity
-        if vector_stores:
-            return next(iter(vector_stores.values()))
-        return None
-    except Exception as e:
-        print(f"Error creating vector store: {str(e)}")
-        return None
+logger = logging.getLogger(__name__)
 
-def retrieve_similar_sql(user_query, top_k=3):
-    try:
-        if not user_query or not user_query.strip():
-            raise ValueError("User query is empty or invalid")
+VECTOR_SEARCH_SECONDS = metrics.histogram(
+    "vector_search_duration_seconds", "OracleVS similarity search latency per store", ["store"]
+)
 
-        vectorstore = get_vectorstore()
-        if not vectorstore:
-            raise ValueError("Vector store not initialized")
+VECTOR_STORE_TABLES = {
+    "PO": VECTOR_STORE_PO,
+    "PR": VECTOR_STORE_PR,
+    "GRN": VECTOR_STORE_GRN,
+    "LINE": VECTOR_STORE_LINE,
+}
 
-        # Generate embedding
-        embedding = vectorstore.embedding_function(user_query)
-        print(f"Embedding length: {len(embedding)}, sample: {embedding[:5]}")
+# Business tables whose example queries live in each vector store, used to
+# route retrieval to the stores relevant to the tables TableAgent picked.
+STORE_DOMAIN_TABLES = {
+    "PO": ["PO_NORM_TABLE_DUMMY"],
+    "PR": ["PR_DATA_DUMMY"],
+    "GRN": ["PO_INVOICE_DATA_DUMMY"],
+    "LINE": ["PO_LINE_TABLE_DUMMY"],
+}
 
-        # Validation: must be a list of non-zero floats
-        if (
-            not isinstance(embedding, list) or
-            len(embedding) == 0 or
-            all(v == 0 for v in embedding)
-        ):
-            raise ValueError("Invalid embedding: empty or all zero values")
+FALLBACK_SQL_EXAMPLES = [
+    "SELECT po.PO_NUM, po.ORDERED_AMOUNT FROM PO_NORM_TABLE_DUMMY po WHERE po.ORDERED_AMOUNT > 10000",
+    "SELECT pr.REQUISTION_NO, pr.CREATION_DATE FROM PR_DATA_DUMMY pr WHERE pr.CREATION_DATE > SYSDATE - 30",
+    "SELECT i.INVOICE_NUM, i.INVOICE_AMOUNT FROM PO_INVOICE_DATA_DUMMY i JOIN PO_NORM_TABLE_DUMMY p ON i.PO_NUMBER = p.PO_NUM"
+]
 
-        # Safe call
-        results = vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=top_k)
-        return [doc[0].page_content for doc in results]
+# Retrieval hits for the fallback examples, tagged with the store they would have come from
+FALLBACK_SQL_HITS = [
+    {"store": store, "sql": sql, "distance": None}
+    for store, sql in zip(["PO", "PR", "GRN"], FALLBACK_SQL_EXAMPLES)
+]
 
-    except Exception as e:
+
+def stores_for_tables(tables):
+    """
+    Map table names to the vector stores holding examples for them.
+
+    Returns:
+        list: Store names, or None when no table maps to a store (search all)
+    """
+    wanted = {table.upper() for table in tables or []}
+    stores = [store for store, domain in STORE_DOMAIN_TABLES.items() if wanted.intersection(domain)]
+    return stores or None
+
+
+def select_examples(hits, top_k=3, tables=None):
+    """
+    Pick the top_k example SQL strings from merged retrieval hits.
+
+    Args:
+        hits (list): Hits as returned by retrieve_similar_sql_hits, closest first
+        top_k (int): Number of examples to return
+        tables (list, optional): Only keep hits from the stores for these tables,
+            falling back to all hits when none match
+
+    Returns:
+        list: SQL example strings
+    """
+    stores = stores_for_tables(tables)
+    if stores:
+        routed = [hit for hit in hits if hit["store"] in stores]
+        if routed:
+            hits = routed
+    return [hit["sql"] for hit in hits[:top_k]]
+
+
+def is_placeholder_embedder():
+    """True when get_embedder() fell back to its constant-vector stand-in."""
+    return getattr(get_embedder(), "placeholder", False)
+
+def embed_query(user_query):
+    """
+    Embed a user query for vector search and semantic caching.
+
+    Raises:
+        ValueError: If the query is empty or the embedding is empty / all zero
+    """
+    if not user_query or not user_query.strip():
+        raise ValueError("User query is empty or invalid")
+
+    embedding = get_embedder().embed_query(user_query)
+    if (
+        not isinstance(embedding, list) or
+        len(embedding) == 0 or
+        all(v == 0 for v in embedding)
+    ):
+        raise ValueError("Invalid embedding: empty or all zero values")
+    return embedding
+
+
+class SQLRetriever:
+    """
+    Long-lived holder of the embedder and the OracleVS stores.
+
+    OracleVS keeps the connection it was built with and never returns it, and
+    building one embeds a probe string to size the table. So the stores are
+    built once on a borrowed connection, and each search runs on a shallow
+    copy bound to a connection that is borrowed from db_pool and released
+    as soon as the search finishes.
+
+    Queries fan out to all stores in parallel with the same embedding, so
+    retrieval latency is that of the slowest store rather than the sum.
+    """
+
+    def __init__(self):
+        self.embedder = get_embedder()
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(VECTOR_STORE_TABLES) * 4, thread_name_prefix="vector-search"
+        )
+        with pooled_connection() as connection:
+            self.stores = {
+                name: OracleVS(
+                    client=connection,
+                    table_name=table_name,
+                    distance_strategy=DistanceStrategy.COSINE,
+                    embedding_function=self.embedder.embed_query
+                )
+                for name, table_name in VECTOR_STORE_TABLES.items()
+            }
+        # The build connection went back to the pool; never search through it.
+        for store in self.stores.values():
+            store.client = None
+
+    def search(self, store_name, embedding, top_k=3):
+        """
+        Run a similarity search against one store on a pooled connection.
+
+        Returns:
+            list: (Document, distance) tuples, closest first
+        """
+        with span("vector_search", store=store_name), pooled_connection() as connection:
+            store = copy.copy(self.stores[store_name])
+            store.client = connection
+            start = time.perf_counter()
+            try:
+                return store.similarity_search_by_vector_with_relevance_scores(embedding, k=top_k)
+            finally:
+                VECTOR_SEARCH_SECONDS.observe(time.perf_counter() - start, store=store_name)
+
+    def _search_hits(self, store_name, embedding, top_k):
+        try:
+            results = self.search(store_name, embedding, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Vector search failed for store {store_name}: {str(e)}")
+            return []
         return [
-            "SELECT po.PO_NUM, po.ORDERED_AMOUNT FROM PO_NORM_TABLE_DUMMY po WHERE po.ORDERED_AMOUNT > 10000",
-            "SELECT pr.REQUISTION_NO, pr.CREATION_DATE FROM PR_DATA_DUMMY pr WHERE pr.CREATION_DATE > SYSDATE - 30",
-            "SELECT i.INVOICE_NUM, i.INVOICE_AMOUNT FROM PO_INVOICE_DATA_DUMMY i JOIN PO_NORM_TABLE_DUMMY p ON i.PO_NUMBER = p.PO_NUM"
+            {"store": store_name, "sql": doc.page_content, "distance": distance}
+            for doc, distance in results
+        ]
+
+    def search_stores(self, embedding, top_k=3, store_names=None):
+        """
+        Search several stores concurrently and merge the results by distance.
+
+        Args:
+            embedding (list): Query embedding, shared by every store
+            top_k (int): Results requested from each store
+            store_names (list, optional): Stores to search; all when not given
+
+        Returns:
+            list: Hit dicts {"store", "sql", "distance"}, closest first, with
+                duplicate SQL across stores collapsed to the closest hit
+        """
+        store_names = store_names or list(self.stores)
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, self._search_hits, name, embedding, top_k)
+            for name in store_names
         ]
+        hits = [hit for future in futures for hit in future.result()]
+        if not hits:
+            raise ValueError("No results from any vector store")
+
+        hits.sort(key=lambda hit: hit["distance"])
+        merged, seen = [], set()
+        for hit in hits:
+            if hit["sql"] not in seen:
+                seen.add(hit["sql"])
+                merged.append(hit)
+        return merged
+
+    def retrieve(self, user_query, top_k=3, embedding=None, tables=None):
+        """
+        Retrieve the SQL examples most similar to the user's query.
+
+        Args:
+            user_query (str): The natural language query from the user
+            top_k (int): Number of examples to return
+            embedding (list, optional): Precomputed embedding of user_query
+            tables (list, optional): Only search the stores for these tables
+
+        Returns:
+            list: SQL example strings
+        """
+        if embedding is None:
+            embedding = embed_query(user_query)
+        hits = self.search_stores(embedding, top_k=top_k, store_names=stores_for_tables(tables))
+        return [hit["sql"] for hit in hits[:top_k]]
+
+
+retriever = None
+_retriever_lock = threading.Lock()
+
+def init_retriever():
+    """Build the shared retriever; call once the DB pool is initialized."""
+    global retriever
+    with _retriever_lock:
+        if retriever is None:
+            retriever = SQLRetriever()
+    return retriever
+
+def get_retriever():
+    return init_retriever()
+
+
+def retrieve_similar_sql(user_query, top_k=3, embedding=None, tables=None):
+    try:
+        return get_retriever().retrieve(user_query, top_k=top_k, embedding=embedding, tables=tables)
+    except Exception as e:
+        logger.error(f"Error retrieving similar SQL, using fallback examples: {str(e)}")
+        return list(FALLBACK_SQL_EXAMPLES)
+
+def retrieve_similar_sql_hits(user_query, top_k=3, embedding=None):
+    """
+    Search every store once and return all merged hits (top_k per store), so
+    callers can take a global top-k now and a table-routed top-k later
+    without searching again.
+    """
+    try:
+        if embedding is None:
+            embedding = embed_query(user_query)
+        return get_retriever().search_stores(embedding, top_k=top_k)
+    except Exception as e:
+        logger.error(f"Error retrieving similar SQL, using fallback examples: {str(e)}")
+        return list(FALLBACK_SQL_HITS)
@@ -0,0 +1,4 @@
+from metadata import schema_loader
+
+# Tests run against the whole built-in schema, whatever config.TABLES lists
+schema_loader.SCHEMA_TABLES = None
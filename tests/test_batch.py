@@ -0,0 +1,23 @@
+from benchmarks.fakes import stand_in_embedding
+from pipeline.batch import group_duplicates
+
+
+def _group(queries, threshold=0.8):
+    return group_duplicates(queries, [stand_in_embedding(q) for q in queries], threshold=threshold)
+
+
+def test_identical_text_is_grouped_without_embeddings():
+    queries = ["Open POs", "open pos ", "Closed POs"]
+    assert group_duplicates(queries) == [(0, [0, 1]), (2, [2])]
+
+
+def test_near_duplicates_are_grouped():
+    queries = ["show the open POs for ACME", "show open POs for ACME", "list requisitions by department"]
+    assert _group(queries) == [(0, [0, 1]), (2, [2])]
+
+
+def test_different_literals_are_not_grouped():
+    queries = ["top 10 suppliers by ordered amount", "top 20 suppliers by ordered amount",
+               "top 10 suppliers by the ordered amount", "open POs for supplier 'ACME' this year",
+               "open POs for supplier 'Globex' this year"]
+    assert _group(queries) == [(0, [0, 2]), (1, [1]), (3, [3]), (4, [4])]
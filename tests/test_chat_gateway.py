@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from llm import chat_gateway
+from llm.chat_gateway import LLMTimeoutError, ModelChannel
+
+
+def _together(count, func):
+    """Run func in count threads released at once; returns their results in order."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = func()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_calls_share_one_execution():
+    channel = ModelChannel("test")
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "answer"
+
+    assert _together(4, lambda: channel.call("key", slow)) == ["answer"] * 4
+    assert len(calls) == 1
+    assert channel.running == 0
+
+
+def test_identical_streams_share_one_model_stream():
+    channel = ModelChannel("test")
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        for i in range(5):
+            time.sleep(0.02)
+            yield i
+
+    assert _together(4, lambda: list(channel.stream("key", open_stream))) == [[0, 1, 2, 3, 4]] * 4
+    assert len(opened) == 1
+    assert channel.running == 0
+
+
+def test_streams_for_different_requests_are_not_shared():
+    channel = ModelChannel("test")
+    results = _together(2, lambda: list(channel.stream(threading.current_thread().name, lambda: iter("ab"))))
+    assert results == [["a", "b"], ["a", "b"]]
+
+
+def test_stalled_stream_times_out_and_is_closed(monkeypatch):
+    monkeypatch.setattr(chat_gateway, "LLM_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(chat_gateway, "LLM_MAX_RETRIES", 0)
+    channel = ModelChannel("test")
+    sent = []
+
+    def open_stream():
+        yield "first"
+        time.sleep(0.5)
+        sent.append("second")
+        yield "second"
+        sent.append("third")
+        yield "third"
+
+    received = []
+    with pytest.raises(LLMTimeoutError):
+        for chunk in channel.stream("key", open_stream):
+            received.append(chunk)
+    assert received == ["first"]
+    time.sleep(0.5)
+    # The worker stopped at the chunk after the stall and gave its slot back
+    assert sent == ["second"]
+    assert channel.running == 0
+
+
+def test_stream_errors_before_the_first_chunk_are_retried(monkeypatch):
+    monkeypatch.setattr(chat_gateway, "backoff_delay", lambda attempt: 0)
+    channel = ModelChannel("test")
+    attempts = []
+
+    def open_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        yield "ok"
+
+    assert list(channel.stream("key", open_stream)) == ["ok"]
+    assert len(attempts) == 2
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import oracledb
+import pytest
+
+from benchmarks.fakes import FakeAsyncPool, FakeCursor
+from db import cost_guard, sql_executor
+
+BOUND_QUERY = "SELECT PO_NUMBER, SUPPLIER_NAME FROM PO_NORM_TABLE_DUMMY WHERE PO_NUMBER = :po_number"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakeAsyncPool()
+    pool.discarded = 0
+
+    async def release(connection, discard=False):
+        pool.discarded += discard
+        await pool.release(connection)
+
+    monkeypatch.setattr(sql_executor, "get_async_connection", pool.acquire)
+    monkeypatch.setattr(sql_executor, "release_async_connection", release)
+    cost_guard.plan_cache.clear()
+    yield pool
+    cost_guard.plan_cache.clear()
+
+
+def _open(**kwargs):
+    async def run():
+        connection, cursor, _, assessment = await sql_executor.open_query(BOUND_QUERY, **kwargs)
+        await sql_executor.close_query(connection, cursor)
+        return assessment
+    return asyncio.run(run())
+
+
+def test_bound_query_is_explained(pool):
+    assessment = _open(binds={"po_number": "PO00000001"}, guard_mode="warn")
+    assert assessment is not None
+    assert assessment.action == "allow"
+    assert assessment.plan.cost == pool.plan[0]
+
+
+def test_expensive_bound_query_is_rejected(pool):
+    pool.plan = (cost_guard.COST_GUARD_MAX_COST + 1, 10, 0)
+    with pytest.raises(cost_guard.QueryTooExpensiveError):
+        _open(binds={"po_number": "PO00000001"}, guard_mode="reject")
+    assert pool.busy == 0
+
+
+def test_plans_are_cached_per_literal_values(pool):
+    async def assess(sql_query):
+        connection = await pool.acquire()
+        try:
+            return await cost_guard.assess_query(connection, sql_query, mode="warn")
+        finally:
+            await pool.release(connection)
+
+    async def run():
+        first = await assess("select PO_NUMBER from PO_NORM_TABLE_DUMMY where PO_STATUS = 'OPEN'")
+        pool.plan = (cost_guard.COST_GUARD_MAX_COST + 1, 10, 0)
+        relaid = await assess("SELECT po_number\n  FROM po_norm_table_dummy WHERE po_status = 'OPEN'")
+        other = await assess("select PO_NUMBER from PO_NORM_TABLE_DUMMY where PO_STATUS = 'CLOSED'")
+        return first, relaid, other
+
+    first, relaid, other = asyncio.run(run())
+    assert relaid.plan is first.plan
+    assert other.action == "warn"
+    assert cost_guard.plan_cache.stats()["entries"] == 2
+
+
+def _failing_explain(monkeypatch, full_code):
+    open_cursor = FakeCursor._open
+
+    def _open(self, sql, binds):
+        if sql.startswith("EXPLAIN PLAN"):
+            raise oracledb.Error(SimpleNamespace(full_code=full_code, message="explain failed"))
+        return open_cursor(self, sql, binds)
+
+    monkeypatch.setattr(FakeCursor, "_open", _open)
+
+
+def test_explain_timeout_discards_the_connection(pool, monkeypatch):
+    _failing_explain(monkeypatch, "DPY-4024")
+    with pytest.raises(sql_executor.QueryTimeoutError):
+        _open(binds={"po_number": "PO00000001"}, guard_mode="warn")
+    assert pool.discarded == 1
+    assert pool.busy == 0
+
+
+def test_explain_failure_lets_the_query_run(pool, monkeypatch):
+    _failing_explain(monkeypatch, "ORA-00942")
+    assert _open(binds={"po_number": "PO00000001"}, guard_mode="reject") is None
+    assert pool.discarded == 0
@@ -0,0 +1,58 @@
+import sqlite3
+
+from llm.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_repeated_texts_are_embedded_once():
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, model_id="m", path=None)
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cache.embed_query("bb") == [2.0, 1.0]
+    assert model.texts == ["a", "bb"]
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2}
+
+
+def test_memory_is_lru_bounded():
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, model_id="m", path=None, max_entries=2)
+    cache.embed_documents(["a", "b"])
+    cache.embed_query("a")
+    cache.embed_query("c")
+    cache.embed_documents(["a", "b"])
+    assert model.texts == ["a", "b", "c", "b"]
+
+
+def test_store_survives_restarts_and_is_pruned(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddings(CountingEmbeddings(), model_id="m", path=path).embed_documents(["a", "b", "c"])
+
+    model = CountingEmbeddings()
+    CachedEmbeddings(model, model_id="m", path=path).embed_documents(["a", "b", "c"])
+    assert model.texts == []
+
+    # Over the bound the oldest writes go, down to 90% of it
+    CachedEmbeddings(model, model_id="m", path=path, max_stored_entries=2)
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1
+    CachedEmbeddings(model, model_id="m", path=path).embed_documents(["a", "b", "c"])
+    assert model.texts == ["a", "b"]
+
+
+def test_unreadable_store_counts_as_misses(tmp_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, model_id="m", path=str(tmp_path / "embeddings.sqlite3"))
+    cache._db.execute("DROP TABLE embeddings")
+    assert cache.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert model.texts == ["a"]
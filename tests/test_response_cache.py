@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from llm import response_cache
+from llm.response_cache import LLMResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_is_lru_bounded():
+    cache = LLMResponseCache(path=None, max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert [cache.get(key) for key in "abc"] == ["A", None, "C"]
+
+
+def test_hits_and_misses_are_counted_per_chain():
+    cache = LLMResponseCache(path=None)
+    cache.put("a", "A")
+    cache.get("a", "sql")
+    cache.get("b", "sql")
+    cache.get("a", "intent")
+    assert cache.stats()["chains"] == {"sql": {"hits": 1, "misses": 1}, "intent": {"hits": 1, "misses": 0}}
+
+
+def test_entries_expire(clock, tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = LLMResponseCache(path=path, ttl=60)
+    cache.put("a", "A")
+    clock[0] += 59
+    assert cache.get("a") == "A"
+    clock[0] += 2
+    assert cache.get("a") is None
+    # ... on disk too, and are pruned when the store is opened
+    assert LLMResponseCache(path=path, ttl=60).get("a") is None
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+
+def test_store_survives_restarts_and_is_pruned(clock, tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = LLMResponseCache(path=path, max_stored_entries=10)
+    for i in range(11):
+        clock[0] += 1
+        cache.put(str(i), f"response {i}")
+    # Over the bound the oldest rows go, down to 90% of it
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 9
+
+    reopened = LLMResponseCache(path=path, max_stored_entries=10)
+    assert reopened.get("1") is None
+    assert reopened.get("10") == "response 10"
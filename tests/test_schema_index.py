@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import stand_in_embedding
+from llm.embedding_cache import CachedEmbeddings
+from metadata import schema_loader
+from metadata.schema_index import SCHEMA_INDEX_MIN_CONFIDENCE, SchemaIndex
+from metadata.schema_model import SchemaModel, get_schema_model, parse_ddl
+from pipeline import sql_pipeline
+
+
+class StandInEmbedder:
+    """The stand-in server's bag-of-words embedding, in process."""
+
+    def embed_documents(self, texts):
+        return [stand_in_embedding(text) for text in texts]
+
+    def embed_query(self, text):
+        return stand_in_embedding(text)
+
+
+def _index(model=None):
+    embedder = CachedEmbeddings(StandInEmbedder(), model_id="stand-in", path=None)
+    return SchemaIndex(model or get_schema_model(), embedder=embedder)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return _index()
+
+
+def test_clear_question_is_answered_by_the_index(index):
+    selection = index.select("Show PO numbers with status and supplier name")
+    assert selection["relevant_tables"] == ["PO_NORM_TABLE_DUMMY"]
+    assert selection["confidence"] >= SCHEMA_INDEX_MIN_CONFIDENCE
+    assert selection["columns"]["PO_NORM_TABLE_DUMMY"] == ["PO_NUM", "PO_STATUS", "SUPPLIER_NAME"]
+
+
+def test_unrelated_question_has_no_confidence(index):
+    assert index.select("What is the weather in Paris today")["confidence"] == 0
+
+
+def test_amount_columns_in_every_table_are_ambiguous(index):
+    selection = index.select("Show POs with total amount greater than 10000")
+    assert selection["confidence"] < SCHEMA_INDEX_MIN_CONFIDENCE
+    assert selection["columns"]["PO_NORM_TABLE_DUMMY"] is None
+
+
+def test_ambiguous_question_is_below_threshold(index):
+    # Invoice amounts live in three tables; the index must not settle it alone
+    selection = index.select("Show invoice amounts for purchase orders from supplier ACME")
+    assert selection["confidence"] < SCHEMA_INDEX_MIN_CONFIDENCE
+
+
+def test_data_dictionary_comments_are_matched():
+    schema_map, table_info = schema_loader.current_schema()
+    comments = {"DEPARTMENT": "cost centre raising the request"}
+    table_info["PR_DATA_DUMMY"] = {
+        "columns": [
+            {"name": name, "type": data_type, "comment": comments.get(name)}
+            for name, data_type in parse_ddl(schema_map["PR_DATA_DUMMY"])
+        ],
+        "comment": "purchase requisitions",
+    }
+    selection = _index(SchemaModel(schema_map, table_info)).select("purchase requisitions per cost centre")
+    assert selection["relevant_tables"] == ["PR_DATA_DUMMY"]
+    assert selection["columns"]["PR_DATA_DUMMY"] == ["REQUISTION_NO", "DEPARTMENT"]
+
+
+def test_nothing_is_selected_without_embeddings():
+    selection = SchemaIndex(get_schema_model()).select("Show PO numbers with status and supplier name")
+    assert selection["relevant_tables"] == []
+    assert selection["confidence"] == 0
+
+
+@pytest.mark.parametrize("question", [
+    "What is the weather in Paris today",
+    "Show invoice amounts for purchase orders from supplier ACME",
+])
+def test_low_confidence_falls_back_to_the_agents(monkeypatch, question):
+    calls = []
+
+    async def fake_embed(user_query):
+        return None
+
+    async def fake_retrieve(user_query, embedding=None):
+        return []
+
+    async def fake_intent(user_query, similar_sql, usage=None):
+        return {"intent_summary": user_query}
+
+    async def fake_tables(intent_data, usage=None):
+        calls.append("tables")
+        return {"relevant_tables": ["PO_INVOICE_DATA_DUMMY"], "justification": ""}
+
+    async def fake_columns(intent_data, tables_data, usage=None):
+        calls.append("columns")
+        return {"columns": {"PO_INVOICE_DATA_DUMMY": ["PO_NUMBER"]}, "justification": ""}
+
+    async def fake_generate(user_query, intent_data, tables_data, columns_data, similar_sql, usage=None):
+        return "select PO_NUMBER from PO_INVOICE_DATA_DUMMY"
+
+    monkeypatch.setattr(sql_pipeline, "embed_user_query", fake_embed)
+    monkeypatch.setattr(sql_pipeline, "retrieve_examples", fake_retrieve)
+    monkeypatch.setattr(sql_pipeline, "analyze_intent", fake_intent)
+    monkeypatch.setattr(sql_pipeline, "identify_tables", fake_tables)
+    monkeypatch.setattr(sql_pipeline, "prune_columns", fake_columns)
+    monkeypatch.setattr(sql_pipeline, "generate_sql", fake_generate)
+    monkeypatch.setattr(sql_pipeline, "get_schema_index", _index)
+    monkeypatch.setattr(sql_pipeline, "log_query", lambda *args: None)
+
+    result = asyncio.run(sql_pipeline.run_pipeline(question, debug_mode=True, explain="none", mode="accurate"))
+
+    assert calls == ["tables", "columns"]
+    assert result["debug_info"]["schema_index"]["used_for_tables"] is False
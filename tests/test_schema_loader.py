@@ -0,0 +1,17 @@
+from metadata import schema_loader
+from metadata.schema_model import SchemaModel
+
+SCHEMA = {
+    "NEW_TABLE": "NEW_TABLE(\n        ID NUMBER\n    )",
+    "PO_NORM_TABLE_DUMMY": "PO_NORM_TABLE_DUMMY(\n        PO_NUM VARCHAR2(256)\n    )",
+}
+
+
+def test_loaded_tables_are_offered_without_a_config_change():
+    assert schema_loader.table_names(SCHEMA) == ["NEW_TABLE", "PO_NORM_TABLE_DUMMY"]
+    assert SchemaModel(SCHEMA).table_names == ["NEW_TABLE", "PO_NORM_TABLE_DUMMY"]
+
+
+def test_schema_tables_filters_the_loaded_tables(monkeypatch):
+    monkeypatch.setattr(schema_loader, "SCHEMA_TABLES", ["po_norm_table_dummy", "MISSING_TABLE"])
+    assert schema_loader.table_names(SCHEMA) == ["PO_NORM_TABLE_DUMMY"]
@@ -0,0 +1,40 @@
+import pytest
+
+from benchmarks.fakes import stand_in_embedding
+from cache.semantic_cache import SemanticCache, question_literals
+
+
+@pytest.mark.parametrize("question, literals", [
+    ("top 10 suppliers by spend", ("10",)),
+    ("orders over 10,000 from 'ACME'", ("10000", "ACME")),
+    ('invoices for "Globex" above 2.5', ("Globex", "2.5")),
+    ("the supplier's open orders", ()),
+])
+def test_question_literals(question, literals):
+    assert question_literals(question) == literals
+
+
+def test_hits_require_the_same_literals():
+    cache = SemanticCache(similarity_threshold=0.7)
+    stored = "POs with total amount greater than 10000"
+    cache.store(stand_in_embedding(stored), stored, "SELECT ... > 10000", None)
+
+    other = "POs with total amount greater than 50000"
+    entry, similarity = cache.lookup(stand_in_embedding(other), user_query=other)
+    assert entry is None and similarity >= 0.7
+    assert cache.stats()["literal_mismatches"] == 1
+
+    same = "POs with total amount greater than 10,000"
+    entry, _ = cache.lookup(stand_in_embedding(same), user_query=same)
+    assert entry["sql"] == "SELECT ... > 10000"
+
+
+def test_closest_entry_with_matching_literals_wins():
+    cache = SemanticCache(similarity_threshold=0.5)
+    for limit in ("10", "20"):
+        question = f"top {limit} suppliers by ordered amount"
+        cache.store(stand_in_embedding(question), question, f"FETCH FIRST {limit} ROWS ONLY", None)
+
+    question = "top 20 suppliers by ordered amount"
+    entry, _ = cache.lookup(stand_in_embedding(question), user_query=question)
+    assert entry["sql"] == "FETCH FIRST 20 ROWS ONLY"
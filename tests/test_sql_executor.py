@@ -0,0 +1,64 @@
+import pytest
+
+from db.sql_executor import (
+    EXECUTE_MAX_ROWS, InvalidPageTokenError, UnsupportedStatementError, _serialize_page, encode_page_token,
+    paginate_sql, resolve_page,
+)
+
+CLAUSE = "OFFSET :row_offset ROWS FETCH NEXT :row_limit ROWS ONLY"
+ORDERED = "SELECT PO_NUM FROM PO_NORM_TABLE_DUMMY ORDER BY PO_NUM"
+UNORDERED = "SELECT PO_NUM FROM PO_NORM_TABLE_DUMMY"
+
+
+def test_row_limit_is_appended_on_its_own_line():
+    assert paginate_sql(ORDERED + ";") == f"{ORDERED}\n{CLAUSE}"
+    assert paginate_sql(ORDERED + " -- newest first") == f"{ORDERED} -- newest first\n{CLAUSE}"
+
+
+@pytest.mark.parametrize("query", [
+    "select offset, fetch_date from t",
+    "select a from t where b = 'OFFSET 5 ROWS'",
+    "select a from t /* fetch first 1 rows only */",
+    "select a from (select a from t order by a fetch first 5 rows only) x",
+])
+def test_fetch_and_offset_outside_the_top_level_are_not_row_limits(query):
+    assert paginate_sql(query) == f"{query}\n{CLAUSE}"
+
+
+@pytest.mark.parametrize("query", [
+    "select a from t order by a fetch first 5 rows only",
+    "select a from t offset :skip rows",
+])
+def test_limited_queries_are_wrapped(query):
+    assert paginate_sql(query) == f"SELECT * FROM (\n{query}\n) {CLAUSE}"
+
+
+@pytest.mark.parametrize("query", ["delete from t", "update t set a = 1", "begin null; end", ""])
+def test_only_queries_are_paginated(query):
+    with pytest.raises(UnsupportedStatementError):
+        paginate_sql(query)
+    with pytest.raises(UnsupportedStatementError):
+        resolve_page(query)
+
+
+def test_page_token_round_trip():
+    assert resolve_page(ORDERED) == (0, EXECUTE_MAX_ROWS)
+    assert resolve_page(ORDERED, page_token=encode_page_token(ORDERED, 50, 25)) == (50, 25)
+    assert resolve_page(ORDERED, page_size=10, page_token=encode_page_token(ORDERED, 50, 25)) == (50, 10)
+
+
+@pytest.mark.parametrize("token", [encode_page_token(ORDERED + " DESC", 50, 25), "not-a-token"])
+def test_foreign_or_malformed_page_tokens_are_rejected(token):
+    with pytest.raises(InvalidPageTokenError):
+        resolve_page(ORDERED, page_token=token)
+
+
+def test_unordered_queries_get_no_page_tokens():
+    with pytest.raises(InvalidPageTokenError):
+        resolve_page(UNORDERED, page_token=encode_page_token(UNORDERED, 50, 25))
+
+    rows = [{"PO_NUM": str(i)} for i in range(3)]
+    _, _, headers = _serialize_page(UNORDERED, "rows", ["PO_NUM"], rows, 0, 2)
+    assert headers == {"X-Truncated": "true"}
+    _, _, headers = _serialize_page(ORDERED, "rows", ["PO_NUM"], rows, 0, 2)
+    assert resolve_page(ORDERED, page_token=headers["X-Next-Page-Token"]) == (2, 2)
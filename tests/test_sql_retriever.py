@@ -0,0 +1,68 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from retriever import sql_retriever
+from retriever.sql_retriever import SQLRetriever, select_examples, stores_for_tables
+
+
+class CannedStore:
+    """Vector store stand-in returning fixed (sql, distance) hits, or failing."""
+
+    def __init__(self, hits=(), error=None):
+        self.client = None
+        self.hits = hits
+        self.error = error
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        if self.error:
+            raise self.error
+        return [(Document(page_content=sql, metadata={}), distance) for sql, distance in self.hits[:k]]
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    monkeypatch.setattr(sql_retriever, "get_embedder", lambda: SimpleNamespace(embed_query=None))
+    monkeypatch.setattr(sql_retriever, "OracleVS", lambda **kwargs: CannedStore())
+    monkeypatch.setattr(sql_retriever, "pooled_connection", lambda: contextlib.nullcontext(object()))
+    retriever = SQLRetriever()
+    yield retriever
+    retriever._executor.shutdown()
+
+
+def test_tables_route_to_their_stores():
+    assert stores_for_tables(["po_norm_table_dummy", "PO_LINE_TABLE_DUMMY"]) == ["PO", "LINE"]
+    assert stores_for_tables(["UNKNOWN"]) is None
+    assert stores_for_tables(None) is None
+
+
+def test_select_examples_prefers_routed_stores():
+    hits = [
+        {"store": "PR", "sql": "a", "distance": 0.1},
+        {"store": "PO", "sql": "b", "distance": 0.2},
+        {"store": "PO", "sql": "c", "distance": 0.3},
+    ]
+    assert select_examples(hits, top_k=2) == ["a", "b"]
+    assert select_examples(hits, top_k=2, tables=["PO_NORM_TABLE_DUMMY"]) == ["b", "c"]
+    # No hit from the routed store: keep the global ranking
+    assert select_examples(hits, top_k=2, tables=["PO_LINE_TABLE_DUMMY"]) == ["a", "b"]
+
+
+def test_hits_merge_by_distance_across_stores(retriever):
+    retriever.stores["PO"] = CannedStore([("po", 0.3), ("shared", 0.4)])
+    retriever.stores["PR"] = CannedStore([("shared", 0.1), ("pr", 0.5)])
+    retriever.stores["GRN"] = CannedStore(error=RuntimeError("store down"))
+
+    hits = retriever.search_stores([1.0], top_k=2)
+    assert [(hit["store"], hit["sql"]) for hit in hits] == [("PR", "shared"), ("PO", "po"), ("PR", "pr")]
+
+    hits = retriever.search_stores([1.0], top_k=2, store_names=["PO"])
+    assert [hit["sql"] for hit in hits] == ["po", "shared"]
+
+
+def test_no_hits_from_any_store_is_an_error(retriever):
+    retriever.stores["PO"] = CannedStore(error=RuntimeError("store down"))
+    with pytest.raises(ValueError):
+        retriever.search_stores([1.0])
@@ -0,0 +1,85 @@
+import pytest
+
+from utils.sql_utils import (
+    JSONObjectScanner, analyze_sql, extract_json_from_llm_response, format_sql_query, normalize_sql, tokenize_sql
+)
+
+
+def _feed(chunks):
+    scanner = JSONObjectScanner()
+    results = [scanner.feed(chunk) for chunk in chunks]
+    return scanner, results
+
+
+def test_tokenize_kinds():
+    tokens = tokenize_sql("select a.b, :po, .5, 1e3 -- c\n/*d*/ x<>y \"Q\" 'it''s'")
+    assert [(kind, text) for kind, text, _ in tokens] == [
+        ("word", "select"), ("word", "a"), ("op", "."), ("word", "b"), ("op", ","), ("bind", ":po"),
+        ("op", ","), ("number", ".5"), ("op", ","), ("number", "1e3"), ("comment", "-- c"),
+        ("comment", "/*d*/"), ("word", "x"), ("op", "<>"), ("word", "y"), ("quoted", '"Q"'),
+        ("string", "'it''s'"),
+    ]
+    assert [spaced for _, _, spaced in tokens][:3] == [False, True, False]
+
+
+def test_format_breaks_before_clauses():
+    assert format_sql_query("select a from t left join u on 1=1 where b = 1") == (
+        "select a\n  from t\n  left join u on 1=1\n  where b = 1"
+    )
+
+
+def test_format_leaves_strings_comments_and_names_alone():
+    query = "select x.from_date, 'a from b' /* where */ from t"
+    assert format_sql_query(query) == "select x.from_date, 'a from b' /* where */\n  from t"
+
+
+def test_format_indents_subqueries():
+    assert format_sql_query("select a from (select b from c) d") == (
+        "select a\n  from (select b\n    from c) d"
+    )
+
+
+def test_fingerprint_ignores_layout_and_case():
+    raw = "select a, b\nfrom   t where x = 1 and y = 'A';"
+    assert normalize_sql(raw) == normalize_sql(format_sql_query(raw).upper())
+    assert normalize_sql(raw) == ("SELECT A,B FROM T WHERE X=? AND Y=?", ["1", "'A'"])
+
+
+def test_different_literals_keep_the_fingerprint():
+    first, first_literals = normalize_sql("select a from t where x = 1")
+    second, second_literals = normalize_sql("select a from t where x = 2")
+    assert first == second
+    assert first_literals != second_literals
+
+
+def test_tables_and_columns():
+    analysis = analyze_sql(
+        "WITH q AS (SELECT a FROM s.x) SELECT t.col1, SUM(u.col2) total FROM t JOIN u ON t.id = u.id, q "
+        "WHERE t.name = 'FROM z' ORDER BY total"
+    )
+    assert analysis.tables == ["S.X", "T", "U"]
+    assert "COL1" in analysis.columns and "COL2" in analysis.columns
+    assert "TOTAL" not in analysis.columns
+    assert "Z" not in analysis.identifiers
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_scanner_ignores_braces_and_escaped_quotes_in_strings(size):
+    text = 'Here you go {not json} {"sql": "select \'{\' from t", "note": "a \\"}\\" b", "n": {"x": 1}} trailing {'
+    scanner, results = _feed([text[i:i + size] for i in range(0, len(text), size)])
+    assert scanner.value == {"sql": "select '{' from t", "note": 'a "}" b', "n": {"x": 1}}
+    assert text[:scanner.end].endswith('{"x": 1}}')
+    # None until the closing brace arrives, then the object on every call
+    assert results[-1] == scanner.value
+    assert results.index(scanner.value) == (scanner.end - 1) // size
+
+
+def test_scanner_waits_for_an_escape_split_across_chunks():
+    scanner, results = _feed(['{"a": "x\\', '"', '"}'])
+    assert results == [None, None, {"a": 'x"'}]
+
+
+def test_truncated_object_is_not_returned():
+    scanner, results = _feed(['{"intent": "list", "tables": ["PO', '_NORM"'])
+    assert results == [None, None]
+    assert extract_json_from_llm_response('Sure: {"intent": "list", "tables": ["PO') is None
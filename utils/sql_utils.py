@@ -4,30 +4,438 @@ from datetime import datetime
 from typing import Optional, List, Tuple, Dict, Any
 
 
+class JSONObjectScanner:
+    """
+    Find the first complete top-level JSON object in text that may arrive
+    in pieces, e.g. an LLM response as it streams in.
+
+    Braces are counted outside string literals only, so nested objects and
+    braces inside strings are handled. A balanced span that isn't valid JSON
+    (say, braces in prose before the answer) is skipped and the search goes
+    on after its opening brace.
+    """
+
+    _SIGNIFICANT = re.compile(r'[{}"\\]')
+
+    def __init__(self):
+        self.text = ""
+        self.value = None
+        self.end = None
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        Add the next piece of text.
+
+        Args:
+            chunk (str): Text received since the last call.
+
+        Returns:
+            dict or None: The object, once it is complete; text fed after it is ignored.
+        """
+        if self.value is not None:
+            return self.value
+        self.text += chunk
+        while True:
+            end = self._scan()
+            if end is None:
+                return None
+            try:
+                value = json.loads(self.text[self._start:end])
+            except json.JSONDecodeError:
+                value = None
+            if isinstance(value, dict):
+                self.value = value
+                self.end = end
+                return value
+            self._pos = self._start + 1
+            self._start = None
+
+    def _scan(self):
+        """Advance through the buffered text; returns the end of a balanced object or None."""
+        text = self.text
+        pos = self._pos
+        if self._start is None:
+            start = text.find("{", pos)
+            if start < 0:
+                self._pos = len(text)
+                return None
+            self._start = pos = start
+            self._depth = 0
+            self._in_string = False
+        while True:
+            match = self._SIGNIFICANT.search(text, pos)
+            if match is None:
+                self._pos = len(text)
+                return None
+            char = match.group()
+            pos = match.end()
+            if self._in_string:
+                if char == "\\":
+                    if pos >= len(text):
+                        # The escaped character hasn't arrived yet
+                        self._pos = match.start()
+                        return None
+                    pos += 1
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos = pos
+                    return pos
+
+
 def extract_json_from_llm_response(response: Any) -> Optional[Dict[str, Any]]:
     """
     Extract JSON from an LLM response, which might contain text before or after the JSON.
 
     Args:
-        response (str or dict): The LLM response that may contain or be JSON.
+        response (str or dict): The LLM response that may contain or be JSON,
+            or an LLMChain result whose "text" holds it.
 
     Returns:
         dict or None: The extracted JSON data, or None if extraction failed.
     """
     if isinstance(response, dict):
-        return response  # Already parsed
-    
+        if not isinstance(response.get("text"), str):
+            return response  # Already parsed
+        response = response["text"]
+    if not isinstance(response, str):
+        return None
+
     try:
-        return json.loads(response)
+        data = json.loads(response)
+        if isinstance(data, dict):
+            return data
     except json.JSONDecodeError:
-        # Try to find a JSON object in the string
-        json_match = re.search(r'({.*?})', response, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                return None
-        return None
+        pass
+    # Find the first JSON object in the string (prose, code fences, ...)
+    return JSONObjectScanner().feed(response)
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+}
+
+
+def validate_json(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Check parsed JSON against a schema written in a small subset of JSON
+    Schema: "type", "properties", "required", "items",
+    "additionalProperties" (a schema) and "enum".
+
+    Args:
+        data: The parsed JSON.
+        schema (dict): The schema.
+        path (str): Location of data, for the messages.
+
+    Returns:
+        list: Error messages; empty when data is valid.
+    """
+    expected = schema.get("type")
+    if expected is not None:
+        is_bool = isinstance(data, bool)
+        if not isinstance(data, _JSON_TYPES[expected]) or (is_bool and expected != "boolean"):
+            return [f"{path}: expected {expected}, got {type(data).__name__}"]
+    if "enum" in schema and data not in schema["enum"]:
+        return [f"{path}: {data!r} is not one of {schema['enum']}"]
+
+    errors = []
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}: missing {key}")
+        properties = schema.get("properties", {})
+        for key, value in data.items():
+            value_schema = properties.get(key, schema.get("additionalProperties"))
+            if value_schema is not None:
+                errors.extend(validate_json(value, value_schema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for index, item in enumerate(data):
+            errors.extend(validate_json(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+# Leading whitespace, then one alternative per token kind; anything else is
+# a one-character operator. Whitespace rides along with the next token,
+# which halves the number of matches. The token's kind is told from its first
+# character (_sql_token_kind) rather than by named groups: findall() without
+# match objects is most of the lexing time saved.
+_SQL_TOKEN = re.compile(
+    r"(\s*)("
+    r"--[^\n]*|/\*.*?(?:\*/|\Z)"                         # comment
+    r"|'[^']*(?:''[^']*)*(?:'|\Z)"                       # string
+    r"|\"[^\"]*(?:\"|\Z)"                                # quoted (identifier)
+    r"|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?"          # number
+    r"|[A-Za-z_][\w$#]*"                                 # word
+    r"|:[\w$#]+"                                         # bind
+    r"|<>|!=|<=|>=|\|\||\S)",                              # op
+    re.DOTALL
+)
+_SQL_FIRST_CHAR_KINDS = dict.fromkeys("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_", "word")
+_SQL_FIRST_CHAR_KINDS.update(dict.fromkeys("0123456789", "number"), **{"'": "string", '"': "quoted"})
+
+
+def _sql_token_kind(text):
+    """Kind of a _SQL_TOKEN token that _SQL_FIRST_CHAR_KINDS doesn't settle."""
+    if text.startswith("--") or text.startswith("/*"):
+        return "comment"
+    if len(text) > 1 and text[0] == ":":
+        return "bind"
+    if len(text) > 1 and text[0] == ".":
+        return "number"
+    return "op"
+
+
+# Words that are never table or column names
+_SQL_KEYWORDS = frozenset("""
+    ALL AND ANY AS ASC BETWEEN BY CASE CAST CONNECT CROSS CURRENT_DATE CURRENT_TIMESTAMP DATE DAY
+    DELETE DESC DISTINCT ELSE END ESCAPE EXCEPT EXISTS FALSE FETCH FIRST FOLLOWING FROM FULL GROUP
+    HAVING HOUR IN INNER INSERT INTERSECT INTERVAL INTO IS JOIN LAST LEFT LEVEL LIKE LIMIT MERGE
+    MINUS MINUTE MONTH NATURAL NEXT NOCYCLE NOT NULL NULLS OF OFFSET ON ONLY OR ORDER OUTER OVER
+    PARTITION PERCENT PRECEDING PRIOR RANGE RIGHT ROW ROWNUM ROWS SECOND SELECT SET SIBLINGS SOME
+    START SYSDATE SYSTIMESTAMP THEN TIES TIMESTAMP TO TRUE UNBOUNDED UNION UPDATE USING VALUES
+    WHEN WHERE WITH WITHIN YEAR
+""".split())
+# Words that start a new line when formatting, at the query level
+_SQL_CLAUSES = frozenset(
+    "SELECT FROM WHERE HAVING CONNECT START LIMIT OFFSET FETCH UNION INTERSECT MINUS EXCEPT".split()
+)
+_SQL_JOIN_MODIFIERS = frozenset("INNER LEFT RIGHT FULL CROSS NATURAL OUTER".split())
+_SQL_BREAK_WORDS = _SQL_CLAUSES | _SQL_JOIN_MODIFIERS | frozenset(("GROUP", "ORDER", "JOIN"))
+# Words followed by a table name, and words that end a FROM list
+_SQL_TABLE_INTRODUCERS = frozenset(("FROM", "JOIN", "INTO", "UPDATE"))
+_SQL_FROM_ENDS = (_SQL_CLAUSES - {"FROM"}) | frozenset("JOIN ON USING GROUP ORDER".split())
+# Layout around these is not significant in a fingerprint
+_SQL_TIGHT = frozenset("(),=<>+*/-")
+# Token kinds after which a bare name is an alias ("FROM t a", "SUM(x) total")
+_SQL_OPERAND_ENDS = frozenset(("name", "quoted", "string", "number", "bind"))
+
+
+class SQLAnalysis:
+    """What analyze_sql() learns about a query."""
+
+    def __init__(self, formatted, fingerprint, literals, tables, columns, identifiers):
+        self.formatted = formatted
+        self.fingerprint = fingerprint
+        self.literals = literals
+        self.tables = tables
+        self.columns = columns
+        self.identifiers = identifiers
+
+
+def tokenize_sql(query: str) -> List[Tuple[str, str, bool]]:
+    """
+    Split SQL into (kind, text, whitespace before) tokens. Kinds: comment,
+    string, quoted (identifier), number, word, bind and op.
+
+    Args:
+        query (str): The SQL query.
+
+    Returns:
+        list: (kind, text, spaced) tuples
+    """
+    first_kind = _SQL_FIRST_CHAR_KINDS.get
+    return [
+        (first_kind(text[0]) or _sql_token_kind(text), text, bool(space))
+        for space, text in _SQL_TOKEN.findall(query)
+    ]
+
+
+def analyze_sql(query: str) -> SQLAnalysis:
+    """
+    Format, fingerprint and extract names from a SQL query in one pass
+    over its tokens, so callers that need several of these (e.g. the
+    result cache: a fingerprint and the tables read) lex it once.
+
+    - formatted: whitespace collapsed, a new line before each clause
+      (SELECT, FROM, WHERE, JOINs, GROUP BY, ORDER BY, UNION, FETCH, ...),
+      indented by subquery depth. Keywords in string literals, quoted
+      identifiers and comments are left alone; comments are kept.
+    - fingerprint / literals: see normalize_sql().
+    - tables: names in FROM / JOIN / INTO / UPDATE positions, upper-cased
+      and as written (schema-qualified when qualified), CTE names excluded.
+    - columns: other names that aren't keywords, functions or aliases,
+      upper-cased, without their table qualifier. Names aren't resolved
+      against the schema, so a select-list alias used in ORDER BY may show up.
+    - identifiers: every upper-cased word and quoted identifier.
+
+    Args:
+        query (str): The SQL query.
+
+    Returns:
+        SQLAnalysis: The results
+    """
+    if not isinstance(query, str):
+        raise TypeError(f"Expected a string, got {type(query).__name__} instead.")
+
+    # Tokens other than comments as (kind, text, upper, whitespace before, comments before);
+    # tokenize_sql() inlined, as this is most of the lexing time
+    tokens = []
+    comments = ()
+    first_kind = _SQL_FIRST_CHAR_KINDS.get
+    for space, text in _SQL_TOKEN.findall(query):
+        kind = first_kind(text[0]) or _sql_token_kind(text)
+        if kind == "comment":
+            comments += (text,)
+            continue
+        upper = text.upper() if kind == "word" or kind == "bind" else text
+        tokens.append((kind, text, upper, bool(comments or space), comments))
+        comments = ()
+
+    formatted = []
+    fingerprint = []
+    literals = []
+    tables = []
+    columns = []
+    aliases = set()
+    ctes = set()
+    identifiers = set()
+    write = formatted.append
+    add = fingerprint.append
+
+    depth = 0
+    query_levels = []       # per open paren: does a subquery start there?
+    from_depths = set()     # depths with an open FROM list
+    expect_table = False
+    with_depth = None       # depth of a WITH list still naming CTEs
+    line_comment = False    # the last thing written was a -- comment
+    last_tight = True       # the fingerprint so far ends in _SQL_TIGHT (or is empty)
+    name = None             # parts of the dotted name being read
+    role = None             # ... and what it names
+    prev_kind = prev_text = prev_upper = None
+    count = len(tokens)
+
+    for i, (kind, text, upper, gap, lead) in enumerate(tokens):
+        for comment in lead:
+            write("\n" + "  " * (depth + 1) if line_comment else " " if formatted else "")
+            write(comment)
+            line_comment = comment.startswith("--")
+
+        newline = False
+        if kind == "op":
+            piece = text
+            if text == "(":
+                query_levels.append(i + 1 < count and tokens[i + 1][2] in ("SELECT", "WITH"))
+                depth += 1
+                expect_table = False
+                name = None
+            elif text == ")":
+                if depth:
+                    from_depths.discard(depth)
+                    query_levels.pop()
+                    depth -= 1
+                name = None
+            elif text == ",":
+                if depth in from_depths:
+                    expect_table = True
+                name = None
+            elif text != ".":
+                name = None
+        elif kind == "string" or kind == "number":
+            literals.append(text)
+            piece = "?"
+            name = None
+        elif kind == "bind":
+            piece = upper
+            name = None
+        else:
+            # A word or a quoted identifier
+            piece = upper
+            part = text.strip('"') if kind == "quoted" else upper
+            identifiers.add(part)
+            next_upper = tokens[i + 1][2] if i + 1 < count else None
+            if name is not None and prev_text == ".":
+                name.append(part)
+            elif kind == "word" and upper in _SQL_KEYWORDS:
+                name = None
+                query_level = depth == 0 or query_levels[-1]
+                if upper in _SQL_BREAK_WORDS and query_level and formatted and prev_text != "(":
+                    if upper in _SQL_CLAUSES:
+                        newline = True
+                    elif upper == "GROUP" or upper == "ORDER":
+                        newline = next_upper == "BY"
+                    elif upper == "JOIN":
+                        newline = prev_upper not in _SQL_JOIN_MODIFIERS
+                    elif upper != "OUTER" and prev_upper not in _SQL_JOIN_MODIFIERS:
+                        newline = next_upper == "JOIN" or next_upper in _SQL_JOIN_MODIFIERS
+                if upper in _SQL_TABLE_INTRODUCERS and query_level:
+                    expect_table = True
+                    if upper == "FROM":
+                        from_depths.add(depth)
+                elif upper == "WITH" and query_level:
+                    with_depth = depth
+                elif upper == "SELECT" and depth == with_depth:
+                    with_depth = None
+                if upper in _SQL_FROM_ENDS:
+                    from_depths.discard(depth)
+            else:
+                name = [part]
+                if expect_table:
+                    role = "table"
+                    expect_table = False
+                elif depth == with_depth and (prev_upper == "WITH" or prev_text == ","):
+                    role = "cte"
+                elif prev_upper == "AS" or prev_upper == "END" or prev_kind in _SQL_OPERAND_ENDS \
+                        or prev_text == ")":
+                    role = "alias"
+                else:
+                    role = "column"
+            if name is not None:
+                if next_upper != ".":
+                    if role == "table":
+                        tables.append(".".join(name))
+                    elif role == "column":
+                        if next_upper != "(":
+                            columns.append(part.upper())
+                    elif role == "alias":
+                        aliases.add(part.upper())
+                    else:
+                        ctes.add(part.upper())
+                kind = "name"
+
+        if newline or line_comment:
+            write("\n" + "  " * (depth + 1))
+            line_comment = False
+        elif gap and formatted:
+            write(" ")
+        write(text)
+
+        if gap and not last_tight and piece[0] not in _SQL_TIGHT:
+            add(" ")
+        add(piece)
+        last_tight = piece[-1] in _SQL_TIGHT
+
+        prev_kind, prev_text, prev_upper = kind, text, upper
+
+    for comment in comments:
+        write("\n" if line_comment else " " if formatted else "")
+        write(comment)
+        line_comment = comment.startswith("--")
+    while fingerprint and fingerprint[-1] in (";", " "):
+        fingerprint.pop()
+
+    return SQLAnalysis(
+        formatted="".join(formatted),
+        fingerprint="".join(fingerprint),
+        literals=literals,
+        tables=[table for table in dict.fromkeys(tables) if table not in ctes],
+        columns=[column for column in dict.fromkeys(columns) if column not in aliases],
+        identifiers=identifiers,
+    )
 
 
 def format_sql_query(query: str) -> str:
@@ -40,20 +448,47 @@ def format_sql_query(query: str) -> str:
     Returns:
         str: The formatted SQL query.
     """
-    if not isinstance(query, str):
-        raise TypeError(f"Expected a string, got {type(query).__name__} instead.")
+    return analyze_sql(query).formatted
+
+
+def normalize_sql(query: str) -> Tuple[str, List[str]]:
+    """
+    Normalize a SQL query into a fingerprint that ignores formatting.
+
+    Comments are dropped, whitespace is collapsed, unquoted text is
+    upper-cased and string/number literals are replaced with '?'. The
+    literals are returned separately, in order, so a cache key can include
+    them: two queries that differ only in layout or keyword case (e.g. raw
+    LLM output vs. format_sql_query output) share a fingerprint, while
+    different literal values still give different keys.
+
+    Args:
+        query (str): The SQL query to normalize.
+
+    Returns:
+        tuple: (fingerprint, literals)
+    """
+    analysis = analyze_sql(query)
+    return analysis.fingerprint, analysis.literals
+
+
+def extract_table_names(query: Any, available_tables: List[str]) -> List[str]:
+    """
+    Find which of the available tables a SQL query references.
+
+    Any mention outside string literals and comments counts, not just
+    FROM / JOIN positions, so a table is never missed.
+
+    Args:
+        query (str or SQLAnalysis): The SQL query, or its analyze_sql() result.
+        available_tables (list): Known table names.
+
+    Returns:
+        list: Referenced table names, in available_tables order.
+    """
+    analysis = query if isinstance(query, SQLAnalysis) else analyze_sql(query)
+    return [table for table in available_tables if table.upper() in analysis.identifiers]
 
-    query = re.sub(r' +', ' ', query)  # Normalize spaces
-    keywords = ['SELECT', 'FROM', 'WHERE', 'GROUP BY', 'HAVING', 'ORDER BY', 'LIMIT']
-    
-    for keyword in keywords:
-        pattern = rf'\b({keyword})\b'
-        query = re.sub(pattern, r'\n\1', query, flags=re.IGNORECASE)
-    
-    # Add indentation for each line (except the first)
-    lines = query.strip().split('\n')
-    formatted_lines = [lines[0]] + ['  ' + line for line in lines[1:]]
-    return '\n'.join(formatted_lines)
 
 def validate_table_names(tables: List[str], available_tables: List[str]) -> Tuple[List[str], List[str]]:
     """
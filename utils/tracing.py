@@ -0,0 +1,70 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans recorded during one request, with offsets relative to its start."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end, attributes):
+        span = {
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self):
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span["start_ms"])
+
+
+@contextmanager
+def request_trace(enabled=True):
+    """
+    Collect spans for the duration of the with-block: in the current asyncio
+    task, tasks it creates, and worker threads run with a copied context.
+
+    Yields:
+        Trace or None: The trace, or None when not enabled
+    """
+    trace = Trace() if enabled else None
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record the with-block as a span of the current trace, if any.
+
+    Yields the attributes dict so the body can add to it.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, start, time.perf_counter(), attributes)